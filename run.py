@@ -2,16 +2,167 @@
 # -*- coding: utf-8 -*-
 """
 运行脚本 - 每日股票扫描
+
+    python3 run.py                    # 执行扫描（同 run.py scan）
+    python3 run.py list               # 列出策略及其数据需求（读缓存，不导入 pandas）
+    python3 run.py results --date 2026-02-27 --strategy rsi_oversold
+    python3 run.py daemon start       # 常驻进程：面板常驻内存，按 SCAN_SCHEDULE 定时扫描
+    python3 run.py daemon scan        # 让常驻进程立即扫描（另有 status / refresh / update / reload / stop）
+    python3 run.py scan --report logs/run-%Y%m%d.json --profile logs/scan.prof
+    python3 run.py --timing list      # 结束时打印启动 / 总耗时和已加载的重依赖
+
+pandas / numpy / requests 只在需要的命令里加载（见 src/lazy.py）
 """
 
+import time
+
+STARTED = time.perf_counter()
+
 import sys
 import os
+import json
+import argparse
 
 # 添加项目路径
 project_root = os.path.dirname(os.path.abspath(__file__))
 sys.path.insert(0, project_root)
 
-from src.scanner import main
+def apply_run_options(args):
+    """--report / --profile 写入扫描配置（见 src/metrics.py）"""
+    from src.scanner import CONFIG
+    
+    if getattr(args, 'report', None):
+        CONFIG['run_report'] = args.report
+    if getattr(args, 'profile', None):
+        CONFIG['profile'] = args.profile
+
+def cmd_scan(args):
+    """执行扫描"""
+    from src.scanner import main
+    
+    apply_run_options(args)
+    main()
+
+def cmd_list(args):
+    """列出策略"""
+    from src.plugins import PluginRegistry
+    
+    metadata = PluginRegistry().metadata()
+    
+    if not metadata:
+        print("❌ 没有可用的策略")
+        return
+    
+    for name, meta in metadata.items():
+        if 'error' in meta:
+            print(f"❌ {name}: {meta['error']}")
+            continue
+        
+        print(f"📈 {name} v{meta['version']} - {meta['description']}")
+        
+        if args.verbose:
+            columns = ', '.join(meta['history_columns']) if meta['history_columns'] is not None else '全部'
+            filters = ', '.join(f'{f} {op} {v}' for f, op, v in meta['quote_filter']) or '无'
+            print(f"     K 线：{meta['lookback'] or '默认'}  列：{columns}")
+            print(f"     行情条件：{filters}  递推状态：{'是' if meta['stateful'] else '否'}")
+
+def cmd_results(args):
+    """查询扫描结果"""
+    import sqlite3
+    from src.database import fetch_scan_results
+    
+    try:
+        rows = fetch_scan_results(args.date, args.strategy, codes=args.code, limit=args.limit)
+    except sqlite3.OperationalError as e:
+        print(f"❌ 查询失败：{e}")
+        return
+    
+    if not rows:
+        print("⚪ 没有扫描结果")
+        return
+    
+    print(f"  {'日期':<10} {'策略':<18} {'代码':<8} {'名称':<10} {'价格':>8} {'涨幅':>8}   信号说明")
+    
+    for r in rows:
+        signal = json.loads(r['signal_info']) if r['signal_info'] else {}
+        desc = signal.get('description', '')[:35]
+        print(f"  {r['scan_date']:<10} {r['strategy_name']:<18} {r['stock_code']:<8} {r['stock_name'] or '':<10} "
+              f"{r['price'] or 0:>8.2f} {r['change_percent'] or 0:>+7.2f}%   {desc}")
+
+def cmd_daemon(args):
+    """启动常驻进程或向其发送命令"""
+    from src.daemon import ScanDaemon, send_command
+    
+    if args.action == 'start':
+        apply_run_options(args)
+        try:
+            ScanDaemon().start()
+        except ValueError as e:
+            print(f"❌ 配置错误：{e}")
+        return
+    
+    params = {'save': not args.no_save} if args.action == 'scan' else {}
+    
+    try:
+        reply = send_command(args.action, **params)
+    except (ConnectionError, ValueError) as e:
+        print(f"❌ {e}")
+        return
+    
+    if not reply.pop('ok', False):
+        print(f"❌ 命令失败：{reply.get('error')}")
+        return
+    
+    print(json.dumps(reply, ensure_ascii=False, indent=2))
+
+def add_run_options(parser: argparse.ArgumentParser):
+    parser.add_argument('--report', metavar='PATH',
+                        help='每次运行写 JSON 运行报告（可含 strftime 占位符，如 logs/run-%%Y%%m%%d-%%H%%M%%S.json）')
+    parser.add_argument('--profile', metavar='PATH', help='用 cProfile 采集每次运行，写入 PATH（同上）')
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description='A 股策略扫描系统')
+    parser.add_argument('--timing', action='store_true', help='打印启动耗时和已加载的重依赖')
+    parser.set_defaults(func=cmd_scan)
+    
+    commands = parser.add_subparsers(title='命令')
+    
+    scan = commands.add_parser('scan', help='执行扫描（默认）')
+    add_run_options(scan)
+    scan.set_defaults(func=cmd_scan)
+    
+    strategies = commands.add_parser('list', help='列出策略')
+    strategies.add_argument('-v', '--verbose', action='store_true', help='显示 K 线数、列、行情条件')
+    strategies.set_defaults(func=cmd_list)
+    
+    results = commands.add_parser('results', help='查询扫描结果')
+    results.add_argument('--date', help='扫描日期 YYYY-MM-DD')
+    results.add_argument('--strategy', help='策略名')
+    results.add_argument('--code', action='append', help='股票代码，可重复')
+    results.add_argument('--limit', type=int, default=20, help='最多显示行数（默认 20）')
+    results.set_defaults(func=cmd_results)
+    
+    daemon = commands.add_parser('daemon', help='常驻扫描进程')
+    daemon.add_argument('action', choices=['start', 'scan', 'status', 'refresh', 'update', 'reload', 'stop'],
+                        help='start 前台启动，其他为发给运行中进程的命令')
+    daemon.add_argument('--no-save', action='store_true', help='scan 只打印结果，不保存、不推送')
+    add_run_options(daemon)
+    daemon.set_defaults(func=cmd_daemon)
+    
+    return parser
+
+def main():
+    args = build_parser().parse_args()
+    ready = time.perf_counter()
+    
+    args.func(args)
+    
+    if args.timing:
+        from src.lazy import loaded_modules
+        
+        loaded = ', '.join(loaded_modules()) or '无'
+        print(f"⏱️  启动 {(ready - STARTED) * 1000:.1f}ms，总计 {(time.perf_counter() - STARTED) * 1000:.1f}ms"
+              f"（不含解释器启动），已加载：{loaded}")
 
 if __name__ == '__main__':
     main()
@@ -13,8 +13,15 @@ import sys
 
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
 
-from src.database import get_history, get_stock_list
-from src.strategy_base import BaseStrategy
+from src.database import get_history_panel, get_stock_list, HISTORY_VALUE_COLUMNS
+from src.strategy_base import BaseStrategy, history_requirements, check_history
+from src.panel import HistoryPanel
+from src.indicators import INDICATOR_COLUMNS
+from src import columnar_store
+from src.metrics import METRICS
+
+# 回测加载的历史 K 线数（约 1 年）
+BACKTEST_DAYS = 365
 
 class BacktestResult:
     """回测结果"""
@@ -104,9 +111,35 @@ class BacktestResult:
         print("\n" + "="*70 + "\n")
 
 
+def load_backtest_panel(stock_list: List[Dict], days: int = BACKTEST_DAYS,
+                        use_columnar_store: bool = False,
+                        indicators: bool = True,
+                        strategies: Optional[List[BaseStrategy]] = None) -> HistoryPanel:
+    """
+    一次加载回测所需的全部历史行情（可选从列式存储零拷贝读取）
+    
+    从 SQLite 读取时默认带上预计算指标列，逐日回测不必每天重算；
+    给定 strategies 时只加载这些策略声明的列（见 BaseStrategy.history_columns）
+    """
+    codes = [s['code'] for s in stock_list]
+    
+    if strategies is not None:
+        _, columns = history_requirements(strategies, days, indicators)
+    else:
+        columns = HISTORY_VALUE_COLUMNS + (INDICATOR_COLUMNS if indicators else [])
+    
+    if use_columnar_store:
+        panel = columnar_store.load_panel(codes, days, fields=[c for c in columns if c in HISTORY_VALUE_COLUMNS])
+        if panel is not None:
+            return panel
+    
+    return HistoryPanel.from_frame(get_history_panel(codes, days, columns), days, columns)
+
 def backtest_strategy(strategy: BaseStrategy, stock_list: List[Dict], 
                       start_date: str = None, end_date: str = None,
-                      hold_days: int = 5) -> BacktestResult:
+                      hold_days: int = 5,
+                      panel: Optional[HistoryPanel] = None,
+                      use_columnar_store: bool = False) -> BacktestResult:
     """
     回测单个策略
     
@@ -116,6 +149,8 @@ def backtest_strategy(strategy: BaseStrategy, stock_list: List[Dict],
         start_date: 开始日期 (YYYY-MM-DD)
         end_date: 结束日期 (YYYY-MM-DD)
         hold_days: 持有天数
+        panel: 预先加载的历史行情面板（多策略回测时共享），默认按 stock_list 加载
+        use_columnar_store: 未传入 panel 时是否从列式存储加载
     
     Returns:
         回测结果
@@ -134,6 +169,12 @@ def backtest_strategy(strategy: BaseStrategy, stock_list: List[Dict],
     
     total = len(stock_list)
     
+    if panel is None:
+        panel = load_backtest_panel(stock_list, use_columnar_store=use_columnar_store,
+                                    strategies=[strategy])
+    
+    check_history({strategy.name: strategy}, panel)
+    
     for idx, stock in enumerate(stock_list):
         code = stock['code']
         
@@ -141,7 +182,7 @@ def backtest_strategy(strategy: BaseStrategy, stock_list: List[Dict],
             print(f"  进度：{idx+1}/{total} ({(idx+1)/total*100:.1f}%)")
         
         # 获取历史数据
-        history = get_history(code, days=365)  # 获取 1 年数据
+        history = panel.history(code)  # 最近 1 年数据
         
         if history is None or history.empty:
             continue
@@ -209,6 +250,8 @@ def backtest_strategy(strategy: BaseStrategy, stock_list: List[Dict],
                                     return_pct)
             
             except Exception as e:
+                # 单日失败不影响其他日期，计入运行报告的策略异常数
+                METRICS.error('strategy', strategy.name, e)
                 continue
     
     # 计算统计
@@ -220,7 +263,8 @@ def backtest_strategy(strategy: BaseStrategy, stock_list: List[Dict],
 def backtest_all_strategies(strategies: Dict[str, BaseStrategy], 
                             start_date: str = None,
                             end_date: str = None,
-                            hold_days: int = 5):
+                            hold_days: int = 5,
+                            use_columnar_store: bool = False):
     """回测所有策略"""
     
     print("\n" + "="*70)
@@ -231,12 +275,16 @@ def backtest_all_strategies(strategies: Dict[str, BaseStrategy],
     stock_list = get_stock_list()
     print(f"📋 获取到 {len(stock_list)} 只股票\n")
     
+    # 所有策略共享一次加载的历史行情
+    panel = load_backtest_panel(stock_list, use_columnar_store=use_columnar_store,
+                                strategies=list(strategies.values()))
+    
     all_results = {}
     total = len(strategies)
     
     for idx, (name, strategy) in enumerate(strategies.items(), 1):
         print(f"\n[{idx}/{total}] 回测策略：{name}")
-        result = backtest_strategy(strategy, stock_list, start_date, end_date, hold_days)
+        result = backtest_strategy(strategy, stock_list, start_date, end_date, hold_days, panel)
         all_results[name] = result
         result.print_report()
     
@@ -257,33 +305,14 @@ def backtest_all_strategies(strategies: Dict[str, BaseStrategy],
 
 
 if __name__ == '__main__':
-    # 测试回测
-    import importlib
-    
-    strategies_dir = os.path.join(os.path.dirname(__file__), '..', 'strategies')
-    strategies = {}
+    # 测试回测：加载全部策略
+    from src.plugins import PluginRegistry
     
-    # 加载策略
-    for filename in os.listdir(strategies_dir):
-        if filename.endswith('.py') and not filename.startswith('_'):
-            strategy_name = filename[:-3]
-            try:
-                spec = importlib.util.spec_from_file_location(
-                    strategy_name,
-                    os.path.join(strategies_dir, filename)
-                )
-                module = importlib.util.module_from_spec(spec)
-                sys.modules[strategy_name] = module
-                spec.loader.exec_module(module)
-                
-                if hasattr(module, 'strategy'):
-                    strategies[strategy_name] = module.strategy
-                    print(f"✅ 加载策略：{strategy_name}")
-            except Exception as e:
-                print(f"❌ 加载失败 {strategy_name}: {e}")
+    strategies = PluginRegistry().load()
     
     # 回测最近 90 天
     end_date = datetime.now().strftime('%Y-%m-%d')
     start_date = (datetime.now() - timedelta(days=90)).strftime('%Y-%m-%d')
     
-    backtest_all_strategies(strategies, start_date, end_date, hold_days=5)
+    backtest_all_strategies(strategies, start_date, end_date, hold_days=5,
+                            use_columnar_store=columnar_store.ColumnarStore.exists())
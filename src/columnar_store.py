@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+列式行情存储 - SQLite 之外的内存映射 OHLCV 数组
+
+每个字段一个原始 float64 文件，按日期 × 股票（交易日历 × stocks 表代码顺序）排列，
+追加新交易日只需在文件末尾写入新行；读取用 np.memmap 零拷贝，
+多个进程通过页缓存共享同一份数据
+
+目录结构（STORE_DIR）：
+    meta.json        codes / dates / fields
+    close.f64 ...    (n_dates, n_codes) 行主序
+"""
+
+import json
+import os
+import sys
+import numpy as np
+import pandas as pd
+from typing import List, Dict, Optional
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from src.database import get_stock_list, read_history
+from src.panel import HistoryPanel, PANEL_FIELDS
+
+STORE_DIR = os.path.join(os.path.dirname(__file__), '..', 'data', 'columnar')
+STORE_DTYPE = np.float64
+
+# 增量同步时重写的最近交易日数（补齐当天部分股票后到的数据）
+OVERLAP_DAYS = 5
+
+class ColumnarStore:
+    """只读打开的列式存储"""
+    
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or STORE_DIR
+        
+        with open(os.path.join(self.path, 'meta.json'), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        
+        self.codes = meta['codes']
+        self.dates = np.array(meta['dates'], dtype='datetime64[D]')
+        self.fields = meta['fields']
+        self._index = {code: i for i, code in enumerate(self.codes)}
+        self._arrays = {}
+    
+    @staticmethod
+    def exists(path: Optional[str] = None) -> bool:
+        return os.path.exists(os.path.join(path or STORE_DIR, 'meta.json'))
+    
+    @property
+    def shape(self):
+        return (len(self.dates), len(self.codes))
+    
+    def field(self, name: str) -> np.ndarray:
+        """字段的 (n_dates, n_codes) 只读内存映射"""
+        if name not in self._arrays:
+            if not len(self.dates) or not len(self.codes):
+                self._arrays[name] = np.empty(self.shape, dtype=STORE_DTYPE)
+            else:
+                self._arrays[name] = np.memmap(
+                    _field_path(self.path, name), dtype=STORE_DTYPE, mode='r', shape=self.shape
+                )
+        return self._arrays[name]
+    
+    def window(self, days: int, fields: Optional[List[str]] = None) -> Dict[str, np.ndarray]:
+        """最近 days 个交易日的日历对齐视图（零拷贝，停牌日为 NaN）"""
+        return {name: self.field(name)[-days:] for name in (fields or self.fields)}
+    
+    def to_panel(self, codes: Optional[List[str]] = None, days: int = 60,
+                 fields: Optional[List[str]] = None) -> HistoryPanel:
+        """
+        转为每只股票最近 days 根 K 线的 HistoryPanel（跳过停牌日，与 SQLite 读取结果一致）
+        """
+        fields = fields or self.fields
+        codes = [c for c in (codes if codes is not None else self.codes) if c in self._index]
+        columns = np.array([self._index[c] for c in codes], dtype=np.int64)
+        
+        n_codes = len(codes)
+        values = np.full((n_codes, days, len(fields)), np.nan)
+        dates = np.full((n_codes, days), np.datetime64('NaT'), dtype='datetime64[D]')
+        lengths = np.zeros(n_codes, dtype=np.int64)
+        
+        if n_codes == 0 or len(self.dates) == 0:
+            return HistoryPanel(codes, dates, values, fields, lengths)
+        
+        # 先取略大于 days 的日历窗口，停牌较多、K 线不足的股票再回溯全部历史
+        window = min(len(self.dates), days + days // 2 + 10)
+        self._compact(window, columns, np.arange(n_codes), days, fields, values, dates, lengths)
+        
+        short = np.nonzero(lengths < days)[0]
+        if len(short) and window < len(self.dates):
+            self._compact(len(self.dates), columns[short], short, days, fields, values, dates, lengths)
+        
+        return HistoryPanel(codes, dates, values, fields, lengths)
+    
+    def _compact(self, window: int, columns: np.ndarray, rows: np.ndarray, days: int,
+                 fields: List[str], values: np.ndarray, dates: np.ndarray, lengths: np.ndarray):
+        """把日历窗口内每只股票的有效 K 线右对齐写入面板数组"""
+        close = self.field('close')[-window:, columns]
+        valid = ~np.isnan(close)
+        
+        # 从窗口末尾往前数，第几根有效 K 线
+        rank = np.cumsum(valid[::-1], axis=0)[::-1]
+        t_idx, j_idx = np.nonzero(valid & (rank <= days))
+        target = days - rank[t_idx, j_idx]
+        
+        out_rows = rows[j_idx]
+        for k, name in enumerate(fields):
+            block = self.field(name)[-window:, columns]
+            values[out_rows, target, k] = block[t_idx, j_idx]
+        
+        dates[out_rows, target] = self.dates[-window:][t_idx]
+        lengths[rows] = np.minimum(valid.sum(axis=0), days)
+
+def _field_path(path: str, name: str) -> str:
+    return os.path.join(path, f"{name}.f64")
+
+def _write_meta(path: str, codes: List[str], dates: List[str], fields: List[str]):
+    tmp_path = os.path.join(path, 'meta.json.tmp')
+    
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({'codes': codes, 'dates': dates, 'fields': fields}, f)
+    
+    os.replace(tmp_path, os.path.join(path, 'meta.json'))
+
+def _to_grid(df: pd.DataFrame, codes: List[str], dates: List[str], field: str) -> np.ndarray:
+    """长表转为 (n_dates, n_codes) 数组，缺失为 NaN"""
+    grid = np.full((len(dates), len(codes)), np.nan, dtype=STORE_DTYPE)
+    
+    col = pd.Index(codes).get_indexer(df['code'])
+    row = pd.Index(dates).get_indexer(df['date'])
+    keep = (col >= 0) & (row >= 0)
+    
+    grid[row[keep], col[keep]] = df[field].to_numpy(dtype=STORE_DTYPE)[keep]
+    return grid
+
+def rebuild_columnar_store(path: Optional[str] = None) -> Dict[str, int]:
+    """从 SQLite 全量重建列式存储"""
+    path = path or STORE_DIR
+    os.makedirs(path, exist_ok=True)
+    
+    codes = [s['code'] for s in get_stock_list()]
+    df = read_history(columns=PANEL_FIELDS)
+    dates = sorted(df['date'].unique().tolist())
+    
+    for name in PANEL_FIELDS:
+        tmp_path = _field_path(path, name) + '.tmp'
+        _to_grid(df, codes, dates, name).tofile(tmp_path)
+        os.replace(tmp_path, _field_path(path, name))
+    
+    _write_meta(path, codes, dates, PANEL_FIELDS)
+    
+    return {'codes': len(codes), 'dates': len(dates), 'appended': len(dates)}
+
+def sync_columnar_store(path: Optional[str] = None, rebuild: bool = False) -> Dict[str, int]:
+    """
+    同步列式存储与 SQLite
+    
+    股票集合不变时增量同步：重写最近 OVERLAP_DAYS 个交易日，末尾追加新交易日；
+    出现新股票（列变化）或 rebuild=True 时全量重建
+    
+    Returns:
+        {'codes': n, 'dates': n, 'appended': 新增交易日数}
+    """
+    path = path or STORE_DIR
+    
+    if rebuild or not ColumnarStore.exists(path):
+        return rebuild_columnar_store(path)
+    
+    store = ColumnarStore(path)
+    codes = [s['code'] for s in get_stock_list()]
+    
+    if store.fields != PANEL_FIELDS or any(c not in store._index for c in codes):
+        return rebuild_columnar_store(path)
+    
+    codes = store.codes
+    old_dates = [str(d) for d in store.dates]
+    overlap = old_dates[-OVERLAP_DAYS:]
+    
+    df = read_history(since=overlap[0] if overlap else None, columns=PANEL_FIELDS)
+    new_dates = sorted(d for d in df['date'].unique().tolist() if not old_dates or d > old_dates[-1])
+    
+    for name in PANEL_FIELDS:
+        file_path = _field_path(path, name)
+        
+        if overlap:
+            mm = np.memmap(file_path, dtype=STORE_DTYPE, mode='r+', shape=store.shape)
+            mm[-len(overlap):] = _to_grid(df, codes, overlap, name)
+            mm.flush()
+            del mm
+        
+        if new_dates:
+            with open(file_path, 'ab') as f:
+                _to_grid(df, codes, new_dates, name).tofile(f)
+    
+    # 数据先落盘，再原子替换 meta，读者始终看到一致的前缀
+    dates = old_dates + new_dates
+    _write_meta(path, codes, dates, PANEL_FIELDS)
+    
+    return {'codes': len(codes), 'dates': len(dates), 'appended': len(new_dates)}
+
+def load_panel(codes: Optional[List[str]] = None, days: int = 60,
+               path: Optional[str] = None, fields: Optional[List[str]] = None) -> Optional[HistoryPanel]:
+    """从列式存储加载 HistoryPanel（fields 默认全部字段），存储不存在时返回 None"""
+    if not ColumnarStore.exists(path):
+        return None
+    
+    return ColumnarStore(path).to_panel(codes, days, fields)
+
+if __name__ == '__main__':
+    result = sync_columnar_store(rebuild='--rebuild' in sys.argv)
+    print(f"✅ 列式存储同步完成：{result['codes']} 只股票 × {result['dates']} 个交易日"
+          f"（新增 {result['appended']} 天）")
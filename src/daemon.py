@@ -0,0 +1,553 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+常驻扫描进程 - 历史行情面板常驻内存，按 SCAN_SCHEDULE 定时扫描或通过本地 socket 按需扫描
+
+    python3 run.py daemon start       # 前台运行（配合 systemd / supervisor / nohup）
+    python3 run.py daemon scan        # 立即扫描（保存并推送，同 run.py）
+    python3 run.py daemon status      # 面板大小、内存、上次扫描、下次计划
+
+策略、数据库连接和历史行情面板只在启动时加载一次；每次扫描前只重新读取有新 K 线的股票。
+命令协议：每个连接发送一行 JSON {"command": ..., 其他参数}，返回一行 JSON {"ok": ..., ...}
+"""
+
+import gc
+import ipaddress
+import json
+import os
+import signal
+import socket
+import sys
+import time
+from datetime import date, datetime, timedelta
+from typing import Dict, Optional, Any, Set, Tuple
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from src.lazy import lazy_import
+from src.database import init_db, get_stock_list, get_last_dates, close_connection
+from src.metrics import METRICS, instrumented_run
+
+scanner = lazy_import('src.scanner')
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+CONFIG_FILE = os.path.join(PROJECT_ROOT, 'config', 'config.ini')
+
+# 常驻进程配置（config.ini 中的同名大写键覆盖，见 CONFIG_KEYS）
+DAEMON_CONFIG = {
+    'scan_schedule': '30 15 * * 1-5',  # 定时扫描（cron 五段式），空为只按需扫描
+    'update_schedule': '',             # 定时增量更新行情（cron），空为不自动更新
+    'socket': './data/daemon.sock',    # 命令 socket：Unix socket 路径，或 host:port（TCP，仅回环地址）
+    'max_memory_mb': 0,                # 常驻内存上限（MB），超过后释放面板、改为每次扫描临时加载；0 为不限
+}
+
+CONFIG_KEYS = {
+    'SCAN_SCHEDULE': 'scan_schedule',
+    'UPDATE_SCHEDULE': 'update_schedule',
+    'DAEMON_SOCKET': 'socket',
+    'DAEMON_MAX_MEMORY_MB': 'max_memory_mb',
+}
+
+# cron 各段：(名称, 最小值, 最大值)；星期 0 和 7 都是周日
+CRON_FIELDS = [
+    ('minute', 0, 59),
+    ('hour', 0, 23),
+    ('day', 1, 31),
+    ('month', 1, 12),
+    ('weekday', 0, 7),
+]
+
+def read_config(path: str = CONFIG_FILE) -> Dict[str, str]:
+    """读取 KEY=VALUE 格式的 config.ini（# 开头为注释）"""
+    values = {}
+    
+    if not os.path.exists(path):
+        return values
+    
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith('#') or '=' not in line:
+                continue
+            key, _, value = line.partition('=')
+            values[key.strip()] = value.strip()
+    
+    return values
+
+def load_daemon_config(path: str = CONFIG_FILE) -> Dict[str, Any]:
+    """DAEMON_CONFIG 叠加 config.ini 中的设置"""
+    values = read_config(path)
+    config = dict(DAEMON_CONFIG)
+    
+    for key, name in CONFIG_KEYS.items():
+        if key in values:
+            config[name] = values[key]
+    
+    config['max_memory_mb'] = float(config['max_memory_mb'] or 0)
+    return config
+
+class CronSchedule:
+    """
+    五段式 cron 表达式（分 时 日 月 星期），支持 *、a-b、a,b、*/n、a-b/n
+    
+    日和星期都不是 * 时满足其一即可（同 cron）
+    """
+    
+    def __init__(self, expr: str):
+        parts = expr.split()
+        if len(parts) != 5:
+            raise ValueError(f"cron 表达式应为 5 段：{expr}")
+        
+        self.expr = expr
+        self.minute, self.hour, self.day, self.month, self.weekday = (
+            self._parse(text, *field) for text, field in zip(parts, CRON_FIELDS)
+        )
+        self.weekday = {v % 7 for v in self.weekday}
+        self.any_day = parts[2] == '*'
+        self.any_weekday = parts[4] == '*'
+    
+    @staticmethod
+    def _parse(text: str, name: str, low: int, high: int) -> Set[int]:
+        values = set()
+        
+        for item in text.split(','):
+            span, _, step = item.partition('/')
+            
+            try:
+                step = int(step) if step else 1
+                if span == '*':
+                    start, end = low, high
+                elif '-' in span:
+                    start, end = (int(v) for v in span.split('-', 1))
+                else:
+                    start = int(span)
+                    end = high if '/' in item else start
+            except ValueError:
+                raise ValueError(f"cron {name} 段无法解析：{text}")
+            
+            if step < 1 or not low <= start <= end <= high:
+                raise ValueError(f"cron {name} 段超出范围 {low}-{high}：{text}")
+            
+            values.update(range(start, end + 1, step))
+        
+        return values
+    
+    def _day_matches(self, t: datetime) -> bool:
+        if t.month not in self.month:
+            return False
+        
+        day = t.day in self.day
+        weekday = (t.weekday() + 1) % 7 in self.weekday
+        
+        if self.any_day or self.any_weekday:
+            return day and weekday
+        return day or weekday
+    
+    def matches(self, t: datetime) -> bool:
+        return self._day_matches(t) and t.hour in self.hour and t.minute in self.minute
+    
+    def next_after(self, t: datetime) -> datetime:
+        """t 之后（不含 t 所在分钟）第一个满足的时刻"""
+        t = t.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        end = t + timedelta(days=366 * 5)
+        
+        while t < end:
+            if not self._day_matches(t):
+                t = t.replace(hour=0, minute=0) + timedelta(days=1)
+            elif t.hour not in self.hour:
+                t = t.replace(minute=0) + timedelta(hours=1)
+            elif t.minute not in self.minute:
+                t += timedelta(minutes=1)
+            else:
+                return t
+        
+        raise ValueError(f"cron 表达式没有可执行的时间：{self.expr}")
+
+def memory_mb() -> float:
+    """当前进程常驻内存（MB）；没有 /proc 的平台退回历史峰值，都取不到为 0"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2**20
+    except (OSError, ValueError, AttributeError):
+        pass
+    
+    try:
+        import resource
+    except ImportError:
+        return 0.0
+    
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2**20 if sys.platform == 'darwin' else peak / 1024
+
+def socket_address(text: str) -> Tuple[int, Any]:
+    """
+    DAEMON_SOCKET -> (地址族, 地址)：host:port 为 TCP，否则为 Unix socket 路径（相对项目根目录）
+    
+    命令协议没有认证，TCP 只允许本机回环地址（127.0.0.0/8、localhost），其他主机抛出 ValueError
+    """
+    host, sep, port = text.rpartition(':')
+    
+    if sep and port.isdigit() and '/' not in text:
+        host = host or '127.0.0.1'
+        
+        if host == 'localhost':
+            host = '127.0.0.1'
+        
+        try:
+            loopback = ipaddress.IPv4Address(host).is_loopback
+        except ValueError:
+            loopback = False
+        
+        if not loopback:
+            raise ValueError(f"DAEMON_SOCKET 只能监听本机回环地址（如 127.0.0.1:{port}）：{text}")
+        
+        return socket.AF_INET, (host, int(port))
+    
+    return socket.AF_UNIX, os.path.join(PROJECT_ROOT, text)
+
+def send_command(command: str, address: Optional[str] = None, **params) -> Dict[str, Any]:
+    """
+    向常驻进程发送命令并等待结果（扫描可能需要数十秒，不设超时）
+    
+    Raises:
+        ConnectionError: 常驻进程未运行
+    """
+    family, addr = socket_address(address or load_daemon_config()['socket'])
+    
+    with socket.socket(family, socket.SOCK_STREAM) as sock:
+        try:
+            sock.connect(addr)
+        except (FileNotFoundError, ConnectionRefusedError) as e:
+            raise ConnectionError(f"常驻进程未运行（{addr}）") from e
+        
+        sock.sendall((json.dumps(dict(params, command=command)) + '\n').encode('utf-8'))
+        return json.loads(_read_line(sock))
+
+def _read_line(sock: socket.socket) -> str:
+    chunks = []
+    
+    while True:
+        chunk = sock.recv(65536)
+        if not chunk:
+            break
+        chunks.append(chunk)
+        if chunk.endswith(b'\n'):
+            break
+    
+    return b''.join(chunks).decode('utf-8')
+
+class ScanDaemon:
+    """
+    常驻扫描进程
+    
+    单线程事件循环：等待 socket 命令（最多 1 秒），其间检查定时任务和日期切换；
+    命令和定时任务依次执行，扫描期间面板不会被并发修改
+    """
+    
+    def __init__(self, config: Optional[Dict[str, Any]] = None):
+        self.config = config or load_daemon_config()
+        self.jobs = []  # [(名称, CronSchedule, 执行函数)]
+        
+        if self.config['scan_schedule']:
+            self.jobs.append(('scan', CronSchedule(self.config['scan_schedule']), self.scan))
+        if self.config['update_schedule']:
+            self.jobs.append(('update', CronSchedule(self.config['update_schedule']), self.update))
+        
+        self.next_runs = {}
+        self.strategies = {}
+        self.requirements = None  # history_requirements：(K 线数, 列)
+        self.panel = None
+        self.resident = True
+        self.day = None
+        self.started = None
+        self.last_scan = None
+        self._stop = False
+    
+    def start(self):
+        """初始化并在前台运行，直到收到 stop 命令或 SIGTERM / SIGINT"""
+        self.started = datetime.now()
+        print("\n" + "="*60)
+        print(f"🛰️  常驻扫描进程启动：{self.started.strftime('%Y-%m-%d %H:%M:%S')}（pid {os.getpid()}）")
+        print("="*60)
+        
+        sock = self._listen()
+        
+        try:
+            init_db()
+            
+            if not get_stock_list():
+                print("\n⚠️  未检测到股票数据，首次运行需要更新数据...")
+                scanner.update_stock_data()
+            
+            self.day = date.today()
+            self.reload()
+            
+            for name, schedule, _ in self.jobs:
+                self.next_runs[name] = schedule.next_after(datetime.now())
+                print(f"⏰ {name}：{schedule.expr}，下次 {self.next_runs[name]:%Y-%m-%d %H:%M}")
+            
+            for signum in (signal.SIGTERM, signal.SIGINT):
+                signal.signal(signum, self._on_signal)
+            
+            self._serve(sock)
+        finally:
+            sock.close()
+            if sock.family == socket.AF_UNIX:
+                self._unlink_socket()
+            close_connection()
+            print("👋 常驻扫描进程已退出")
+    
+    def reload(self) -> Dict[str, Any]:
+        """重新加载策略并全量重建面板（策略文件修改、全量更新行情后使用；也恢复常驻）"""
+        self.strategies = scanner.load_strategies()
+        self.requirements = scanner.history_requirements(
+            self.strategies.values(), scanner.CONFIG['history_days'], scanner.CONFIG['indicators']
+        )
+        self.panel = None
+        self.resident = True
+        gc.collect()
+        
+        self._load_panel()
+        return {'strategies': list(self.strategies)}
+    
+    def refresh(self) -> Dict[str, Any]:
+        """
+        增量刷新面板：只重新读取最后一根 K 线与数据库不一致的股票（新 K 线、新上市），
+        去掉已退市的股票
+        """
+        if not self.resident:
+            return {'refreshed': 0}
+        
+        if self.panel is None:
+            self._load_panel()
+            return {'refreshed': len(self.panel)}
+        
+        started = time.perf_counter()
+        codes = [s['code'] for s in get_stock_list()]
+        db_last = get_last_dates()
+        panel_last = dict(zip(self.panel.codes, self.panel.last_dates()))
+        stale = [c for c in codes if db_last.get(c, '') != panel_last.get(c, '')]
+        
+        listed = set(codes)
+        if any(c not in listed for c in self.panel.codes):
+            self.panel = self.panel.select([c for c in self.panel.codes if c in listed])
+        
+        if stale:
+            days, columns = self.requirements
+            self.panel = self.panel.update(scanner.load_history_panel(stale, days, columns))
+            print(f"🔄 增量刷新：{len(stale)} 只股票有新数据，用时 {time.perf_counter() - started:.2f}s")
+        
+        self._check_memory()
+        return {'refreshed': len(stale)}
+    
+    def scan(self, save: bool = True) -> Dict[str, Any]:
+        """
+        刷新面板后扫描；save 时保存并推送（同 run.py）
+        
+        每次扫描是一次独立的运行：按 scanner.CONFIG 的 run_report / profile 写报告和剖析
+        """
+        with instrumented_run(scanner.CONFIG['run_report'], scanner.CONFIG['profile']):
+            started = time.perf_counter()
+            
+            with METRICS.stage('refresh'):
+                self.refresh()
+            
+            results = scanner.run_scan(self.strategies, self.panel if self.resident else None)
+            scanner.print_results(results)
+            
+            if save:
+                scanner.save_results(results)
+        
+        self.last_scan = {
+            'time': datetime.now().isoformat(timespec='seconds'),
+            'seconds': round(time.perf_counter() - started, 3),
+            'signals': {name: len(stocks) for name, stocks in results.items()},
+            'saved': save,
+            'stages': {name: t['seconds'] for name, t in METRICS.report()['stage'].items()},
+        }
+        
+        self._check_memory()
+        return dict(self.last_scan)
+    
+    def update(self) -> Dict[str, Any]:
+        """增量更新行情（同 update_stock_data）并刷新面板"""
+        with instrumented_run(scanner.CONFIG['run_report'], scanner.CONFIG['profile']):
+            ok = scanner.update_stock_data(incremental=True)
+            with METRICS.stage('refresh'):
+                refreshed = self.refresh()
+        
+        return dict(refreshed, updated=bool(ok))
+    
+    def status(self) -> Dict[str, Any]:
+        panel = None
+        if self.panel is not None:
+            panel = {
+                'codes': len(self.panel),
+                'bars': self.panel.n_bars,
+                'fields': self.panel.fields,
+                'mb': round(self.panel.nbytes / 2**20, 1),
+            }
+        
+        return {
+            'pid': os.getpid(),
+            'started': self.started.isoformat(timespec='seconds') if self.started else None,
+            'day': str(self.day),
+            'strategies': list(self.strategies),
+            'resident': self.resident,
+            'panel': panel,
+            'memory_mb': round(memory_mb(), 1),
+            'max_memory_mb': self.config['max_memory_mb'],
+            'last_scan': self.last_scan,
+            'next_runs': {name: t.isoformat(timespec='minutes') for name, t in self.next_runs.items()},
+        }
+    
+    def execute(self, command: str, params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """执行一条命令：scan / refresh / update / reload / status / stop"""
+        params = params or {}
+        
+        if command == 'scan':
+            return self.scan(save=bool(params.get('save', True)))
+        if command == 'refresh':
+            return self.refresh()
+        if command == 'update':
+            return self.update()
+        if command == 'reload':
+            return self.reload()
+        if command == 'status':
+            return self.status()
+        if command == 'stop':
+            self._stop = True
+            return {}
+        
+        raise ValueError(f"未知命令: {command}")
+    
+    def _load_panel(self):
+        """全量加载全部股票的面板"""
+        started = time.perf_counter()
+        days, columns = self.requirements
+        codes = [s['code'] for s in get_stock_list()]
+        
+        self.panel = scanner.load_history_panel(codes, days, columns)
+        print(f"📦 常驻历史行情：{len(self.panel)} 只股票 × {days} 根 K 线（{len(columns)} 列），"
+              f"{self.panel.nbytes / 2**20:.1f}MB，用时 {time.perf_counter() - started:.2f}s")
+        
+        self._check_memory()
+    
+    def _check_memory(self):
+        """进程内存超过上限时释放面板，之后每次扫描临时加载（reload 恢复常驻）"""
+        limit = self.config['max_memory_mb']
+        if not limit or self.panel is None:
+            return
+        
+        used = memory_mb()
+        if used <= limit:
+            return
+        
+        print(f"⚠️  进程内存 {used:.0f}MB 超过上限 {limit:.0f}MB，释放常驻行情，之后每次扫描临时加载")
+        self.panel = None
+        self.resident = False
+        gc.collect()
+    
+    def _check_day(self):
+        """日期切换：刷新股票列表和面板，回收前一天的临时对象"""
+        today = date.today()
+        if today == self.day:
+            return
+        
+        print(f"\n📅 日期切换：{self.day} → {today}")
+        self.day = today
+        self.refresh()
+        gc.collect()
+    
+    def _run_due(self):
+        """执行到期的定时任务；任务耗时超过下一个周期时跳过错过的周期"""
+        for name, schedule, job in self.jobs:
+            if datetime.now() < self.next_runs[name]:
+                continue
+            
+            print(f"\n⏰ 定时任务：{name}")
+            try:
+                job()
+            except Exception as e:
+                print(f"❌ 定时任务 {name} 失败：{e}")
+            
+            self.next_runs[name] = schedule.next_after(datetime.now())
+            print(f"⏰ {name} 下次 {self.next_runs[name]:%Y-%m-%d %H:%M}")
+    
+    def _serve(self, sock: socket.socket):
+        print(f"\n🛰️  等待命令：{self.config['socket']}")
+        
+        while not self._stop:
+            try:
+                self._check_day()
+                self._run_due()
+            except Exception as e:
+                print(f"❌ 常驻任务失败：{e}")
+            
+            sock.settimeout(1.0)
+            try:
+                conn, _ = sock.accept()
+            except (socket.timeout, InterruptedError):
+                continue
+            
+            with conn:
+                self._handle(conn)
+    
+    def _handle(self, conn: socket.socket):
+        conn.settimeout(5.0)
+        
+        try:
+            request = json.loads(_read_line(conn))
+            command = request.pop('command', None)
+            print(f"\n📨 命令：{command}")
+            reply = dict(self.execute(command, request), ok=True)
+        except Exception as e:
+            reply = {'ok': False, 'error': str(e)}
+        
+        try:
+            conn.settimeout(5.0)
+            conn.sendall((json.dumps(reply, ensure_ascii=False, default=str) + '\n').encode('utf-8'))
+        except OSError:
+            # 客户端已断开，结果只打印在日志里
+            pass
+    
+    def _listen(self) -> socket.socket:
+        family, addr = socket_address(self.config['socket'])
+        
+        if family == socket.AF_UNIX and os.path.exists(addr):
+            # 上次异常退出残留的 socket 文件：连不上说明没有进程在监听
+            probe = socket.socket(family, socket.SOCK_STREAM)
+            try:
+                probe.connect(addr)
+                raise RuntimeError(f"常驻进程已在运行（{addr}）")
+            except (ConnectionRefusedError, FileNotFoundError):
+                os.unlink(addr)
+            finally:
+                probe.close()
+        
+        sock = socket.socket(family, socket.SOCK_STREAM)
+        
+        if family == socket.AF_UNIX:
+            os.makedirs(os.path.dirname(addr), exist_ok=True)
+            sock.bind(addr)
+            os.chmod(addr, 0o600)
+        else:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            sock.bind(addr)
+        
+        sock.listen(8)
+        return sock
+    
+    def _unlink_socket(self):
+        _, addr = socket_address(self.config['socket'])
+        try:
+            os.unlink(addr)
+        except OSError:
+            pass
+    
+    def _on_signal(self, signum, frame):
+        print(f"\n🛑 收到信号 {signum}，当前任务结束后退出")
+        self._stop = True
+
+if __name__ == '__main__':
+    ScanDaemon().start()
@@ -6,30 +6,436 @@
 """
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import pandas as pd
+import numpy as np
 from datetime import datetime, timedelta
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Callable, Tuple, Any
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+import threading
+import json
+import os
+import sys
 import time
 import re
+from urllib.parse import urlsplit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from src.metrics import METRICS
 
 # 腾讯财经 API 基础 URL
 TENCENT_REALTIME_URL = "http://qt.gtimg.cn/q="
 TENCENT_HISTORY_URL = "http://web.ifzq.gtimg.cn/appstock/app/fqkline/get"
+SINA_LIST_URL = "http://vip.stock.finance.sina.com.cn/quotes_service/api/json_v2.php/Market_Center.getHQNodeDataSimple"
+
+# HTTP 连接配置（修改后调用 reset_session() 生效）
+HTTP_CONFIG = {
+    'pool_connections': 8,    # 缓存的主机连接池个数
+    'pool_maxsize': 16,       # 每个主机的最大连接数（不小于并发线程数）
+    'retries': 3,             # 连接错误 / 5xx（限流状态码除外）重试次数
+    'backoff_factor': 0.3,    # 重试退避：0.3s, 0.6s, 1.2s...
+    'timeout': (5, 15),       # (连接超时, 读取超时) 秒
+}
+
+# 实时行情批量请求配置
+QUOTE_CONFIG = {
+    'batch_size': 60,   # 腾讯支持一次查询最多 60 只
+    'workers': 16,      # 同时在途的批次数（不超过 HTTP_CONFIG['pool_maxsize']）
+    'rate': 30.0,       # 持续速率：每秒最多批次请求数
+    'burst': 100,       # 令牌桶容量：可立即发出的批次数
+    'retries': 2,       # 单个批次失败重试次数
+}
+# burst 不小于全市场批次数（约 5000 只 / 60 ≈ 90 批）时，一轮行情只受 workers 和
+# 网络延迟限制（约 1 秒）；burst 取 rate 时一轮需约 3 秒。突发越大，触发上游限流的
+# 风险越高，但限流后 AdaptiveLimiter 会清空令牌并按比例缩小桶容量，连续扫描时
+# 持续速率仍为 rate
+
+# 股票列表配置
+LIST_CONFIG = {
+    'ttl_hours': 72,    # 列表缓存有效期（上市 / 退市每周只有几只）
+    'page_size': 100,   # 新浪每页条数
+    'max_pages': 50,    # 每个市场最多页数
+    'workers': 8,       # 并发请求页数
+    'rate': 10.0,       # 每秒最多请求数
+}
+
+STOCK_LIST_CACHE = os.path.join(os.path.dirname(__file__), '..', 'data', 'stock_list.json')
+
+# 腾讯实时行情字段：列名 -> 下标
+# 0:未知，1:名称，2:代码，3:当前价，4:昨收，5:开盘，6:成交量，7:外盘，8:内盘
+# 9:买一，10:买一量，19:卖一，20:卖一量，31:最高，32:最低，47:成交额，48:换手率，49:市盈率
+QUOTE_FIELDS = {
+    'name': 1,
+    'price': 3,
+    'yesterday_close': 4,
+    'open': 5,
+    'volume': 6,
+    'outer_volume': 7,
+    'inner_volume': 8,
+    'bid1': 9,
+    'bid1_volume': 10,
+    'ask1': 19,
+    'ask1_volume': 20,
+    'high': 31,
+    'low': 32,
+    'amount': 47,
+    'turnover': 48,
+    'pe': 49,
+}
+
+# quote_frame_to_dict 输出的字段（与 get_stock_current_info 一致）
+QUOTE_DICT_COLUMNS = [
+    'code', 'name', 'price', 'change', 'change_percent', 'open', 'high', 'low',
+    'volume', 'amount', 'yesterday_close', 'turnover'
+]
+
+_QUOTE_RE = re.compile(r'v_(?:sh|sz)(\d+)="([^"]*)"')
+
+# 自适应限流（AIMD）配置
+ADAPTIVE_CONFIG = {
+    'min_rate': 1.0,        # 最低速率（次/秒）
+    'decrease': 0.5,        # 限流时速率和并发的乘数
+    'increase': 0.1,        # 恢复时每次增加的速率（初始速率的比例）
+    'recover_after': 10,    # 连续成功多少次后尝试提速
+    'cooldown': 2.0,        # 两次降速的最小间隔（秒），避免同一波限流重复降速
+    'max_requeue': 5,       # 单只股票因限流重新排队的最大次数
+}
+
+# 视为限流的 HTTP 状态码
+THROTTLE_STATUS = (403, 429, 503)
+
+_session = None
+_session_lock = threading.Lock()
+
+def set_endpoint_base(base_url: str) -> Dict[str, str]:
+    """
+    把所有接口地址指向 base_url（保留原路径），用于本地替身服务（见 src/replay.py）
+    
+    Returns:
+        原接口地址，可传给 restore_endpoints 恢复
+    """
+    global TENCENT_REALTIME_URL, TENCENT_HISTORY_URL, SINA_LIST_URL
+    
+    saved = {
+        'TENCENT_REALTIME_URL': TENCENT_REALTIME_URL,
+        'TENCENT_HISTORY_URL': TENCENT_HISTORY_URL,
+        'SINA_LIST_URL': SINA_LIST_URL,
+    }
+    base_url = base_url.rstrip('/')
+    
+    TENCENT_REALTIME_URL = base_url + urlsplit(TENCENT_REALTIME_URL).path
+    TENCENT_HISTORY_URL = base_url + urlsplit(TENCENT_HISTORY_URL).path
+    SINA_LIST_URL = base_url + urlsplit(SINA_LIST_URL).path
+    reset_session()
+    
+    return saved
+
+def restore_endpoints(saved: Dict[str, str]):
+    """恢复 set_endpoint_base 之前的接口地址"""
+    globals().update(saved)
+    reset_session()
+
+def get_session() -> requests.Session:
+    """
+    获取共享 HTTP 会话
+    
+    按主机复用 keep-alive 连接池，避免每次请求重新握手；
+    连接错误和 5xx 按 HTTP_CONFIG 自动退避重试。THROTTLE_STATUS 中的状态码（503 等）不在
+    这里重试，第一次响应就交给 _check_throttled：批量下载由 AdaptiveLimiter 降速并重新排队，
+    没有限流器的单次请求用 _retry_throttled 退避重试
+    """
+    global _session
+    
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                retry = Retry(
+                    total=HTTP_CONFIG['retries'],
+                    backoff_factor=HTTP_CONFIG['backoff_factor'],
+                    status_forcelist=tuple(s for s in (500, 502, 503, 504) if s not in THROTTLE_STATUS),
+                    allowed_methods=frozenset(['GET']),
+                    respect_retry_after_header=False,
+                    raise_on_status=False
+                )
+                adapter = HTTPAdapter(
+                    pool_connections=HTTP_CONFIG['pool_connections'],
+                    pool_maxsize=HTTP_CONFIG['pool_maxsize'],
+                    max_retries=retry
+                )
+                
+                session = requests.Session()
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                _session = session
+    
+    return _session
+
+def reset_session():
+    """关闭共享会话，下次请求按当前 HTTP_CONFIG 重建"""
+    global _session
+    
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+            _session = None
+
+def set_session(session):
+    """替换共享会话（录制 / 测试用，需提供 get(url, params, timeout) 和 close()）"""
+    global _session
+    
+    with _session_lock:
+        _session = session
+
+def http_get(url: str, params: Optional[Dict] = None, timeout=None) -> requests.Response:
+    """通过共享会话发送 GET 请求（按接口记录延迟，见 src/metrics.py）"""
+    started = time.perf_counter()
+    ok = False
+    
+    try:
+        response = get_session().get(url, params=params, timeout=timeout or HTTP_CONFIG['timeout'])
+        ok = response.ok
+        return response
+    finally:
+        METRICS.latency(_endpoint(url), time.perf_counter() - started, ok)
+
+def _endpoint(url: str) -> str:
+    """请求 URL 对应的接口名（运行报告中 fetch 延迟的分组）"""
+    for name, base in (('quote', TENCENT_REALTIME_URL), ('kline', TENCENT_HISTORY_URL),
+                       ('stock_list', SINA_LIST_URL)):
+        if url.startswith(base):
+            return name
+    return urlsplit(url).netloc
+
+class TokenBucket:
+    """
+    令牌桶限流器（线程安全）
+    
+    所有工作线程共享一个桶，整体请求速率不超过 rate 次/秒，
+    允许最多 capacity 次突发请求
+    """
+    
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(1.0, rate))
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+    
+    def acquire(self, tokens: float = 1.0):
+        """阻塞直到取得令牌"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                
+                wait = (tokens - self._tokens) / self.rate
+            
+            time.sleep(wait)
+    
+    def set_rate(self, rate: float, drain: bool = False):
+        """调整速率（容量按比例缩放）；drain=True 时清空已积累的令牌（限流后立即降速）"""
+        with self._lock:
+            self.capacity = max(1.0, self.capacity * float(rate) / self.rate)
+            self.rate = float(rate)
+            self._tokens = 0.0 if drain else min(self._tokens, self.capacity)
+            self._last = time.monotonic()
+
+class ThrottledError(Exception):
+    """上游限流（返回 Forbidden 或 403 / 429 / 503）"""
+    pass
+
+def _check_throttled(response: requests.Response):
+    """检测限流信号，命中时抛出 ThrottledError"""
+    if response.status_code in THROTTLE_STATUS:
+        raise ThrottledError(f"HTTP {response.status_code}")
+    
+    if response.text[:32].strip() == 'Forbidden':
+        raise ThrottledError("Forbidden")
+
+def _retry_throttled(call: Callable[[], Any]) -> Any:
+    """
+    不经过 AdaptiveLimiter 的单次调用：call 抛出 ThrottledError（限流）时按 HTTP_CONFIG 的
+    retries / backoff_factor 退避重试，重试耗尽后抛出
+    """
+    retries = HTTP_CONFIG['retries']
+    
+    for attempt in range(retries + 1):
+        try:
+            return call()
+        except ThrottledError:
+            if attempt == retries:
+                raise
+            time.sleep(HTTP_CONFIG['backoff_factor'] * 2 ** attempt)
+
+class AdaptiveLimiter:
+    """
+    自适应限流器（AIMD）
+    
+    同时限制在途请求数和请求速率：
+    - 遇到限流：速率和并发乘以 decrease（冷却期内只降一次），清空令牌
+    - 连续 recover_after 次成功：速率加 increase × 初始速率、并发加 1，直到初始上限
+    
+    burst 为令牌桶容量（默认等于 rate），随速率同比例缩放
+    """
+    
+    def __init__(self, rate: float, concurrency: int, burst: Optional[float] = None, **options):
+        config = dict(ADAPTIVE_CONFIG, **options)
+        
+        self.bucket = TokenBucket(rate, burst)
+        self.max_rate = float(rate)
+        self.max_concurrency = max(1, int(concurrency))
+        self.concurrency = self.max_concurrency
+        self.min_rate = min(config['min_rate'], self.max_rate)
+        self.increase = config['increase']
+        self.decrease = config['decrease']
+        self.recover_after = config['recover_after']
+        self.cooldown = config['cooldown']
+        
+        self.throttled = 0
+        self.decreases = 0
+        self.increases = 0
+        self.lowest_rate = self.max_rate
+        
+        self._active = 0
+        self._successes = 0
+        self._last_decrease = float('-inf')
+        self._cond = threading.Condition()
+    
+    @property
+    def rate(self) -> float:
+        return self.bucket.rate
+    
+    @contextmanager
+    def slot(self):
+        """占用一个请求名额；块内抛出 ThrottledError 视为限流信号"""
+        with self._cond:
+            while self._active >= self.concurrency:
+                self._cond.wait()
+            self._active += 1
+        
+        throttled = False
+        try:
+            self.bucket.acquire()
+            yield
+        except ThrottledError:
+            throttled = True
+            raise
+        finally:
+            with self._cond:
+                self._active -= 1
+                if throttled:
+                    self._on_throttle()
+                else:
+                    self._on_success()
+                self._cond.notify_all()
+    
+    def _on_throttle(self):
+        self.throttled += 1
+        self._successes = 0
+        
+        now = time.monotonic()
+        if now - self._last_decrease < self.cooldown:
+            return
+        
+        self._last_decrease = now
+        self.decreases += 1
+        self.concurrency = max(1, int(self.concurrency * self.decrease))
+        self.bucket.set_rate(max(self.min_rate, self.bucket.rate * self.decrease), drain=True)
+        self.lowest_rate = min(self.lowest_rate, self.bucket.rate)
+    
+    def _on_success(self):
+        self._successes += 1
+        
+        if self._successes < self.recover_after:
+            return
+        
+        self._successes = 0
+        if self.bucket.rate < self.max_rate or self.concurrency < self.max_concurrency:
+            self.increases += 1
+            self.concurrency = min(self.max_concurrency, self.concurrency + 1)
+            self.bucket.set_rate(min(self.max_rate, self.bucket.rate + self.max_rate * self.increase))
+    
+    def snapshot(self) -> Dict:
+        """运行统计（用于调参）"""
+        with self._cond:
+            return {
+                'rate': round(self.bucket.rate, 2),
+                'max_rate': self.max_rate,
+                'lowest_rate': round(self.lowest_rate, 2),
+                'concurrency': self.concurrency,
+                'max_concurrency': self.max_concurrency,
+                'throttled': self.throttled,
+                'decreases': self.decreases,
+                'increases': self.increases,
+            }
+
+class FetchStats:
+    """批量下载统计"""
+    
+    def __init__(self, total: int = 0):
+        self.total = total
+        self.success = 0
+        self.empty = 0      # 请求成功但无数据（停牌、新股等）
+        self.failed = 0     # 请求异常
+        self.errors = {}    # code -> 异常信息
+        self.requeued = 0   # 因限流重新排队的次数
+        self.adjusted = []  # 复权基准变化（除权除息）、改为全量下载的股票
+        self.limiter = {}   # AdaptiveLimiter.snapshot()
+        self.elapsed = 0.0
+    
+    @property
+    def done(self) -> int:
+        return self.success + self.empty + self.failed
+    
+    @property
+    def throughput(self) -> float:
+        """吞吐量（只/秒）"""
+        return self.done / self.elapsed if self.elapsed > 0 else 0.0
+    
+    def summary(self) -> str:
+        text = (f"成功：{self.success}/{self.total}，无数据：{self.empty}，失败：{self.failed}，"
+                f"耗时：{self.elapsed:.1f}s，吞吐：{self.throughput:.1f} 只/秒")
+        
+        if self.adjusted:
+            text += f"\n   复权基准变化 {len(self.adjusted)} 只，已全量重新下载"
+        
+        if self.limiter.get('throttled'):
+            text += (f"\n   限流 {self.limiter['throttled']} 次，重新排队 {self.requeued} 次，"
+                     f"最低速率 {self.limiter['lowest_rate']} 次/秒，"
+                     f"当前速率 {self.limiter['rate']} 次/秒 / 并发 {self.limiter['concurrency']}")
+        
+        return text
 
-def get_all_a_stocks() -> List[Dict]:
+def get_all_a_stocks(use_cache: bool = True, ttl_hours: Optional[float] = None) -> List[Dict]:
     """
     获取所有 A 股列表
-    使用腾讯财经 + 新浪接口
+    使用新浪接口，结果缓存到 STOCK_LIST_CACHE
+    
+    Args:
+        use_cache: 缓存未过期时直接返回缓存
+        ttl_hours: 缓存有效期（小时），默认取 LIST_CONFIG['ttl_hours']
     """
+    ttl_hours = LIST_CONFIG['ttl_hours'] if ttl_hours is None else ttl_hours
+    cached, fetched_at = _load_stock_list_cache()
+    
+    if use_cache and cached and time.time() - fetched_at < ttl_hours * 3600:
+        age = (time.time() - fetched_at) / 3600
+        print(f"📋 使用缓存的 A 股列表（{len(cached)} 只，{age:.1f} 小时前更新）")
+        return cached
+    
     print("📋 获取 A 股列表...")
     
     try:
-        # 使用腾讯批量行情获取所有股票
-        # 先获取几个主要指数的成分股
-        
         all_stocks = []
         
-        # 方法：通过腾讯行情中心获取
         # 沪深 A 股列表
         markets = [
             ('sh', '沪 A'),
@@ -38,12 +444,7 @@ def get_all_a_stocks() -> List[Dict]:
         
         for prefix, market_name in markets:
             print(f"  获取{market_name}...")
-            
-            # 腾讯接口获取该市场股票
-            stocks = get_stocks_by_prefix(prefix)
-            all_stocks.extend(stocks)
-            
-            time.sleep(0.2)
+            all_stocks.extend(_fetch_market_list(prefix))
         
         # 去重
         seen = set()
@@ -53,13 +454,38 @@ def get_all_a_stocks() -> List[Dict]:
                 seen.add(s['code'])
                 unique_stocks.append(s)
         
+        _save_stock_list_cache(unique_stocks)
+        
         print(f"✅ 共获取 {len(unique_stocks)} 只股票")
         return unique_stocks
     
     except Exception as e:
+        if cached:
+            print(f"⚠️  获取股票列表失败：{e}，使用过期缓存（{len(cached)} 只）")
+            return cached
+        
         print(f"❌ 获取股票列表失败：{e}")
         return []
 
+def _load_stock_list_cache() -> Tuple[List[Dict], float]:
+    """读取股票列表缓存，返回 (stocks, 获取时间戳)"""
+    try:
+        with open(STOCK_LIST_CACHE, 'r', encoding='utf-8') as f:
+            cache = json.load(f)
+        return cache.get('stocks', []), float(cache.get('fetched_at', 0))
+    except (OSError, ValueError):
+        return [], 0.0
+
+def _save_stock_list_cache(stocks: List[Dict]):
+    """原子写入股票列表缓存（临时文件按进程区分，并发进程不会互相覆盖写了一半的文件）"""
+    os.makedirs(os.path.dirname(STOCK_LIST_CACHE), exist_ok=True)
+    tmp_path = f'{STOCK_LIST_CACHE}.{os.getpid()}.tmp'
+    
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({'fetched_at': time.time(), 'stocks': stocks}, f, ensure_ascii=False)
+    
+    os.replace(tmp_path, STOCK_LIST_CACHE)
+
 def get_stocks_by_prefix(prefix: str) -> List[Dict]:
     """
     获取指定市场的股票列表
@@ -68,53 +494,73 @@ def get_stocks_by_prefix(prefix: str) -> List[Dict]:
         prefix: 市场前缀 (sh/sz)
     """
     try:
-        # 使用新浪接口获取股票列表
-        # 新浪有股票列表接口
-        url = f"http://vip.stock.finance.sina.com.cn/quotes_service/api/json_v2.php/Market_Center.getHQNodeDataSimple"
-        params = {
-            'page': 1,
-            'num': 100,
-            'sort': 'symbol',
-            'asc': 1,
-            'node': f'{prefix}_A',
-            '_s_r_a': 'page'
-        }
-        
-        all_stocks = []
-        
-        # 分页获取（每页 100 只，最多 50 页）
-        for page in range(1, 51):
-            params['page'] = page
-            
-            response = requests.get(url, params=params, timeout=15)
-            
-            if response.status_code != 200:
-                break
-            
-            data = response.json()
-            
-            if not data or len(data) == 0:
-                break
-            
-            for item in data:
-                all_stocks.append({
-                    'code': item.get('code', ''),
-                    'name': item.get('name', ''),
-                    'market': '沪 A' if prefix == 'sh' else '深 A'
-                })
-            
-            # 如果返回少于 100 条，说明是最后一页
-            if len(data) < 100:
-                break
-            
-            time.sleep(0.1)
-        
-        return all_stocks
-    
+        return _fetch_market_list(prefix)
     except Exception as e:
         print(f"    获取{prefix}市场失败：{e}")
         return []
 
+def _fetch_list_page(prefix: str, page: int) -> List[Dict]:
+    """获取新浪股票列表的一页"""
+    params = {
+        'page': page,
+        'num': LIST_CONFIG['page_size'],
+        'sort': 'symbol',
+        'asc': 1,
+        'node': f'{prefix}_A',
+        '_s_r_a': 'page'
+    }
+    
+    response = http_get(SINA_LIST_URL, params=params)
+    _check_throttled(response)
+    
+    if response.status_code != 200:
+        raise requests.HTTPError(f"HTTP {response.status_code} (page {page})")
+    
+    return response.json() or []
+
+def _fetch_market_list(prefix: str) -> List[Dict]:
+    """
+    分页并发获取指定市场的股票列表，任一页失败抛出异常（避免返回残缺列表）
+    
+    每轮并发请求 workers 页，遇到不满一页的结果即停止；
+    限流时 AdaptiveLimiter 降速降并发，该页最多重试 max_requeue 次
+    """
+    page_size = LIST_CONFIG['page_size']
+    max_pages = LIST_CONFIG['max_pages']
+    workers = max(1, LIST_CONFIG['workers'])
+    market = '沪 A' if prefix == 'sh' else '深 A'
+    limiter = AdaptiveLimiter(LIST_CONFIG['rate'], workers)
+    max_requeue = ADAPTIVE_CONFIG['max_requeue']
+    
+    def task(page: int) -> List[Dict]:
+        for attempt in range(max_requeue + 1):
+            try:
+                with limiter.slot():
+                    return _fetch_list_page(prefix, page)
+            except ThrottledError:
+                if attempt == max_requeue:
+                    raise
+    
+    all_stocks = []
+    
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for first in range(1, max_pages + 1, workers):
+            pages = range(first, min(first + workers, max_pages + 1))
+            
+            for data in pool.map(task, pages):
+                for item in data:
+                    all_stocks.append({
+                        'code': item.get('code', ''),
+                        'name': item.get('name', ''),
+                        'market': market
+                    })
+                
+                # 如果返回少于一页，说明是最后一页
+                if len(data) < page_size:
+                    return all_stocks
+    
+    return all_stocks
+
 def get_stock_current_info(code: str) -> Optional[Dict]:
     """
     获取股票实时行情（腾讯财经）
@@ -130,9 +576,15 @@ def get_stock_current_info(code: str) -> Optional[Dict]:
         prefix = 'sh' if code.startswith('6') else 'sz'
         symbol = f"{prefix}{code}"
         
-        # 请求腾讯实时行情
+        # 请求腾讯实时行情（单次请求没有 AdaptiveLimiter，限流时退避重试）
         url = f"{TENCENT_REALTIME_URL}{symbol}"
-        response = requests.get(url, timeout=10)
+        
+        def request():
+            response = http_get(url)
+            _check_throttled(response)
+            return response
+        
+        response = _retry_throttled(request)
         
         if response.status_code != 200:
             return None
@@ -141,7 +593,7 @@ def get_stock_current_info(code: str) -> Optional[Dict]:
         # 格式：v_sh601138="1~工业富联~601138~57.95~57.39~57.40~..."
         text = response.text.strip()
         
-        if not text or text == 'Forbidden':
+        if not text:
             return None
         
         # 提取引号内的数据
@@ -203,55 +655,372 @@ def get_stock_history(code: str, days: int = 60) -> Optional[pd.DataFrame]:
         DataFrame with columns: date, open, close, high, low, volume, amount
     """
     try:
-        # 确定市场前缀
-        prefix = 'sh' if code.startswith('6') else 'sz'
-        symbol = f"{prefix}{code}"
-        
-        # 计算日期范围
-        end_date = datetime.now()
+        return _retry_throttled(lambda: _fetch_history(code, days))
+    except Exception:
+        return None
+
+def last_trading_day(now: Optional[datetime] = None) -> str:
+    """
+    最近一个已收盘交易日（YYYY-MM-DD）
+    
+    只排除周末，不处理节假日：节假日期间会多请求一次，接口返回空数据即可
+    """
+    now = now or datetime.now()
+    day = now if now.hour >= 15 else now - timedelta(days=1)
+    
+    while day.weekday() >= 5:
+        day -= timedelta(days=1)
+    
+    return day.strftime('%Y-%m-%d')
+
+# 增量下载时重叠 K 线的收盘价与已存收盘价相差超过半个最小价位，视为前复权基准变化
+ADJUST_TOLERANCE = 0.005
+
+def _missing_bars(last_date: str, until: str) -> int:
+    """last_date 之后到 until 为止的交易日数（按工作日估算）"""
+    start = datetime.strptime(last_date, '%Y-%m-%d') + timedelta(days=1)
+    end = datetime.strptime(until, '%Y-%m-%d')
+    
+    count = 0
+    while start <= end:
+        if start.weekday() < 5:
+            count += 1
+        start += timedelta(days=1)
+    
+    return count
+
+def _fetch_history(code: str, days: int = 60, since: Optional[str] = None) -> Optional[pd.DataFrame]:
+    """
+    获取历史行情，网络/解析异常直接抛出，由调用方统计
+    
+    since: 已有数据的最后日期，从该日起请求（含该日这根重叠 K 线，供调用方核对复权基准）
+    """
+    # 确定市场前缀
+    prefix = 'sh' if code.startswith('6') else 'sz'
+    symbol = f"{prefix}{code}"
+    
+    # 计算日期范围
+    end_date = datetime.now()
+    if since:
+        start_date = datetime.strptime(since, '%Y-%m-%d')
+    else:
         start_date = end_date - timedelta(days=days + 30)  # 多获取一些确保足够
-        
-        # 腾讯财经历史 K 线接口
-        url = 'http://web.ifzq.gtimg.cn/appstock/app/fqkline/get'
-        param = f"{symbol},day,{start_date.strftime('%Y-%m-%d')},{end_date.strftime('%Y-%m-%d')},{days},qfq"
-        params = {'param': param}
-        
-        response = requests.get(url, params=params, timeout=15)
-        
-        if response.status_code != 200:
+    
+    # 腾讯财经历史 K 线接口
+    param = f"{symbol},day,{start_date.strftime('%Y-%m-%d')},{end_date.strftime('%Y-%m-%d')},{days},qfq"
+    params = {'param': param}
+    
+    response = http_get(TENCENT_HISTORY_URL, params=params)
+    _check_throttled(response)
+    
+    if response.status_code != 200:
+        return None
+    
+    json_data = response.json()
+    
+    # 解析腾讯返回的数据
+    if not json_data or json_data.get('code') != 0:
+        return None
+    
+    data = json_data.get('data', {})
+    stock_data = data.get(symbol, {})
+    klines = stock_data.get('qfqday', [])
+    
+    if not klines:
+        return None
+    
+    # 转换为 DataFrame
+    # 腾讯格式：[日期，开盘，收盘，最高，最低，成交量]
+    df = pd.DataFrame(klines, columns=['date', 'open', 'close', 'high', 'low', 'volume'])
+    
+    # 数据类型转换
+    df['open'] = pd.to_numeric(df['open'], errors='coerce')
+    df['close'] = pd.to_numeric(df['close'], errors='coerce')
+    df['high'] = pd.to_numeric(df['high'], errors='coerce')
+    df['low'] = pd.to_numeric(df['low'], errors='coerce')
+    df['volume'] = pd.to_numeric(df['volume'], errors='coerce')
+    
+    # 添加 amount 列（成交额，估算）
+    df['amount'] = df['volume'] * df['close']
+    
+    if since:
+        df = df[df['date'] >= since].reset_index(drop=True)
+        if df.empty:
             return None
+    
+    return df[['date', 'open', 'close', 'high', 'low', 'volume', 'amount']]
+
+def _rebased(df: Optional[pd.DataFrame], since: str, close: Optional[float]) -> bool:
+    """增量结果中 since 这根重叠 K 线的收盘价与已存的 close 不一致（期间除权，前复权价格整体变化）"""
+    if df is None or close is None:
+        return False
+    
+    overlap = df.loc[df['date'] == since, 'close']
+    return not overlap.empty and abs(float(overlap.iloc[0]) - close) > ADJUST_TOLERANCE
+
+def fetch_histories(codes: List[str], days: int = 60,
+                    since: Optional[Dict[str, str]] = None,
+                    workers: int = 8, rate: float = 10.0,
+                    on_result: Optional[Callable[[str, pd.DataFrame], None]] = None,
+                    progress_every: int = 200,
+                    closes: Optional[Dict[str, float]] = None,
+                    on_adjusted: Optional[Callable[[str], None]] = None) -> FetchStats:
+    """
+    并发下载多只股票的历史行情
+    
+    线程池控制并发数，共享令牌桶控制整体请求速率，
+    总耗时取决于上游限速而不是逐个请求的往返延迟；
+    遇到限流时 AdaptiveLimiter 自动降速降并发，受影响的股票重新排队
+    
+    Args:
+        codes: 股票代码列表
+        days: 每只股票获取天数
+        since: code -> 已有数据最后日期，有则只下载其后缺失的 K 线（增量，多请求 since 当天一根）
+        workers: 并发线程数
+        rate: 每秒最多请求数
+        on_result: 回调 (code, df)，在调用线程中执行（便于单线程写库）
+        progress_every: 每完成多少只打印一次进度
+        closes: code -> since 当天已存的收盘价；增量下载到的同日收盘价与之不一致时
+                （期间除权，前复权价格整体变化）改为下载 days 天全量，记入 stats.adjusted；
+                缺口不小于 days 的股票同样按全量替换处理
+        on_adjusted: 回调 (code)，改为全量下载的股票在其 on_result 之前调用（调用线程中），
+                     调用方应以新数据替换该股票的全部已存历史
+    
+    Returns:
+        FetchStats 统计信息
+    """
+    stats = FetchStats(len(codes))
+    limiter = AdaptiveLimiter(rate, workers)
+    max_requeue = ADAPTIVE_CONFIG['max_requeue']
+    start = time.monotonic()
+    
+    since = since or {}
+    closes = closes or {}
+    until = last_trading_day()
+    adjusted = set()
+    
+    def task(code: str) -> Optional[pd.DataFrame]:
+        last = since.get(code)
         
-        json_data = response.json()
-        
-        # 解析腾讯返回的数据
-        if not json_data or json_data.get('code') != 0:
-            return None
+        if last:
+            missing = _missing_bars(last, until)
+            if missing < days:
+                with limiter.slot():
+                    df = _fetch_history(code, max(1, missing) + 1, since=last)
+                
+                if not _rebased(df, last, closes.get(code)):
+                    return df[df['date'] > last].reset_index(drop=True) if df is not None else None
+            
+            # 期间除权，或缺口不小于 days（无法校验价格基准，且全量窗口接不上已存历史）：
+            # 下载 days 天全量并替换已存历史
+            adjusted.add(code)
         
-        data = json_data.get('data', {})
-        stock_data = data.get(symbol, {})
-        klines = stock_data.get('qfqday', [])
+        with limiter.slot():
+            return _fetch_history(code, days)
+    
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        pending = {pool.submit(task, code): (code, 0) for code in codes}
         
-        if not klines:
-            return None
+        while pending:
+            future = next(as_completed(pending))
+            code, attempt = pending.pop(future)
+            
+            try:
+                df = future.result()
+            except ThrottledError as e:
+                if attempt < max_requeue:
+                    stats.requeued += 1
+                    pending[pool.submit(task, code)] = (code, attempt + 1)
+                    continue
+                
+                stats.failed += 1
+                stats.errors[code] = f"{type(e).__name__}: {e}"
+                df = None
+            except Exception as e:
+                stats.failed += 1
+                stats.errors[code] = f"{type(e).__name__}: {e}"
+                df = None
+            else:
+                if df is None or df.empty:
+                    stats.empty += 1
+                else:
+                    stats.success += 1
+            
+            if code in adjusted:
+                stats.adjusted.append(code)
+                if on_adjusted and df is not None and not df.empty:
+                    on_adjusted(code)
+            
+            if df is not None and not df.empty and on_result:
+                try:
+                    on_result(code, df)
+                except Exception as e:
+                    stats.success -= 1
+                    stats.failed += 1
+                    stats.errors[code] = f"{type(e).__name__}: {e}"
+            
+            if progress_every and stats.done % progress_every == 0:
+                stats.elapsed = time.monotonic() - start
+                print(f"  进度：{stats.done}/{stats.total} ({stats.done/stats.total*100:.1f}%) - "
+                      f"成功：{stats.success}，失败：{stats.failed}，{stats.throughput:.1f} 只/秒，"
+                      f"限速：{limiter.rate:.1f} 次/秒")
+    
+    stats.limiter = limiter.snapshot()
+    stats.elapsed = time.monotonic() - start
+    return stats
+
+def parse_quote_frame(text: str) -> pd.DataFrame:
+    """
+    将腾讯批量行情返回的整段文本解析为列式 DataFrame
+    
+    整段文本一次正则扫描，字段按列批量转数值，不为每只股票构建 Dict
+    
+    Returns:
+        DataFrame（index 为 code），列见 QUOTE_FIELDS，另含 code / change / change_percent
+    """
+    width = max(QUOTE_FIELDS.values()) + 1
+    codes = []
+    rows = []
+    
+    for code, data_str in _QUOTE_RE.findall(text):
+        fields = data_str.split('~')
         
-        # 转换为 DataFrame
-        # 腾讯格式：[日期，开盘，收盘，最高，最低，成交量]
-        df = pd.DataFrame(klines, columns=['date', 'open', 'close', 'high', 'low', 'volume'])
+        if len(fields) < 30:
+            continue
         
-        # 数据类型转换
-        df['open'] = pd.to_numeric(df['open'], errors='coerce')
-        df['close'] = pd.to_numeric(df['close'], errors='coerce')
-        df['high'] = pd.to_numeric(df['high'], errors='coerce')
-        df['low'] = pd.to_numeric(df['low'], errors='coerce')
-        df['volume'] = pd.to_numeric(df['volume'], errors='coerce')
+        if len(fields) < width:
+            fields.extend([''] * (width - len(fields)))
         
-        # 添加 amount 列（成交额，估算）
-        df['amount'] = df['volume'] * df['close']
+        codes.append(code)
+        rows.append(fields[:width])
+    
+    table = np.array(rows, dtype=object).reshape(len(rows), width)
+    columns = {'code': np.array(codes, dtype=object)}
+    
+    for column, idx in QUOTE_FIELDS.items():
+        values = table[:, idx]
+        if column == 'name':
+            columns[column] = values
+        else:
+            columns[column] = pd.to_numeric(values, errors='coerce').astype(float)
+    
+    df = pd.DataFrame(columns)
+    
+    numeric = [c for c in QUOTE_FIELDS if c != 'name']
+    df[numeric] = df[numeric].fillna(0.0)
+    
+    # 计算涨跌幅
+    prev = df['yesterday_close'].to_numpy()
+    df['change'] = df['price'] - df['yesterday_close']
+    df['change_percent'] = np.divide(
+        df['change'].to_numpy() * 100, prev,
+        out=np.zeros(len(df)), where=prev != 0
+    )
+    
+    return df.set_index('code', drop=False)
+
+def _fetch_quote_batch(symbols: List[str]) -> str:
+    """请求一批实时行情，返回原始文本；非 200 抛出异常以便重试"""
+    url = f"{TENCENT_REALTIME_URL}{','.join(symbols)}"
+    response = http_get(url)
+    _check_throttled(response)
+    
+    if response.status_code != 200:
+        raise requests.HTTPError(f"HTTP {response.status_code}")
+    
+    return response.text
+
+def fetch_quote_frame(codes: List[str], batch_size: Optional[int] = None,
+                      workers: Optional[int] = None, rate: Optional[float] = None,
+                      retries: Optional[int] = None,
+                      burst: Optional[float] = None) -> Tuple[pd.DataFrame, FetchStats]:
+    """
+    并发获取实时行情（列式）
+    
+    多个批次同时在途（受令牌桶限速），每个批次返回后立即解析；
+    单个批次失败只重试该批次，重试耗尽后记入统计，不影响其他批次；
+    限流时自动降速降并发（AdaptiveLimiter），受影响批次重新排队
+    
+    Args:
+        codes: 股票代码列表
+        batch_size / workers / rate / retries / burst: 默认取 QUOTE_CONFIG
+    
+    Returns:
+        (行情 DataFrame（index 为 code，按 codes 顺序）, FetchStats)
+    """
+    batch_size = batch_size or QUOTE_CONFIG['batch_size']
+    workers = workers or QUOTE_CONFIG['workers']
+    rate = rate or QUOTE_CONFIG['rate']
+    retries = QUOTE_CONFIG['retries'] if retries is None else retries
+    burst = burst or QUOTE_CONFIG['burst']
+    
+    symbols = []
+    for code in codes:
+        prefix = 'sh' if code.startswith('6') else 'sz'
+        symbols.append(f"{prefix}{code}")
+    
+    batches = [symbols[i:i+batch_size] for i in range(0, len(symbols), batch_size)]
+    
+    stats = FetchStats(len(codes))
+    limiter = AdaptiveLimiter(rate, workers, burst)
+    max_requeue = ADAPTIVE_CONFIG['max_requeue']
+    frames = []
+    start = time.monotonic()
+    
+    def task(batch: List[str]) -> pd.DataFrame:
+        with limiter.slot():
+            return parse_quote_frame(_fetch_quote_batch(batch))
+    
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        pending = {pool.submit(task, batch): (batch, 0, 0) for batch in batches}
         
-        return df[['date', 'open', 'close', 'high', 'low', 'volume', 'amount']]
+        while pending:
+            future = next(as_completed(pending))
+            batch, attempt, requeued = pending.pop(future)
+            
+            try:
+                frames.append(future.result())
+            except ThrottledError as e:
+                # 限流不消耗重试次数，降速后重新排队
+                if requeued < max_requeue:
+                    stats.requeued += 1
+                    pending[pool.submit(task, batch)] = (batch, attempt, requeued + 1)
+                    continue
+                
+                stats.failed += len(batch)
+                for symbol in batch:
+                    stats.errors[symbol[2:]] = f"{type(e).__name__}: {e}"
+            except Exception as e:
+                if attempt < retries:
+                    pending[pool.submit(task, batch)] = (batch, attempt + 1, requeued)
+                    continue
+                
+                stats.failed += len(batch)
+                for symbol in batch:
+                    stats.errors[symbol[2:]] = f"{type(e).__name__}: {e}"
     
-    except Exception as e:
-        return None
+    frame = pd.concat(frames) if frames else parse_quote_frame('')
+    frame = frame[~frame.index.duplicated()].reindex(
+        [c for c in dict.fromkeys(codes) if c in frame.index]
+    )
+    
+    stats.success = len(frame)
+    stats.empty = stats.total - stats.success - stats.failed
+    stats.limiter = limiter.snapshot()
+    stats.elapsed = time.monotonic() - start
+    
+    return frame, stats
+
+def quote_frame_to_dict(frame: pd.DataFrame) -> Dict[str, Dict]:
+    """行情 DataFrame 转为 Dict[code -> price_info]（兼容逐股接口）"""
+    columns = QUOTE_DICT_COLUMNS
+    values = zip(*(frame[c].tolist() for c in columns))
+    return {row[0]: dict(zip(columns, row)) for row in values}
+
+def fetch_quotes(codes: List[str], **kwargs) -> Tuple[Dict[str, Dict], FetchStats]:
+    """并发获取实时行情，返回 (Dict[code -> price_info], FetchStats)"""
+    frame, stats = fetch_quote_frame(codes, **kwargs)
+    return quote_frame_to_dict(frame), stats
 
 def get_batch_current_prices(codes: List[str]) -> Dict[str, Dict]:
     """
@@ -266,63 +1035,17 @@ def get_batch_current_prices(codes: List[str]) -> Dict[str, Dict]:
     if not codes:
         return {}
     
-    try:
-        # 构建腾讯批量查询 URL
-        symbols = []
-        for code in codes:
-            prefix = 'sh' if code.startswith('6') else 'sz'
-            symbols.append(f"{prefix}{code}")
-        
-        # 腾讯支持一次查询最多 60 只
-        all_results = {}
-        batch_size = 60
-        
-        for i in range(0, len(symbols), batch_size):
-            batch = symbols[i:i+batch_size]
-            url = f"{TENCENT_REALTIME_URL}{','.join(batch)}"
-            
-            response = requests.get(url, timeout=15)
-            
-            if response.status_code == 200:
-                # 解析多行数据
-                lines = response.text.strip().split('\n')
-                
-                for line in lines:
-                    if not line or line == 'Forbidden':
-                        continue
-                    
-                    match = re.search(r'v_(sh|sz)(\d+)="([^"]+)"', line)
-                    if match:
-                        code = match.group(2)
-                        data_str = match.group(3)
-                        fields = data_str.split('~')
-                        
-                        if len(fields) >= 30:
-                            current_price = float(fields[3]) if fields[3] else 0
-                            yesterday_close = float(fields[4]) if fields[4] else 0
-                            
-                            change = current_price - yesterday_close
-                            change_percent = (change / yesterday_close * 100) if yesterday_close else 0
-                            
-                            all_results[code] = {
-                                'code': code,
-                                'name': fields[1],
-                                'price': current_price,
-                                'change': change,
-                                'change_percent': change_percent,
-                                'volume': float(fields[6]) if fields[6] else 0,
-                                'amount': float(fields[47]) if len(fields) > 47 and fields[47] else 0
-                            }
-            
-            # 避免请求过快
-            if i + batch_size < len(symbols):
-                time.sleep(0.1)
-        
-        return all_results
+    results, stats = fetch_quotes(codes)
     
-    except Exception as e:
-        print(f"❌ 批量获取行情失败：{e}")
-        return {}
+    if stats.failed:
+        print(f"⚠️  部分批次获取行情失败：{stats.failed} 只，"
+              f"示例：{next(iter(stats.errors.values()))}")
+    
+    return results
+
+# 离线回放：设置 REPLAY_SERVER_URL 后所有接口指向本地替身服务
+if os.getenv('REPLAY_SERVER_URL'):
+    set_endpoint_base(os.environ['REPLAY_SERVER_URL'])
 
 if __name__ == '__main__':
     # 测试
@@ -4,25 +4,209 @@
 数据库模块 - 存储股票数据和扫描结果
 """
 
+from __future__ import annotations
+
 import sqlite3
-import pandas as pd
+import threading
+import functools
+import json
+import ast
+import re
 from datetime import datetime, timedelta
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Iterator, Tuple
 import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from src.lazy import lazy_import
+from src.metrics import timed
+from src.indicators import (
+    INDICATOR_COLUMNS, INDICATOR_WARMUP, EMA_STATE_COLUMNS, STATE_BARS, VOLUME_STATE_BARS,
+    IndicatorState, compute_indicators
+)
+from src.panel import HistoryPanel
+
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
 
 DB_PATH = os.path.join(os.path.dirname(__file__), '..', 'data', 'stock.db')
 
-def get_connection():
-    """获取数据库连接"""
-    os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
-    conn = sqlite3.connect(DB_PATH)
+# 连接配置
+DB_CONFIG = {
+    'journal_mode': 'WAL',      # 读写并发：写入时读者不阻塞
+    'synchronous': 'NORMAL',    # WAL 下 NORMAL 足够安全，提交不再每次 fsync
+    'cache_size': -65536,       # 页缓存 64MB（负数单位为 KB）
+    'mmap_size': 268435456,     # 内存映射 256MB
+    'temp_store': 'MEMORY',
+    'busy_timeout': 5.0,        # 锁等待秒数
+    'cached_statements': 256,   # 每个连接缓存的预编译语句数
+}
+
+# stock_history.date 存为 YYYYMMDD 整数，对外统一为 'YYYY-MM-DD' 字符串
+def date_text_sql(column: str = 'date') -> str:
+    """整数日期列转 'YYYY-MM-DD' 的 SQL 表达式"""
+    return f"printf('%04d-%02d-%02d', {column} / 10000, {column} / 100 % 100, {column} % 100)"
+
+DATE_TEXT_SQL = date_text_sql()
+
+def date_to_int(date: str) -> int:
+    """'YYYY-MM-DD' -> YYYYMMDD"""
+    return int(str(date).replace('-', ''))
+
+def int_to_date(value: int) -> str:
+    """YYYYMMDD -> 'YYYY-MM-DD'"""
+    value = int(value)
+    return f"{value // 10000:04d}-{value // 100 % 100:02d}-{value % 100:02d}"
+
+# scan_results 中由信号字段提升出来的类型化列：列名 -> (信号键, SQL 类型)
+SIGNAL_COLUMNS = {
+    'signal_type': ('type', 'TEXT'),
+    'rsi': ('rsi', 'REAL'),
+    'distance': ('distance', 'REAL'),
+    'lower': ('lower', 'REAL'),
+    'dif': ('dif', 'REAL'),
+    'dea': ('dea', 'REAL'),
+    'macd': ('macd', 'REAL'),
+    'ma5': ('ma5', 'REAL'),
+    'ma20': ('ma20', 'REAL'),
+    'volume_ratio': ('volume_ratio', 'REAL'),
+}
+
+RESULT_COLUMNS = ['id', 'scan_date', 'strategy_name', 'stock_code', 'stock_name',
+                  'price', 'change_percent', 'signal_info', 'created_at'] + list(SIGNAL_COLUMNS)
+
+# query_scan_results 支持的比较运算
+FILTER_OPS = ('=', '!=', '<', '<=', '>', '>=', 'in', 'like')
+
+# iter_scan_results 每页行数
+RESULT_CHUNK_SIZE = 5000
+
+# stock_history 写入列
+HISTORY_COLUMNS = ['code', 'date', 'open', 'close', 'high', 'low', 'volume', 'amount']
+HISTORY_VALUE_COLUMNS = ['open', 'close', 'high', 'low', 'volume', 'amount']
+
+# 增量计算指标时每只股票读取的 K 线数，新 K 线超出 INDICATOR_WINDOW - INDICATOR_WARMUP 根时整段重算
+INDICATOR_WINDOW = 120
+
+# 指标每批计算的股票数（限制 sliding_window_view 临时数组大小）
+INDICATOR_CHUNK = 500
+
+# indicator_state 表的 EMA 列：最后一根、前一根 K 线处的值
+STATE_EMA_COLUMNS = EMA_STATE_COLUMNS + [f'prev_{c}' for c in EMA_STATE_COLUMNS]
+
+_local = threading.local()
+_inherited = []
+
+def _open_connection(path: str) -> sqlite3.Connection:
+    """新建连接并设置 PRAGMA"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    conn = sqlite3.connect(
+        path,
+        timeout=DB_CONFIG['busy_timeout'],
+        cached_statements=DB_CONFIG['cached_statements']
+    )
+    
+    conn.execute(f"PRAGMA journal_mode={DB_CONFIG['journal_mode']}")
+    conn.execute(f"PRAGMA synchronous={DB_CONFIG['synchronous']}")
+    conn.execute(f"PRAGMA cache_size={int(DB_CONFIG['cache_size'])}")
+    conn.execute(f"PRAGMA mmap_size={int(DB_CONFIG['mmap_size'])}")
+    conn.execute(f"PRAGMA temp_store={DB_CONFIG['temp_store']}")
+    
     return conn
 
+def get_connection() -> sqlite3.Connection:
+    """
+    获取数据库连接
+    
+    每个线程（每个进程）复用一个长连接，不要关闭返回的连接；
+    DB_PATH 变化或 fork 后自动新建
+    """
+    key = (os.path.abspath(DB_PATH), os.getpid())
+    
+    if getattr(_local, 'key', None) != key:
+        close_connection()
+        _local.conn = _open_connection(DB_PATH)
+        _local.key = key
+    
+    return _local.conn
+
+def close_connection():
+    """关闭当前线程的长连接（线程 / 进程退出前调用）"""
+    conn = getattr(_local, 'conn', None)
+    
+    if conn is not None:
+        if getattr(_local, 'key', (None, None))[1] == os.getpid():
+            conn.close()
+        else:
+            # fork 继承来的父进程连接：子进程里关闭（包括被回收时隐式关闭）会破坏父进程的锁和 WAL，
+            # 只保留引用、永不使用
+            _inherited.append(conn)
+    
+    _local.conn = None
+    _local.key = None
+
+def _rollback_on_error(func):
+    """写入函数异常时回滚长连接上未提交的事务，避免残留写入被后续提交"""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        try:
+            return func(*args, **kwargs)
+        except BaseException:
+            conn = getattr(_local, 'conn', None)
+            if conn is not None and conn.in_transaction:
+                conn.rollback()
+            raise
+    
+    return wrapper
+
+@_rollback_on_error
 def init_db():
-    """初始化数据库表"""
+    """初始化数据库表（按 MIGRATIONS 顺序升级到最新结构版本）"""
     conn = get_connection()
     cursor = conn.cursor()
     
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.commit()
+    
+    current = get_schema_version()
+    
+    # 未记录版本但已有表的旧库，从 v1 开始升级
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'stock_history'")
+    existing = cursor.fetchone() is not None
+    
+    for version, migrate in MIGRATIONS:
+        if version <= current:
+            continue
+        
+        # 每个版本在一个事务内完成，失败整体回滚
+        cursor.execute('BEGIN')
+        migrate(cursor)
+        cursor.execute('INSERT INTO schema_version (version) VALUES (?)', (version,))
+        conn.commit()
+        
+        if existing:
+            print(f"🗄️  数据库结构升级到 v{version}")
+    
+    # 旧库重建 stock_history 后回收空间
+    if existing and current < 2:
+        cursor.execute('VACUUM')
+    
+    print("✅ 数据库初始化完成")
+
+def get_schema_version() -> int:
+    """当前数据库结构版本（0 表示未记录版本的旧库或新库）"""
+    cursor = get_connection().cursor()
+    cursor.execute('SELECT MAX(version) FROM schema_version')
+    return cursor.fetchone()[0] or 0
+
+def _migrate_v1(cursor: sqlite3.Cursor):
+    """v1：初始表结构"""
     # 股票基本信息表
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS stocks (
@@ -82,61 +266,268 @@ def init_db():
     cursor.execute('CREATE INDEX IF NOT EXISTS idx_results_date ON scan_results(scan_date)')
     cursor.execute('CREATE INDEX IF NOT EXISTS idx_results_strategy ON scan_results(strategy_name)')
     
-    conn.commit()
-    conn.close()
-    print("✅ 数据库初始化完成")
+    # 扫描结果按 (日期, 策略, 代码) 去重：首次建唯一索引前清理旧版本重复保存的行
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'idx_results_unique'")
+    if cursor.fetchone() is None:
+        cursor.execute('''
+            DELETE FROM scan_results WHERE id NOT IN (
+                SELECT MAX(id) FROM scan_results
+                GROUP BY scan_date, strategy_name, stock_code
+            )
+        ''')
+        cursor.execute('''
+            CREATE UNIQUE INDEX idx_results_unique
+            ON scan_results(scan_date, strategy_name, stock_code)
+        ''')
 
+def _migrate_v2(cursor: sqlite3.Cursor):
+    """
+    v2：stock_history 改为以 (code, date) 聚簇的 WITHOUT ROWID 表，日期存为 YYYYMMDD 整数
+    
+    去掉自增 id、UNIQUE 约束和 idx_history_code_date 三份重复存储
+    """
+    cursor.execute('''
+        CREATE TABLE stock_history_v2 (
+            code TEXT NOT NULL,
+            date INTEGER NOT NULL,
+            open REAL,
+            close REAL,
+            high REAL,
+            low REAL,
+            volume REAL,
+            amount REAL,
+            PRIMARY KEY (code, date)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+        INSERT OR REPLACE INTO stock_history_v2
+        (code, date, open, close, high, low, volume, amount)
+        SELECT code, CAST(REPLACE(date, '-', '') AS INTEGER), open, close, high, low, volume, amount
+        FROM stock_history
+        ORDER BY code, date
+    ''')
+    cursor.execute('DROP TABLE stock_history')
+    cursor.execute('ALTER TABLE stock_history_v2 RENAME TO stock_history')
+
+def _migrate_v3(cursor: sqlite3.Cursor):
+    """
+    v3：scan_results.signal_info 改存 JSON，常用数值字段提升为类型化列
+    
+    旧行的 signal_info 是 Python repr，逐行解析后回填；(scan_date, ...) 唯一索引已覆盖按日期查询，
+    单列日期索引删除，策略索引改为 (strategy_name, scan_date)
+    """
+    for column, (_, sql_type) in SIGNAL_COLUMNS.items():
+        cursor.execute(f'ALTER TABLE scan_results ADD COLUMN {column} {sql_type}')
+    
+    cursor.execute("SELECT id, signal_info FROM scan_results WHERE signal_info IS NOT NULL AND signal_info != ''")
+    rows = []
+    
+    for row_id, text in cursor.fetchall():
+        try:
+            signal = ast.literal_eval(text)
+        except (ValueError, SyntaxError):
+            signal = {'description': text}
+        
+        rows.append(_signal_row(signal if isinstance(signal, dict) else {'description': text}) + (row_id,))
+    
+    assignments = ', '.join(f'{column} = ?' for column in SIGNAL_COLUMNS)
+    cursor.executemany(f'UPDATE scan_results SET signal_info = ?, {assignments} WHERE id = ?', rows)
+    
+    cursor.execute('DROP INDEX IF EXISTS idx_results_date')
+    cursor.execute('DROP INDEX IF EXISTS idx_results_strategy')
+    cursor.execute('CREATE INDEX idx_results_strategy ON scan_results(strategy_name, scan_date)')
+
+def _migrate_v4(cursor: sqlite3.Cursor):
+    """v4：按 (code, date) 持久化的技术指标表，数据由 update_indicators 填充"""
+    columns = ''.join(f'\n            {c} REAL,' for c in INDICATOR_COLUMNS)
+    cursor.execute(f'''
+        CREATE TABLE stock_indicators (
+            code TEXT NOT NULL,
+            date INTEGER NOT NULL,{columns}
+            PRIMARY KEY (code, date)
+        ) WITHOUT ROWID
+    ''')
+
+def _migrate_v5(cursor: sqlite3.Cursor):
+    """v5：每只股票一行的指标递推状态（IndicatorState），数据由 update_indicators 维护"""
+    columns = ''.join(f'\n            {c} REAL,' for c in STATE_EMA_COLUMNS)
+    cursor.execute(f'''
+        CREATE TABLE indicator_state (
+            code TEXT PRIMARY KEY,
+            date INTEGER NOT NULL,{columns}
+            closes BLOB NOT NULL,
+            volumes BLOB NOT NULL
+        ) WITHOUT ROWID
+    ''')
+
+def _migrate_v6(cursor: sqlite3.Cursor):
+    """v6：iter_scan_results 按 id 键集分页，(scan_date, strategy_name, id) 索引使按日期 + 策略查询的分页免排序"""
+    cursor.execute('CREATE INDEX idx_results_date_strategy_id ON scan_results(scan_date, strategy_name, id)')
+
+# 结构迁移（版本号, 函数），只追加不修改
+MIGRATIONS = [
+    (1, _migrate_v1),
+    (2, _migrate_v2),
+    (3, _migrate_v3),
+    (4, _migrate_v4),
+    (5, _migrate_v5),
+    (6, _migrate_v6),
+]
+
+@_rollback_on_error
 def save_stocks(stocks: List[Dict]):
-    """保存股票列表"""
+    """保存股票列表（单事务批量写入）"""
     conn = get_connection()
     cursor = conn.cursor()
+    now = datetime.now()
     
-    for stock in stocks:
-        cursor.execute('''
-            INSERT OR REPLACE INTO stocks (code, name, market, sector, updated_at)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (
+    cursor.executemany('''
+        INSERT OR REPLACE INTO stocks (code, name, market, sector, updated_at)
+        VALUES (?, ?, ?, ?, ?)
+    ''', [
+        (
             stock['code'],
             stock['name'],
             stock.get('market', 'A 股'),
             stock.get('sector', ''),
-            datetime.now()
-        ))
+            now
+        )
+        for stock in stocks
+    ])
     
     conn.commit()
-    conn.close()
     print(f"✅ 保存 {len(stocks)} 只股票信息")
 
-def save_history(code: str, history: List[Dict]):
-    """保存股票历史行情"""
+@_rollback_on_error
+def delete_stocks(codes: List[str]):
+    """删除股票（退市）"""
     conn = get_connection()
     cursor = conn.cursor()
     
-    for bar in history:
-        cursor.execute('''
-            INSERT OR REPLACE INTO stock_history 
-            (code, date, open, close, high, low, volume, amount)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            code,
-            bar['date'],
-            bar.get('open', 0),
-            bar['close'],
-            bar.get('high', 0),
-            bar.get('low', 0),
-            bar.get('volume', 0),
-            bar.get('amount', 0)
-        ))
+    cursor.executemany('DELETE FROM stocks WHERE code = ?', [(c,) for c in codes])
+    
+    conn.commit()
+    print(f"✅ 删除 {len(codes)} 只退市股票")
+
+@timed('db')
+def sync_stocks(stocks: List[Dict], max_removed_ratio: float = 0.05) -> Dict[str, int]:
+    """
+    与数据库中的股票列表比对，只写入变化部分
+    
+    新上市和改名（如戴帽摘帽）的股票经 save_stocks 写入，退市的删除；
+    退市比例超过 max_removed_ratio 时视为列表不完整，不做删除
+    
+    Returns:
+        {'added': n, 'changed': n, 'removed': n}
+    """
+    existing = {s['code']: s for s in get_stock_list()}
+    incoming = {s['code']: s for s in stocks if s.get('code')}
+    
+    added = [s for code, s in incoming.items() if code not in existing]
+    changed = [
+        s for code, s in incoming.items()
+        if code in existing and (
+            s['name'] != existing[code]['name'] or
+            s.get('market', 'A 股') != existing[code]['market']
+        )
+    ]
+    removed = [code for code in existing if code not in incoming]
+    
+    if added or changed:
+        save_stocks(added + changed)
+    
+    if removed and existing and len(removed) / len(existing) > max_removed_ratio:
+        print(f"⚠️  {len(removed)} 只股票不在新列表中，比例过高，疑似列表不完整，跳过删除")
+        removed = []
+    elif removed:
+        delete_stocks(removed)
+    
+    return {'added': len(added), 'changed': len(changed), 'removed': len(removed)}
+
+def save_history(code: str, history):
+    """
+    保存单只股票历史行情
+    
+    Args:
+        code: 股票代码
+        history: DataFrame 或 List[Dict]（date, open, close, high, low, volume, amount）
+    """
+    df = history.copy() if isinstance(history, pd.DataFrame) else pd.DataFrame(history)
+    df['code'] = code
+    save_history_frame(df)
+
+@timed('db')
+@_rollback_on_error
+def save_history_frame(df: pd.DataFrame, indicators: bool = True,
+                       replace: Optional[List[str]] = None) -> int:
+    """
+    批量保存多只股票的历史行情（单事务 executemany）
+    
+    写入日期及之后的已有指标作废，indicators=True 时随后增量补算这些股票的指标
+    
+    Args:
+        df: 含 code, date（'YYYY-MM-DD'）, close 列，open / high / low / volume / amount 缺失按 0 处理
+        indicators: 是否同步更新 stock_indicators
+        replace: 先删除这些股票的全部已存行情、指标和递推状态，以 df 中的数据替换
+                 （除权后前复权价格整体变化，旧 K 线不能与新数据拼接）
+    
+    Returns:
+        写入行数
+    """
+    if df is None or df.empty:
+        return 0
+    
+    rows = df.reindex(columns=HISTORY_COLUMNS)
+    rows[HISTORY_VALUE_COLUMNS] = rows[HISTORY_VALUE_COLUMNS].astype(float).fillna(0.0)
+    rows['code'] = rows['code'].astype(str)
+    rows['date'] = rows['date'].astype(str).str.replace('-', '', regex=False).str[:8].astype('int64')
+    
+    conn = get_connection()
+    cursor = conn.cursor()
+    written = set(rows['code'])
+    replace = [c for c in replace or [] if c in written]
+    
+    if replace:
+        cursor.executemany('DELETE FROM stock_history WHERE code = ?', [(c,) for c in replace])
+    
+    cursor.executemany('''
+        INSERT OR REPLACE INTO stock_history 
+        (code, date, open, close, high, low, volume, amount)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ''', rows.itertuples(index=False, name=None))
+    
+    # 改写了的日期之后的指标都要重算（替换的股票全部重算）
+    first_dates = rows.groupby('code')['date'].min()
+    first_dates[replace] = 0
+    cursor.executemany(
+        'DELETE FROM stock_indicators WHERE code = ? AND date >= ?',
+        first_dates.items()
+    )
+    cursor.executemany(
+        'DELETE FROM indicator_state WHERE code = ? AND date >= ?',
+        first_dates.items()
+    )
     
     conn.commit()
-    conn.close()
+    
+    if indicators:
+        update_indicators(first_dates.index.tolist())
+    
+    return len(rows)
 
-def get_history(code: str, days: int = 60) -> Optional[pd.DataFrame]:
-    """获取股票历史行情"""
+@timed('db')
+def get_history(code: str, days: int = 60,
+                columns: Optional[List[str]] = None) -> Optional[pd.DataFrame]:
+    """获取股票历史行情（columns 限定读取的行情列，默认全部）"""
     conn = get_connection()
+    columns = columns or HISTORY_VALUE_COLUMNS
+    unknown = [c for c in columns if c not in HISTORY_VALUE_COLUMNS]
     
-    query = '''
-        SELECT date, open, close, high, low, volume, amount
+    if unknown:
+        raise ValueError(f"未知行情列: {', '.join(unknown)}")
+    
+    query = f'''
+        SELECT {DATE_TEXT_SQL} AS date, {', '.join(columns)}
         FROM stock_history
         WHERE code = ?
         ORDER BY date DESC
@@ -144,7 +535,6 @@ def get_history(code: str, days: int = 60) -> Optional[pd.DataFrame]:
     '''
     
     df = pd.read_sql_query(query, conn, params=(code, days))
-    conn.close()
     
     if df.empty:
         return None
@@ -153,52 +543,653 @@ def get_history(code: str, days: int = 60) -> Optional[pd.DataFrame]:
     df = df.iloc[::-1].reset_index(drop=True)
     return df
 
+def _codes_source(codes: List[str]) -> Tuple[str, List[str]]:
+    """
+    代码列表 -> (代码子查询, 参数)，用于连接查询（只查给定股票、不扫描其他股票）
+    
+    代码以一个 JSON 数组参数传入、由 json_each 展开，不受 SQL 参数个数上限限制；
+    只读，不写临时表，也不影响调用方的事务
+    """
+    return '(SELECT DISTINCT value AS code FROM json_each(?))', [json.dumps(list(codes))]
+
+@timed('db')
+def get_history_panel(codes: Optional[List[str]] = None, days: Optional[int] = 60,
+                      columns: Optional[List[str]] = None) -> pd.DataFrame:
+    """
+    一次查询获取多只股票最近 N 根 K 线
+    
+    每只股票先取第 days 新的 K 线日期作为下界，再沿 (code, date) 主键做范围扫描，
+    不排序、不扫描更早的历史
+    
+    Args:
+        codes: 股票代码列表，None 为全部
+        days: 每只股票 K 线数，None 为全部历史
+        columns: 数值列，默认全部行情列；可包含 INDICATOR_COLUMNS，从 stock_indicators 关联读取
+                 （尚未计算的为 NaN）
+    
+    Returns:
+        (code, date) MultiIndex DataFrame，按代码、日期升序
+    """
+    conn = get_connection()
+    columns = columns or HISTORY_VALUE_COLUMNS
+    select = ', '.join(
+        ['h.code', f"{date_text_sql('h.date')} AS date"]
+        + [f'i.{c}' if c in INDICATOR_COLUMNS else f'h.{c}' for c in columns]
+    )
+    source = '(SELECT DISTINCT code FROM stock_history)'
+    params = []
+    indicator_join = ''
+    
+    if any(c in INDICATOR_COLUMNS for c in columns):
+        indicator_join = 'LEFT JOIN stock_indicators i ON i.code = h.code AND i.date = h.date'
+    
+    if codes is not None:
+        source, params = _codes_source(codes)
+    
+    cutoff = ''
+    if days is not None:
+        params.append(days - 1)
+        cutoff = '''AND h.date >= COALESCE((
+            SELECT s.date FROM stock_history s WHERE s.code = c.code
+            ORDER BY s.date DESC LIMIT 1 OFFSET ?
+        ), 0)'''
+    
+    # CROSS JOIN 固定代码表为外层循环，每只股票一次主键范围查找
+    query = f'''
+        SELECT {select}
+        FROM {source} c
+        CROSS JOIN stock_history h ON h.code = c.code {cutoff}
+        {indicator_join}
+        ORDER BY c.code, h.date
+    '''
+    
+    df = pd.read_sql_query(query, conn, params=params)
+    
+    return df.set_index(['code', 'date'])
+
+def _stale_indicator_codes(codes: Optional[List[str]] = None) -> List[str]:
+    """指标最新日期落后于行情最新日期（或还没有指标）的股票"""
+    conn = get_connection()
+    
+    if codes is None:
+        rows = conn.execute('''
+            SELECT h.code FROM
+                (SELECT code, MAX(date) AS last FROM stock_history GROUP BY code) h
+            LEFT JOIN
+                (SELECT code, MAX(date) AS last FROM stock_indicators GROUP BY code) i
+            USING (code)
+            WHERE i.last IS NULL OR i.last < h.last
+            ORDER BY h.code
+        ''').fetchall()
+        return [r[0] for r in rows]
+    
+    # 只查给定股票：每只股票两次主键末端查找，代价与全表大小无关
+    source, params = _codes_source(codes)
+    rows = conn.execute(f'''
+        SELECT code FROM (
+            SELECT c.code,
+                (SELECT MAX(h.date) FROM stock_history h WHERE h.code = c.code) AS last,
+                (SELECT MAX(i.date) FROM stock_indicators i WHERE i.code = c.code) AS done
+            FROM {source} c
+        )
+        WHERE last IS NOT NULL AND (done IS NULL OR done < last)
+        ORDER BY code
+    ''', params).fetchall()
+    return [r[0] for r in rows]
+
+def _indicator_state(codes: List[str]) -> pd.DataFrame:
+    """每只股票最后一行指标的日期和 EMA 递推状态，按 code 索引"""
+    conn = get_connection()
+    placeholders = ', '.join(['?'] * len(codes))
+    
+    return pd.read_sql_query(f'''
+        SELECT i.code, {date_text_sql('i.date')} AS date, {', '.join('i.' + c for c in EMA_STATE_COLUMNS)}
+        FROM stock_indicators i
+        JOIN (
+            SELECT code, MAX(date) AS last FROM stock_indicators
+            WHERE code IN ({placeholders}) GROUP BY code
+        ) m ON i.code = m.code AND i.date = m.last
+    ''', conn, params=codes).set_index('code')
+
+def _indicator_rows(panel: HistoryPanel, values: Dict[str, np.ndarray],
+                    keep: np.ndarray) -> pd.DataFrame:
+    """把 keep 为 True 的 (股票, K 线) 位置的指标展开为长表"""
+    row, col = np.nonzero(keep)
+    dates = pd.DatetimeIndex(panel.dates[row, col])
+    
+    frame = pd.DataFrame({
+        'code': np.asarray(panel.codes, dtype=object)[row],
+        'date': dates.year * 10000 + dates.month * 100 + dates.day,
+    })
+    for name in INDICATOR_COLUMNS:
+        frame[name] = values[name][row, col]
+    
+    return frame
+
+def _compute_indicator_chunk(codes: List[str]) -> pd.DataFrame:
+    """
+    计算一批股票尚未入库的指标
+    
+    已有指标的股票只读最近 INDICATOR_WINDOW 根 K 线，从上次的 EMA 状态接着算；
+    没有指标、或上次位置之前不足 INDICATOR_WARMUP 根的股票读全部历史重算
+    """
+    state = _indicator_state(codes)
+    window = HistoryPanel.from_frame(
+        get_history_panel(codes, INDICATOR_WINDOW, ['close', 'volume']),
+        INDICATOR_WINDOW, ['close', 'volume']
+    )
+    
+    # 上次算到的 K 线在窗口中的列号
+    last = state.reindex(window.codes)
+    last_dates = pd.to_datetime(last['date']).to_numpy().astype('datetime64[D]')
+    match = window.dates == last_dates[:, None]
+    anchor = np.where(match.any(axis=1), match.argmax(axis=1), -1)
+    
+    first = window.n_bars - window.lengths
+    incremental = (anchor >= 0) & ((anchor - first >= INDICATOR_WARMUP - 1) | (first > 0))
+    
+    frames = []
+    
+    if incremental.any():
+        part = window.select([c for c, ok in zip(window.codes, incremental) if ok])
+        part_anchor = anchor[incremental]
+        values = compute_indicators(
+            part.field('close'), part.field('volume'), part_anchor,
+            {c: last[c].to_numpy(dtype=float)[incremental] for c in EMA_STATE_COLUMNS}
+        )
+        keep = np.arange(part.n_bars)[None, :] > part_anchor[:, None]
+        frames.append(_indicator_rows(part, values, keep))
+    
+    full_codes = [c for c, ok in zip(window.codes, incremental) if not ok]
+    
+    if full_codes:
+        full = HistoryPanel.from_frame(get_history_panel(full_codes, None, ['close', 'volume']),
+                                       None, ['close', 'volume'])
+        values = compute_indicators(full.field('close'), full.field('volume'))
+        keep = np.arange(full.n_bars)[None, :] >= (full.n_bars - full.lengths)[:, None]
+        frames.append(_indicator_rows(full, values, keep))
+    
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+@timed('db')
+@_rollback_on_error
+def update_indicators(codes: Optional[List[str]] = None, chunk_size: int = INDICATOR_CHUNK) -> int:
+    """
+    增量更新 stock_indicators：只计算指标落后于行情的股票、只写入新 K 线对应的行；
+    随后把 indicator_state 中的递推状态推进到行情最新日期
+    
+    Args:
+        codes: 限定股票范围，None 为全部
+        chunk_size: 每批股票数
+    
+    Returns:
+        写入行数
+    """
+    stale = _stale_indicator_codes(codes)
+    conn = get_connection()
+    written = 0
+    
+    for start in range(0, len(stale), chunk_size):
+        frame = _compute_indicator_chunk(stale[start:start + chunk_size])
+        
+        if frame.empty:
+            continue
+        
+        conn.executemany(f'''
+            INSERT OR REPLACE INTO stock_indicators
+            (code, date, {', '.join(INDICATOR_COLUMNS)})
+            VALUES ({', '.join(['?'] * (2 + len(INDICATOR_COLUMNS)))})
+        ''', frame.itertuples(index=False, name=None))
+        conn.commit()
+        
+        written += len(frame)
+    
+    _update_indicator_state(codes)
+    
+    return written
+
+@timed('db')
+def load_indicator_state(codes: Optional[List[str]] = None) -> IndicatorState:
+    """读取持久化的指标递推状态；给定 codes 时只读这些股票、按其顺序对齐，没有状态的股票为空行"""
+    conn = get_connection()
+    source = 'indicator_state'
+    params = []
+    
+    if codes is not None:
+        codes_source, params = _codes_source(codes)
+        source = f"{codes_source} c JOIN indicator_state USING (code)"
+    
+    rows = conn.execute(f'''
+        SELECT code, date, {', '.join(STATE_EMA_COLUMNS)}, closes, volumes
+        FROM {source}
+        ORDER BY code
+    ''', params).fetchall()
+    
+    state = IndicatorState.empty([r[0] for r in rows])
+    
+    if rows:
+        n = len(EMA_STATE_COLUMNS)
+        ema = np.array([r[2:2 + 2 * n] for r in rows], dtype=float)
+        
+        state.dates[:] = [r[1] for r in rows]
+        for k, c in enumerate(EMA_STATE_COLUMNS):
+            state.ema[c] = ema[:, k]
+            state.prev_ema[c] = ema[:, n + k]
+        
+        state.closes[:] = np.frombuffer(b''.join(r[-2] for r in rows), dtype=np.float64).reshape(-1, STATE_BARS)
+        state.volumes[:] = np.frombuffer(b''.join(r[-1] for r in rows), dtype=np.float64).reshape(-1, VOLUME_STATE_BARS)
+    
+    return state if codes is None else state.select(codes)
+
+def _save_indicator_state(state: IndicatorState):
+    """写入有状态（date > 0）的股票"""
+    conn = get_connection()
+    columns = [state.ema[c] for c in EMA_STATE_COLUMNS] + [state.prev_ema[c] for c in EMA_STATE_COLUMNS]
+    
+    conn.executemany(f'''
+        INSERT OR REPLACE INTO indicator_state
+        (code, date, {', '.join(STATE_EMA_COLUMNS)}, closes, volumes)
+        VALUES ({', '.join(['?'] * (4 + len(STATE_EMA_COLUMNS)))})
+    ''', (
+        (code, int(state.dates[i]), *(float(v[i]) for v in columns),
+         state.closes[i].tobytes(), state.volumes[i].tobytes())
+        for i, code in enumerate(state.codes) if state.dates[i] > 0
+    ))
+    conn.commit()
+
+def _build_indicator_state(codes: List[str]) -> IndicatorState:
+    """由 stock_indicators 最后两行的 EMA 和最近 STATE_BARS 根行情建立状态"""
+    columns = ['close', 'volume'] + EMA_STATE_COLUMNS
+    panel = HistoryPanel.from_frame(get_history_panel(codes, STATE_BARS, columns), STATE_BARS, columns)
+    state = IndicatorState.empty(panel.codes)
+    
+    last = pd.DatetimeIndex(panel.dates[:, -1])
+    state.dates[:] = last.year * 10000 + last.month * 100 + last.day
+    state.closes[:] = panel.field('close')
+    state.volumes[:] = panel.field('volume')[:, -VOLUME_STATE_BARS:]
+    
+    for c in EMA_STATE_COLUMNS:
+        state.ema[c] = panel.field(c)[:, -1].copy()
+        state.prev_ema[c] = panel.field(c)[:, -2].copy()
+    
+    return state
+
+def _step_indicator_state(codes: List[str]) -> IndicatorState:
+    """已有状态的股票逐根追加其后入库的 K 线，每根 K 线每只股票递推一步"""
+    state = load_indicator_state(codes)
+    conn = get_connection()
+    
+    source, params = _codes_source(codes)
+    
+    # 固定代码表为外层循环，每只股票沿 (code, date) 主键只扫描状态之后的 K 线
+    bars = pd.read_sql_query(f'''
+        SELECT s.code, h.date, h.close, h.volume
+        FROM {source} c
+        CROSS JOIN indicator_state s ON s.code = c.code
+        CROSS JOIN stock_history h ON h.code = s.code AND h.date > s.date
+        ORDER BY s.code, h.date
+    ''', conn, params=params)
+    
+    row = pd.Index(state.codes).get_indexer(bars['code'])
+    rank = bars.groupby('code').cumcount().to_numpy()
+    
+    # 第 k 次递推处理每只股票的第 k 根新 K 线
+    for k in range(int(rank.max()) + 1 if len(rank) else 0):
+        pick = rank == k
+        rows = np.zeros(len(state), dtype=bool)
+        rows[row[pick]] = True
+        
+        values = {}
+        for name in ('date', 'close', 'volume'):
+            values[name] = np.zeros(len(state), dtype=bars[name].dtype)
+            values[name][row[pick]] = bars[name].to_numpy()[pick]
+        
+        state.append(values['close'], values['volume'], values['date'], rows)
+    
+    return state
+
+def _update_indicator_state(codes: Optional[List[str]] = None) -> int:
+    """
+    把指标递推状态推进到行情最新日期（在 stock_indicators 更新之后调用）
+    
+    已有状态的股票只递推新 K 线；没有状态（新股票、历史被改写后作废）的由 stock_indicators 建立
+    
+    Returns:
+        更新的股票数
+    """
+    conn = get_connection()
+    source = '(SELECT DISTINCT code FROM stock_history)'
+    params = []
+    
+    if codes is not None:
+        source, params = _codes_source(codes)
+    
+    # 每只股票一次主键末端查找最新 K 线日期
+    stale = conn.execute(f'''
+        SELECT code, has_state FROM (
+            SELECT c.code, s.date IS NOT NULL AS has_state, s.date AS done,
+                (SELECT MAX(h.date) FROM stock_history h WHERE h.code = c.code) AS last
+            FROM {source} c
+            LEFT JOIN indicator_state s ON s.code = c.code
+        )
+        WHERE last IS NOT NULL AND (done IS NULL OR done < last)
+        ORDER BY code
+    ''', params).fetchall()
+    
+    stepped = [code for code, has_state in stale if has_state]
+    built = [code for code, has_state in stale if not has_state]
+    
+    if stepped:
+        _save_indicator_state(_step_indicator_state(stepped))
+    
+    for start in range(0, len(built), INDICATOR_CHUNK):
+        _save_indicator_state(_build_indicator_state(built[start:start + INDICATOR_CHUNK]))
+    
+    return len(stale)
+
+def get_indicators(code: str, days: int = 60,
+                   columns: Optional[List[str]] = None) -> Optional[pd.DataFrame]:
+    """获取单只股票最近 days 根 K 线的指标（date 正序）"""
+    columns = columns or INDICATOR_COLUMNS
+    unknown = [c for c in columns if c not in INDICATOR_COLUMNS]
+    
+    if unknown:
+        raise ValueError(f"未知指标: {', '.join(unknown)}")
+    
+    df = pd.read_sql_query(f'''
+        SELECT {DATE_TEXT_SQL} AS date, {', '.join(columns)}
+        FROM stock_indicators
+        WHERE code = ?
+        ORDER BY date DESC
+        LIMIT ?
+    ''', get_connection(), params=(code, days))
+    
+    if df.empty:
+        return None
+    
+    return df.iloc[::-1].reset_index(drop=True)
+
 def save_scan_result(scan_date: str, strategy: str, results: List[Dict]):
     """保存扫描结果"""
+    save_scan_results(scan_date, {strategy: results})
+
+@timed('db')
+@_rollback_on_error
+def save_scan_results(scan_date: str, results: Dict[str, List[Dict]]):
+    """
+    批量保存多个策略的扫描结果（单事务）
+    
+    同一 (scan_date, strategy_name, stock_code) 重复保存时覆盖，重跑不产生重复行
+    """
     conn = get_connection()
     cursor = conn.cursor()
     
-    for r in results:
-        cursor.execute('''
-            INSERT INTO scan_results 
-            (scan_date, strategy_name, stock_code, stock_name, price, change_percent, signal_info)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        ''', (
+    signal_columns = list(SIGNAL_COLUMNS)
+    updates = ''.join(f',\n            {c} = excluded.{c}' for c in signal_columns)
+    
+    cursor.executemany(f'''
+        INSERT INTO scan_results 
+        (scan_date, strategy_name, stock_code, stock_name, price, change_percent,
+         signal_info, {', '.join(signal_columns)})
+        VALUES ({', '.join(['?'] * (7 + len(signal_columns)))})
+        ON CONFLICT (scan_date, strategy_name, stock_code) DO UPDATE SET
+            stock_name = excluded.stock_name,
+            price = excluded.price,
+            change_percent = excluded.change_percent,
+            signal_info = excluded.signal_info,
+            created_at = CURRENT_TIMESTAMP{updates}
+    ''', [
+        (
             scan_date,
             strategy,
             r['code'],
             r['name'],
             r.get('price', 0),
             r.get('change_percent', 0),
-            str(r.get('signal', ''))
-        ))
+        ) + _signal_row(r.get('signal'))
+        for strategy, stocks in results.items()
+        for r in stocks
+    ])
     
     conn.commit()
-    conn.close()
-    print(f"✅ 保存 {len(results)} 条扫描结果 ({strategy})")
+    
+    for strategy, stocks in results.items():
+        if stocks:
+            print(f"✅ 保存 {len(stocks)} 条扫描结果 ({strategy})")
 
-def get_scan_results(date: str = None, strategy: str = None) -> pd.DataFrame:
-    """获取扫描结果"""
-    conn = get_connection()
+def _json_default(value):
+    # numpy 标量等
+    if hasattr(value, 'item'):
+        return value.item()
+    return str(value)
+
+def _signal_row(signal) -> tuple:
+    """信号 dict -> (signal_info JSON, 各类型化列的值)"""
+    if not signal:
+        return (None,) + (None,) * len(SIGNAL_COLUMNS)
+    
+    if not isinstance(signal, dict):
+        signal = {'description': str(signal)}
+    
+    values = []
+    for key, sql_type in SIGNAL_COLUMNS.values():
+        value = signal.get(key)
+        
+        if sql_type == 'REAL':
+            try:
+                value = float(value) if value is not None else None
+            except (TypeError, ValueError):
+                value = None
+        
+        values.append(value)
     
-    query = 'SELECT * FROM scan_results WHERE 1=1'
+    return (json.dumps(signal, ensure_ascii=False, default=_json_default),) + tuple(values)
+
+_SIGNAL_KEY_RE = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+
+def _result_column(name: str) -> str:
+    """
+    查询条件 / 排序中的列名转为 SQL 表达式
+    
+    scan_results 的列直接使用；其他名称视为 signal_info 中的键，用 json_extract 读取
+    """
+    if name in RESULT_COLUMNS:
+        return name
+    
+    key = name[len('signal.'):] if name.startswith('signal.') else name
+    
+    if not _SIGNAL_KEY_RE.match(key):
+        raise ValueError(f"非法的查询字段: {name}")
+    
+    return f"json_extract(signal_info, '$.{key}')"
+
+def _result_conditions(date: str = None, strategy: str = None,
+                       codes: Optional[List[str]] = None,
+                       filters: Optional[List[tuple]] = None) -> tuple:
+    """查询条件 -> (WHERE 子句列表, 参数列表)"""
+    conditions = []
     params = []
     
     if date:
-        query += ' AND scan_date = ?'
+        conditions.append('scan_date = ?')
         params.append(date)
     
     if strategy:
-        query += ' AND strategy_name = ?'
+        conditions.append('strategy_name = ?')
         params.append(strategy)
     
-    query += ' ORDER BY created_at DESC'
+    if codes is not None:
+        filters = list(filters or []) + [('stock_code', 'in', list(codes))]
     
-    df = pd.read_sql_query(query, conn, params=params)
-    conn.close()
+    for name, op, value in filters or []:
+        op = op.lower()
+        
+        if op not in FILTER_OPS:
+            raise ValueError(f"不支持的运算符: {op}")
+        
+        if op == 'in':
+            values = list(value)
+            if not values:
+                conditions.append('0')
+                continue
+            conditions.append(f"{_result_column(name)} IN ({', '.join(['?'] * len(values))})")
+            params.extend(values)
+        else:
+            conditions.append(f'{_result_column(name)} {op.upper()} ?')
+            params.append(value)
     
-    return df
+    return conditions, params
+
+def _result_select(columns: Optional[List[str]]) -> str:
+    if not columns:
+        return '*'
+    return ', '.join(c if c in RESULT_COLUMNS else f'{_result_column(c)} AS "{c}"' for c in columns)
+
+@timed('db')
+def query_scan_results(date: str = None, strategy: str = None,
+                       codes: Optional[List[str]] = None,
+                       filters: Optional[List[tuple]] = None,
+                       order_by: Optional[List[str]] = None,
+                       limit: Optional[int] = None,
+                       columns: Optional[List[str]] = None) -> pd.DataFrame:
+    """
+    按条件查询扫描结果，过滤、排序、截断都在 SQL 中完成
+    
+    Args:
+        date: 扫描日期
+        strategy: 策略名
+        codes: 股票代码列表
+        filters: [(字段, 运算符, 值)]，运算符见 FILTER_OPS；字段可为 scan_results 列
+                 （含 rsi / distance / dif 等类型化信号列）或 signal_info 中的任意键
+        order_by: 排序字段列表，前缀 '-' 为降序，默认按 created_at 降序
+        limit: 最多返回行数
+        columns: 返回列，默认全部
+    
+    Returns:
+        DataFrame
+    
+    Example:
+        query_scan_results('2024-03-01', filters=[('rsi', '<', 25)], order_by=['rsi'])
+    """
+    query, params = _result_query(date, strategy, codes, filters, order_by, limit, columns)
+    return pd.read_sql_query(query, get_connection(), params=params)
+
+@timed('db')
+def fetch_scan_results(date: str = None, strategy: str = None,
+                       codes: Optional[List[str]] = None,
+                       filters: Optional[List[tuple]] = None,
+                       order_by: Optional[List[str]] = None,
+                       limit: Optional[int] = None,
+                       columns: Optional[List[str]] = None) -> List[Dict]:
+    """
+    同 query_scan_results，返回 dict 列表，不依赖 pandas（run.py results 等命令行查询用）
+    """
+    query, params = _result_query(date, strategy, codes, filters, order_by, limit, columns)
+    cursor = get_connection().execute(query, params)
+    names = [d[0] for d in cursor.description]
+    return [dict(zip(names, row)) for row in cursor.fetchall()]
 
+def _result_query(date: str = None, strategy: str = None,
+                  codes: Optional[List[str]] = None,
+                  filters: Optional[List[tuple]] = None,
+                  order_by: Optional[List[str]] = None,
+                  limit: Optional[int] = None,
+                  columns: Optional[List[str]] = None) -> tuple:
+    """query_scan_results 的查询 -> (SQL, 参数列表)"""
+    conditions, params = _result_conditions(date, strategy, codes, filters)
+    
+    orders = []
+    for name in order_by or ['-created_at']:
+        desc = name.startswith('-')
+        orders.append(f"{_result_column(name.lstrip('-'))} {'DESC' if desc else 'ASC'}")
+    
+    query = f'SELECT {_result_select(columns)} FROM scan_results'
+    if conditions:
+        query += ' WHERE ' + ' AND '.join(conditions)
+    query += ' ORDER BY ' + ', '.join(orders)
+    
+    if limit is not None:
+        query += ' LIMIT ?'
+        params.append(int(limit))
+    
+    return query, params
+
+def iter_scan_results(date: str = None, strategy: str = None,
+                      codes: Optional[List[str]] = None,
+                      filters: Optional[List[tuple]] = None,
+                      columns: Optional[List[str]] = None,
+                      chunk_size: int = RESULT_CHUNK_SIZE,
+                      descending: bool = True) -> Iterator[pd.DataFrame]:
+    """
+    分块读取扫描结果，内存占用与结果总量无关
+    
+    按 id 键集分页（WHERE id < 上一页最后 id），每页一次独立查询，不使用 OFFSET，
+    也不在两页之间持有读事务；同时给定 date 和 strategy 时沿 idx_results_date_strategy_id
+    索引顺序读取，每页不排序
+    
+    Args:
+        date / strategy / codes / filters: 同 query_scan_results
+        columns: 返回列，默认全部
+        chunk_size: 每块行数
+        descending: True 为最新写入的在前
+    
+    Yields:
+        每块一个 DataFrame
+    """
+    conditions, params = _result_conditions(date, strategy, codes, filters)
+    keep_id = not columns or 'id' in columns
+    select = _result_select(columns if keep_id else ['id'] + list(columns))
+    order, compare = ('DESC', '<') if descending else ('ASC', '>')
+    last_id = None
+    
+    while True:
+        where = list(conditions)
+        page_params = list(params)
+        
+        if last_id is not None:
+            where.append(f'id {compare} ?')
+            page_params.append(last_id)
+        
+        query = f'SELECT {select} FROM scan_results'
+        if where:
+            query += ' WHERE ' + ' AND '.join(where)
+        query += f' ORDER BY id {order} LIMIT ?'
+        
+        chunk = pd.read_sql_query(query, get_connection(), params=page_params + [int(chunk_size)])
+        
+        if chunk.empty:
+            return
+        
+        last_id = int(chunk['id'].iloc[-1])
+        yield chunk if keep_id else chunk.drop(columns='id')
+        
+        if len(chunk) < chunk_size:
+            return
+
+def export_scan_results(path: str, **query) -> int:
+    """
+    按 iter_scan_results 的条件分块导出为 CSV
+    
+    Returns:
+        导出行数
+    """
+    total = 0
+    
+    for chunk in iter_scan_results(**query):
+        chunk.to_csv(path, mode='a' if total else 'w', header=not total, index=False)
+        total += len(chunk)
+    
+    return total
+
+def get_scan_results(date: str = None, strategy: str = None) -> pd.DataFrame:
+    """获取扫描结果"""
+    return query_scan_results(date, strategy)
+
+def parse_signal(signal_info: Optional[str]) -> Optional[Dict]:
+    """signal_info JSON -> dict"""
+    return json.loads(signal_info) if signal_info else None
+
+@_rollback_on_error
 def save_push_record(scan_date: str, platform: str, status: str, message: str = ''):
     """保存推送记录"""
     conn = get_connection()
@@ -210,8 +1201,8 @@ def save_push_record(scan_date: str, platform: str, status: str, message: str =
     ''', (scan_date, platform, status, message))
     
     conn.commit()
-    conn.close()
 
+@timed('db')
 def get_stock_list() -> List[Dict]:
     """获取股票列表"""
     conn = get_connection()
@@ -219,13 +1210,46 @@ def get_stock_list() -> List[Dict]:
     
     cursor.execute('SELECT code, name, market, sector FROM stocks')
     rows = cursor.fetchall()
-    conn.close()
     
     return [
         {'code': r[0], 'name': r[1], 'market': r[2], 'sector': r[3]}
         for r in rows
     ]
 
+@timed('db')
+def read_history(since: Optional[str] = None, columns: Optional[List[str]] = None) -> pd.DataFrame:
+    """读取全部股票 since（含）之后的历史行情长表，按日期、代码排序"""
+    columns = columns or HISTORY_VALUE_COLUMNS
+    query = f"SELECT code, {DATE_TEXT_SQL} AS date, {', '.join(columns)} FROM stock_history"
+    params = ()
+    
+    if since:
+        query += ' WHERE date >= ?'
+        params = (date_to_int(since),)
+    
+    return pd.read_sql_query(query + ' ORDER BY 2, 1', get_connection(), params=params)
+
+@timed('db')
+def get_last_dates() -> Dict[str, str]:
+    """一次查询获取所有股票最后一根 K 线的日期"""
+    conn = get_connection()
+    cursor = conn.cursor()
+    
+    cursor.execute('SELECT code, MAX(date) FROM stock_history GROUP BY code')
+    rows = cursor.fetchall()
+    
+    return {r[0]: int_to_date(r[1]) for r in rows if r[1]}
+
+@timed('db')
+def get_last_closes() -> Dict[str, float]:
+    """一次查询获取所有股票最后一根 K 线的收盘价（增量下载时核对复权基准）"""
+    conn = get_connection()
+    
+    # SQLite 中与 MAX() 同查的裸列取自最大值所在行
+    rows = conn.execute('SELECT code, MAX(date), close FROM stock_history GROUP BY code').fetchall()
+    
+    return {r[0]: r[2] for r in rows if r[1]}
+
 def needs_update(code: str, max_age_days: int = 1) -> bool:
     """检查股票数据是否需要更新"""
     conn = get_connection()
@@ -236,12 +1260,11 @@ def needs_update(code: str, max_age_days: int = 1) -> bool:
     ''', (code,))
     
     result = cursor.fetchone()[0]
-    conn.close()
     
     if not result:
         return True
     
-    last_date = datetime.strptime(result, '%Y-%m-%d')
+    last_date = datetime.strptime(str(result), '%Y%m%d')
     age = datetime.now() - last_date
     
     return age.days >= max_age_days
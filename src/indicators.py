@@ -0,0 +1,555 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+技术指标 - 按股票批量计算的常用指标（持久化到 stock_indicators）
+
+输入为 HistoryPanel 式的 (n_codes, n_bars) 右对齐数组，左侧不足部分为 NaN；
+口径与策略中的 pandas 写法一致（rolling 均值 / 样本标准差、ewm adjust=False、
+RSI 为 14 日简单均值）
+"""
+
+from __future__ import annotations
+
+from typing import Dict, List, Optional, Callable, Any
+
+from src.lazy import lazy_import
+
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+
+# 指标列（stock_indicators 表列名，也是 history DataFrame 中的列名）
+INDICATOR_COLUMNS = [
+    'ma5', 'ma10', 'ma20', 'ma60',
+    'boll_upper', 'boll_lower',
+    'ema12', 'ema26', 'dif', 'dea', 'macd',
+    'rsi14',
+    'vol_ma5',
+]
+
+# 计算新 K 线所需的最少前置 K 线数（最长窗口 ma60）
+INDICATOR_WARMUP = 60
+
+# 增量计算时需要延续的递推状态
+EMA_STATE_COLUMNS = ['ema12', 'ema26', 'dea']
+
+def rolling_mean(x: np.ndarray, window: int) -> np.ndarray:
+    """沿最后一维的滚动均值，窗口内有 NaN 或不足 window 时为 NaN"""
+    out = np.full(x.shape, np.nan)
+    if x.shape[-1] >= window:
+        out[..., window - 1:] = np.lib.stride_tricks.sliding_window_view(x, window, axis=-1).mean(axis=-1)
+    return out
+
+def rolling_std(x: np.ndarray, window: int) -> np.ndarray:
+    """沿最后一维的滚动样本标准差（ddof=1）"""
+    out = np.full(x.shape, np.nan)
+    if x.shape[-1] >= window:
+        out[..., window - 1:] = np.lib.stride_tricks.sliding_window_view(x, window, axis=-1).std(axis=-1, ddof=1)
+    return out
+
+def ema(x: np.ndarray, span: int, anchor: Optional[np.ndarray] = None,
+        seed: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    指数移动平均（同 pandas ewm(span, adjust=False)，以第一根有效值为初值）
+    
+    Args:
+        x: (n_codes, n_bars)
+        span: 周期
+        anchor: (n_codes,) 已知状态所在的列号，-1 表示没有
+        seed: (n_codes,) anchor 处的已知 EMA 值，其后从该值继续递推
+    """
+    alpha = 2.0 / (span + 1)
+    out = np.full(x.shape, np.nan)
+    prev = np.full(x.shape[0], np.nan)
+    
+    for t in range(x.shape[1]):
+        value = x[:, t]
+        cur = np.where(np.isnan(prev), value, alpha * value + (1 - alpha) * prev)
+        
+        if seed is not None:
+            cur = np.where(anchor == t, seed, cur)
+        
+        out[:, t] = cur
+        prev = cur
+    
+    return out
+
+def rsi(close: np.ndarray, window: int = 14) -> np.ndarray:
+    """RSI（涨跌幅的简单滚动均值）"""
+    delta = np.full(close.shape, np.nan)
+    delta[:, 1:] = close[:, 1:] - close[:, :-1]
+    
+    # pandas 写法中首根 K 线的 NaN 涨跌按 0 计入窗口
+    valid = ~np.isnan(close)
+    delta = np.where(valid & np.isnan(delta), 0.0, delta)
+    
+    gain = np.where(valid, np.where(delta > 0, delta, 0.0), np.nan)
+    loss = np.where(valid, np.where(delta < 0, -delta, 0.0), np.nan)
+    
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rs = rolling_mean(gain, window) / rolling_mean(loss, window)
+        return 100 - 100 / (1 + rs)
+
+def compute_indicators(close: np.ndarray, volume: np.ndarray,
+                       anchor: Optional[np.ndarray] = None,
+                       state: Optional[Dict[str, np.ndarray]] = None) -> Dict[str, np.ndarray]:
+    """
+    计算全部指标
+    
+    Args:
+        close / volume: (n_codes, n_bars) 右对齐数组
+        anchor: (n_codes,) 增量计算时上次已算到的列号，-1 表示从头计算
+        state: anchor 处的 EMA_STATE_COLUMNS 值，每项 (n_codes,)
+    
+    Returns:
+        {指标名: (n_codes, n_bars)}；增量计算时只有 anchor 之后的列有意义
+    """
+    if anchor is None:
+        anchor = np.full(close.shape[0], -1)
+        state = {}
+    
+    ma20 = rolling_mean(close, 20)
+    std20 = rolling_std(close, 20)
+    
+    ema12 = ema(close, 12, anchor, state.get('ema12'))
+    ema26 = ema(close, 26, anchor, state.get('ema26'))
+    dif = ema12 - ema26
+    dea = ema(dif, 9, anchor, state.get('dea'))
+    
+    return {
+        'ma5': rolling_mean(close, 5),
+        'ma10': rolling_mean(close, 10),
+        'ma20': ma20,
+        'ma60': rolling_mean(close, 60),
+        'boll_upper': ma20 + 2 * std20,
+        'boll_lower': ma20 - 2 * std20,
+        'ema12': ema12,
+        'ema26': ema26,
+        'dif': dif,
+        'dea': dea,
+        'macd': (dif - dea) * 2,
+        'rsi14': rsi(close, 14),
+        'vol_ma5': rolling_mean(volume, 5),
+    }
+
+# 递推状态保存的 K 线数：最长窗口 ma60 再加一根，用于回看前一根 K 线的指标
+STATE_BARS = INDICATOR_WARMUP + 1
+VOLUME_STATE_BARS = 6
+
+def _ema_step(prev: np.ndarray, value: np.ndarray, span: int) -> np.ndarray:
+    """EMA 递推一步（prev 为 NaN 时以 value 为初值，同 ema()）"""
+    alpha = 2.0 / (span + 1)
+    return np.where(np.isnan(prev), value, alpha * value + (1 - alpha) * prev)
+
+def _window_mean(x: np.ndarray, window: int) -> np.ndarray:
+    return x[:, -window:].mean(axis=1)
+
+class IndicatorState:
+    """
+    按股票持久化的指标递推状态（indicator_state 表，由 database.update_indicator_state 维护）
+    
+    EMA 类指标保存最后一根及前一根 K 线的递推值，滚动窗口类指标保存最近 STATE_BARS 根收盘价
+    （成交量 VOLUME_STATE_BARS 根）；新 K 线或实时行情到来时每只股票只递推一步，
+    代价与历史长短无关，EMA 与全历史计算的结果一致
+    
+    Attributes:
+        codes: 股票代码列表
+        dates: (n,) 最后一根 K 线日期 YYYYMMDD，0 表示没有状态
+        closes / volumes: (n, STATE_BARS) / (n, VOLUME_STATE_BARS) 右对齐，左侧不足为 NaN
+        ema / prev_ema: {EMA_STATE_COLUMNS: (n,)}，最后一根 / 前一根 K 线处的值
+    """
+    
+    def __init__(self, codes: List[str], dates: np.ndarray, closes: np.ndarray,
+                 volumes: np.ndarray, ema: Dict[str, np.ndarray], prev_ema: Dict[str, np.ndarray]):
+        self.codes = list(codes)
+        self.dates = dates
+        self.closes = closes
+        self.volumes = volumes
+        self.ema = ema
+        self.prev_ema = prev_ema
+        self._index = {code: i for i, code in enumerate(self.codes)}
+    
+    @classmethod
+    def empty(cls, codes: List[str]) -> 'IndicatorState':
+        n = len(codes)
+        return cls(
+            codes, np.zeros(n, dtype=np.int64),
+            np.full((n, STATE_BARS), np.nan), np.full((n, VOLUME_STATE_BARS), np.nan),
+            {c: np.full(n, np.nan) for c in EMA_STATE_COLUMNS},
+            {c: np.full(n, np.nan) for c in EMA_STATE_COLUMNS},
+        )
+    
+    def __len__(self) -> int:
+        return len(self.codes)
+    
+    def select(self, codes: List[str]) -> 'IndicatorState':
+        """按 codes 顺序取子集（复制），没有状态的股票为空行"""
+        rows = np.array([self._index.get(c, -1) for c in codes], dtype=np.int64)
+        found = rows >= 0
+        out = IndicatorState.empty(codes)
+        
+        out.dates[found] = self.dates[rows[found]]
+        out.closes[found] = self.closes[rows[found]]
+        out.volumes[found] = self.volumes[rows[found]]
+        for c in EMA_STATE_COLUMNS:
+            out.ema[c][found] = self.ema[c][rows[found]]
+            out.prev_ema[c][found] = self.prev_ema[c][rows[found]]
+        
+        return out
+    
+    @classmethod
+    def from_panel(cls, panel, indicators: Optional['PanelIndicators'] = None) -> 'IndicatorState':
+        """
+        由面板已加载的 K 线建立状态（没有可用持久化状态的股票用，实时行情照样按一步递推并入）
+        
+        EMA 取面板的值（有预计算列时用列，否则按已加载的 K 线计算），滚动窗口只含已加载的 K 线
+        """
+        ind = indicators if indicators is not None else PanelIndicators(panel)
+        state = cls.empty(panel.codes)
+        bars = min(panel.n_bars, STATE_BARS)
+        
+        if bars == 0:
+            return state
+        
+        last = pd.to_numeric(pd.DatetimeIndex(panel.dates[:, -1]).strftime('%Y%m%d'), errors='coerce')
+        state.dates[:] = np.nan_to_num(np.asarray(last, dtype=float)).astype(np.int64)
+        state.closes[:, -bars:] = panel.field('close')[:, -bars:]
+        
+        if 'volume' in panel.fields:
+            volume_bars = min(bars, VOLUME_STATE_BARS)
+            state.volumes[:, -volume_bars:] = panel.field('volume')[:, -volume_bars:]
+        
+        for c, values in (('ema12', ind.ema(12)), ('ema26', ind.ema(26)), ('dea', ind.dea())):
+            state.ema[c] = values[:, -1].copy()
+            if bars > 1:
+                state.prev_ema[c] = values[:, -2].copy()
+        
+        return state
+    
+    def copy(self) -> 'IndicatorState':
+        return self.select(self.codes)
+    
+    def assign(self, other: 'IndicatorState', rows: np.ndarray):
+        """rows 为 True 的股票改用 other 同一行的状态（other 的 codes 与本状态相同，原地修改）"""
+        self.dates[rows] = other.dates[rows]
+        self.closes[rows] = other.closes[rows]
+        self.volumes[rows] = other.volumes[rows]
+        for c in EMA_STATE_COLUMNS:
+            self.ema[c][rows] = other.ema[c][rows]
+            self.prev_ema[c][rows] = other.prev_ema[c][rows]
+    
+    def clear(self, rows: np.ndarray):
+        """清空 rows 为 True 的股票的状态（原地修改）"""
+        self.dates[rows] = 0
+        self.closes[rows] = np.nan
+        self.volumes[rows] = np.nan
+        for c in EMA_STATE_COLUMNS:
+            self.ema[c][rows] = np.nan
+            self.prev_ema[c][rows] = np.nan
+    
+    @staticmethod
+    def _step(prev: Dict[str, np.ndarray], close: np.ndarray) -> Dict[str, np.ndarray]:
+        ema12 = _ema_step(prev['ema12'], close, 12)
+        ema26 = _ema_step(prev['ema26'], close, 26)
+        return {'ema12': ema12, 'ema26': ema26, 'dea': _ema_step(prev['dea'], ema12 - ema26, 9)}
+    
+    def append(self, close: np.ndarray, volume: np.ndarray, dates: np.ndarray,
+               rows: Optional[np.ndarray] = None):
+        """rows 为 True 的股票追加一根新 K 线（原地修改）"""
+        rows = np.ones(len(self), dtype=bool) if rows is None else rows
+        stepped = self._step(self.ema, close)
+        
+        for c in EMA_STATE_COLUMNS:
+            self.prev_ema[c] = np.where(rows, self.ema[c], self.prev_ema[c])
+            self.ema[c] = np.where(rows, stepped[c], self.ema[c])
+        
+        self.closes[rows] = np.column_stack([self.closes[rows, 1:], close[rows]])
+        self.volumes[rows] = np.column_stack([self.volumes[rows, 1:], volume[rows]])
+        self.dates[rows] = dates[rows]
+    
+    def replace(self, close: np.ndarray, volume: np.ndarray, rows: np.ndarray):
+        """rows 为 True 的股票改写最后一根 K 线（盘中同一交易日的行情更新，原地修改）"""
+        stepped = self._step(self.prev_ema, close)
+        
+        for c in EMA_STATE_COLUMNS:
+            self.ema[c] = np.where(rows, stepped[c], self.ema[c])
+        
+        self.closes[rows, -1] = close[rows]
+        self.volumes[rows, -1] = volume[rows]
+    
+    def with_quote(self, price: np.ndarray, pre_close: np.ndarray,
+                   volume: np.ndarray) -> 'IndicatorState':
+        """
+        把实时行情当作最新一根 K 线后的状态（复制，不影响持久化的状态）
+        
+        按昨收判断行情属于哪根 K 线（相差不到半个最小价位 0.01 视为相等）：等于最后一根收盘价时
+        追加新 K 线，等于前一根收盘价时改写最后一根（行情日已入库）；都不匹配、两者都匹配
+        （最后两根收盘价相同，无法判断）或价格缺失的股票保持不变
+        """
+        out = self.copy()
+        valid = (price > 0) & (out.dates > 0)
+        
+        after_last = valid & np.isclose(pre_close, out.closes[:, -1], rtol=0, atol=0.005)
+        on_last = valid & np.isclose(pre_close, out.closes[:, -2], rtol=0, atol=0.005)
+        
+        out.replace(price, volume, on_last & ~after_last)
+        out.append(price, volume, out.dates, after_last & ~on_last)
+        return out
+    
+    def values(self, back: int = 0) -> Dict[str, np.ndarray]:
+        """
+        最后一根（back=1 为前一根）K 线的全部指标，每项 (n,)
+        
+        口径同 compute_indicators；没有状态或 K 线不足窗口的股票为 NaN
+        """
+        closes = self.closes[:, :self.closes.shape[1] - back]
+        volumes = self.volumes[:, :self.volumes.shape[1] - back]
+        ema = self.ema if back == 0 else self.prev_ema
+        
+        ma20 = _window_mean(closes, 20)
+        std20 = closes[:, -20:].std(axis=1, ddof=1)
+        dif = ema['ema12'] - ema['ema26']
+        
+        return {
+            'ma5': _window_mean(closes, 5),
+            'ma10': _window_mean(closes, 10),
+            'ma20': ma20,
+            'ma60': _window_mean(closes, 60),
+            'boll_upper': ma20 + 2 * std20,
+            'boll_lower': ma20 - 2 * std20,
+            'ema12': ema['ema12'],
+            'ema26': ema['ema26'],
+            'dif': dif,
+            'dea': ema['dea'],
+            'macd': (dif - ema['dea']) * 2,
+            'rsi14': rsi(closes[:, -16:], 14)[:, -1],
+            'vol_ma5': _window_mean(volumes, 5),
+        }
+    
+    def latest(self) -> List[Dict[str, np.ndarray]]:
+        """[最后一根, 前一根] K 线的指标，供 IndicatorCache 的视图按 last() 取用"""
+        return [self.values(0), self.values(1)]
+
+def live_row(live: Optional[List[Dict[str, np.ndarray]]], i: int) -> Optional[List[Dict[str, float]]]:
+    """IndicatorState.latest() 中第 i 只股票的值（供 HistoryIndicators 使用）"""
+    if live is None:
+        return None
+    return [{name: values[i] for name, values in snapshot.items()} for snapshot in live]
+
+class IndicatorCache:
+    """
+    一次扫描内的指标备忘录：(code, 指标, 参数) -> 计算结果
+    
+    多个策略用到同一只股票的同一指标时只计算一次；面板扫描时 code 为 None，
+    一次计算覆盖全部股票
+    """
+    
+    def __init__(self):
+        self._store = {}
+        self.hits = 0
+        self.misses = 0
+        self.stored = 0
+    
+    def get(self, code: Optional[str], name: str, params: tuple, compute: Callable[[], Any]) -> Any:
+        entries = self._store.setdefault(code, {})
+        key = (name, params)
+        
+        if key in entries:
+            self.hits += 1
+            return entries[key]
+        
+        self.misses += 1
+        value = entries[key] = compute()
+        return value
+    
+    def release(self, code: Optional[str]):
+        """丢弃某只股票的缓存（逐股扫描时扫完一只即可释放）"""
+        self._store.pop(code, None)
+    
+    def for_history(self, code: str, history: pd.DataFrame,
+                    live: Optional[List[Dict[str, float]]] = None) -> 'HistoryIndicators':
+        return HistoryIndicators(history, code, self, live)
+    
+    def for_panel(self, panel, live: Optional[List[Dict[str, np.ndarray]]] = None) -> 'PanelIndicators':
+        return PanelIndicators(panel, self, live)
+    
+    def stats(self) -> Dict[str, int]:
+        return {'hits': self.hits, 'misses': self.misses, 'stored': self.stored}
+    
+    def summary(self) -> str:
+        total = self.hits + self.misses
+        rate = self.hits / total * 100 if total else 0.0
+        return f"指标缓存：命中 {self.hits}，计算 {self.misses}（命中率 {rate:.1f}%），取自指标表 {self.stored}"
+
+# 指标方法与 stock_indicators 列的对应：(方法, 参数) -> 列名
+STORED_INDICATORS = {
+    ('ma', (5, 'close')): 'ma5',
+    ('ma', (10, 'close')): 'ma10',
+    ('ma', (20, 'close')): 'ma20',
+    ('ma', (60, 'close')): 'ma60',
+    ('ma', (5, 'volume')): 'vol_ma5',
+    ('ema', (12, 'close')): 'ema12',
+    ('ema', (26, 'close')): 'ema26',
+    ('dif', (12, 26)): 'dif',
+    ('dea', (12, 26, 9)): 'dea',
+    ('macd', (12, 26, 9)): 'macd',
+    ('boll_upper', (20, 2)): 'boll_upper',
+    ('boll_lower', (20, 2)): 'boll_lower',
+    ('rsi', (14,)): 'rsi14',
+}
+
+# 列名 -> (方法, 参数)
+STORED_METHODS = {column: key for key, column in STORED_INDICATORS.items()}
+
+class _Indicators:
+    """HistoryIndicators / PanelIndicators 共用的指标定义，子类提供计算原语"""
+    
+    def __init__(self, code: Optional[str], cache: Optional[IndicatorCache], live=None):
+        self.code = code
+        self.cache = cache
+        self.live = live
+    
+    def _get(self, name: str, params: tuple, compute: Callable[[], Any]) -> Any:
+        column = STORED_INDICATORS.get((name, params))
+        
+        if column is not None:
+            stored = self._stored(column, compute if self.cache is None else
+                                  lambda: self.cache.get(self.code, name, params, compute))
+            if stored is not None:
+                return stored
+        
+        if self.cache is None:
+            return compute()
+        return self.cache.get(self.code, name, params, compute)
+    
+    def ma(self, window: int, field: str = 'close'):
+        return self._get('ma', (window, field), lambda: self._rolling_mean(self.field(field), window))
+    
+    def std(self, window: int, field: str = 'close'):
+        return self._get('std', (window, field), lambda: self._rolling_std(self.field(field), window))
+    
+    def ema(self, span: int, field: str = 'close'):
+        return self._get('ema', (span, field), lambda: self._ema(self.field(field), span))
+    
+    def dif(self, fast: int = 12, slow: int = 26):
+        return self._get('dif', (fast, slow), lambda: self.ema(fast) - self.ema(slow))
+    
+    def dea(self, fast: int = 12, slow: int = 26, signal: int = 9):
+        return self._get('dea', (fast, slow, signal), lambda: self._ema(self.dif(fast, slow), signal))
+    
+    def macd(self, fast: int = 12, slow: int = 26, signal: int = 9):
+        return self._get('macd', (fast, slow, signal),
+                         lambda: (self.dif(fast, slow) - self.dea(fast, slow, signal)) * 2)
+    
+    def boll_upper(self, window: int = 20, k: float = 2):
+        return self._get('boll_upper', (window, k), lambda: self.ma(window) + k * self.std(window))
+    
+    def boll_lower(self, window: int = 20, k: float = 2):
+        return self._get('boll_lower', (window, k), lambda: self.ma(window) - k * self.std(window))
+    
+    def rsi(self, window: int = 14):
+        return self._get('rsi', (window,), lambda: self._rsi(self.field('close'), window))
+    
+    def last(self, name: str, back: int = 0):
+        """
+        最后一根（back=1 为前一根）K 线的指标值，name 为 INDICATOR_COLUMNS 中的列名
+        
+        扫描器为声明 stateful 的策略传入递推状态（每只股票都已按同一规则并入实时行情，
+        见 scanner.live_indicators）时取状态值，K 线不足窗口为 NaN；否则取序列中的值
+        """
+        if self.live is not None:
+            return self.live[back][name]
+        
+        method, params = STORED_METHODS[name]
+        return self._at(getattr(self, method)(*params), back)
+
+class HistoryIndicators(_Indicators):
+    """
+    单只股票的指标（pd.Series，与 history 行对齐）
+    
+    history 带有预计算列（stock_indicators）时直接使用，否则计算并记入 cache
+    """
+    
+    def __init__(self, history: pd.DataFrame, code: Optional[str] = None,
+                 cache: Optional[IndicatorCache] = None,
+                 live: Optional[List[Dict[str, float]]] = None):
+        super().__init__(code, cache, live)
+        self.history = history
+    
+    def field(self, name: str) -> pd.Series:
+        return self.history[name]
+    
+    def _stored(self, column: str, compute: Callable[[], pd.Series]) -> Optional[pd.Series]:
+        series = self.history.get(column)
+        
+        if series is None or pd.isna(series.iloc[-1]):
+            return None
+        
+        if self.cache is not None:
+            self.cache.stored += 1
+        return series
+    
+    @staticmethod
+    def _at(series: pd.Series, back: int) -> float:
+        return series.iloc[-1 - back]
+    
+    @staticmethod
+    def _rolling_mean(series: pd.Series, window: int) -> pd.Series:
+        return series.rolling(window).mean()
+    
+    @staticmethod
+    def _rolling_std(series: pd.Series, window: int) -> pd.Series:
+        return series.rolling(window).std()
+    
+    @staticmethod
+    def _ema(series: pd.Series, span: int) -> pd.Series:
+        return series.ewm(span=span, adjust=False).mean()
+    
+    @staticmethod
+    def _rsi(close: pd.Series, window: int) -> pd.Series:
+        delta = close.diff()
+        gain = delta.where(delta > 0, 0).rolling(window).mean()
+        loss = -delta.where(delta < 0, 0).rolling(window).mean()
+        rs = gain / loss
+        return 100 - (100 / (1 + rs))
+
+class PanelIndicators(_Indicators):
+    """
+    全市场面板的指标（(n_codes, n_bars) 数组）
+    
+    面板带有预计算列时直接使用，最后一根缺失的股票用计算结果补上
+    """
+    
+    def __init__(self, panel, cache: Optional[IndicatorCache] = None,
+                 live: Optional[List[Dict[str, np.ndarray]]] = None):
+        super().__init__(None, cache, live)
+        self.panel = panel
+    
+    def field(self, name: str) -> np.ndarray:
+        return self.panel.field(name)
+    
+    def _stored(self, column: str, compute: Callable[[], np.ndarray]) -> Optional[np.ndarray]:
+        if column not in self.panel.fields:
+            return None
+        
+        values = self.panel.field(column)
+        missing = np.isnan(values[:, -1]) & (self.panel.lengths > 0)
+        
+        if missing.any():
+            values = values.copy()
+            values[missing] = compute()[missing]
+        
+        if self.cache is not None:
+            self.cache.stored += 1
+        return values
+    
+    @staticmethod
+    def _at(values: np.ndarray, back: int) -> np.ndarray:
+        return values[:, -1 - back]
+    
+    _rolling_mean = staticmethod(rolling_mean)
+    _rolling_std = staticmethod(rolling_std)
+    _rsi = staticmethod(rsi)
+    
+    @staticmethod
+    def _ema(x: np.ndarray, span: int) -> np.ndarray:
+        return ema(x, span)
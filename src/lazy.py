@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+延迟导入 - numpy / pandas / requests 等重依赖在第一次访问属性时才真正加载
+
+run.py 的 list / results 等命令不需要这些依赖，启动只需几十毫秒；
+扫描、回测等路径第一次用到 np.xxx / pd.xxx 时自动加载，行为与直接 import 一致
+"""
+
+import importlib.util
+import sys
+from types import ModuleType
+from typing import List, Iterable
+
+# run.py --timing 报告的重依赖
+HEAVY_MODULES = ['numpy', 'pandas', 'requests']
+
+# lazy_import 创建的代理：模块名 -> 代理的类型（第一次访问属性后模块换回普通模块类型）
+_proxy_types = {}
+
+def lazy_import(name: str) -> ModuleType:
+    """
+    返回模块 name 的延迟加载代理（已加载时直接返回模块）
+    
+    注意：from xxx import yyy 会立刻访问属性而加载模块，使用方只能写 xxx.yyy；
+    类型注解中的 pd.DataFrame 等需要 from __future__ import annotations
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ModuleNotFoundError(f"No module named '{name}'", name=name)
+    
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    _proxy_types[name] = type(module)
+    
+    return module
+
+def is_loaded(name: str) -> bool:
+    """模块是否已真正执行（延迟代理尚未被访问时为 False）"""
+    module = sys.modules.get(name)
+    if module is None:
+        return False
+    
+    proxy = _proxy_types.get(name)
+    return proxy is None or type(module) is not proxy
+
+def loaded_modules(names: Iterable[str] = HEAVY_MODULES) -> List[str]:
+    """names 中已真正加载的模块"""
+    return [name for name in names if is_loaded(name)]
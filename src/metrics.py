@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+运行指标 - 各阶段耗时、策略耗时 / 调用次数 / 异常、数据库操作耗时、HTTP 请求延迟分位数
+
+全局 METRICS 在一次运行（run.py scan、常驻进程的一次任务）开始时清零，结束时 report()
+得到可 JSON 序列化的运行报告；profile() 可选地用 cProfile 采集整次运行写入文件
+"""
+
+import cProfile
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, List, Optional, Any, Callable
+
+# 每个接口最多保留的延迟样本数（超出后不再记录样本，只计次数）
+LATENCY_SAMPLES = 100000
+
+# 报告中的延迟分位数
+PERCENTILES = (50, 90, 99)
+
+def percentile(values: List[float], p: float) -> float:
+    """已排序样本的 p 分位数（线性插值）"""
+    if not values:
+        return 0.0
+    
+    k = (len(values) - 1) * p / 100
+    lo = int(k)
+    hi = min(lo + 1, len(values) - 1)
+    return values[lo] + (values[hi] - values[lo]) * (k - lo)
+
+class RunMetrics:
+    """
+    一次运行的指标（线程安全）
+    
+    计时按 (分组, 名称) 累计调用次数、总耗时、最长一次：分组为 stage（阶段）、strategy（策略）、
+    db（数据库操作，含嵌套调用）；HTTP 请求按接口记录延迟样本
+    """
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+    
+    def reset(self):
+        """清零，开始新的一次运行"""
+        with self._lock:
+            self.started = datetime.now()
+            self._started = time.perf_counter()
+            self.timers = {}     # 分组 -> 名称 -> {'calls', 'seconds', 'max'}
+            self.errors = {}     # 分组 -> 名称 -> {'count', 'last'}
+            self.latencies = {}  # 接口 -> [秒]
+            self.requests = {}   # 接口 -> {'requests', 'errors'}
+            self.counters = {}
+    
+    def add(self, section: str, name: str, seconds: float, calls: int = 1):
+        """累计一次（或 calls 次合计）耗时"""
+        with self._lock:
+            timer = self.timers.setdefault(section, {}).setdefault(
+                name, {'calls': 0, 'seconds': 0.0, 'max': 0.0}
+            )
+            timer['calls'] += calls
+            timer['seconds'] += seconds
+            timer['max'] = max(timer['max'], seconds / calls if calls else seconds)
+    
+    @contextmanager
+    def timer(self, section: str, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(section, name, time.perf_counter() - started)
+    
+    def stage(self, name: str):
+        """阶段计时：with METRICS.stage('scan'): ..."""
+        return self.timer('stage', name)
+    
+    def error(self, section: str, name: str, exc: BaseException):
+        """记录一次被吞掉的异常（如策略对单只股票扫描失败）"""
+        with self._lock:
+            entry = self.errors.setdefault(section, {}).setdefault(name, {'count': 0, 'last': None})
+            entry['count'] += 1
+            entry['last'] = f'{type(exc).__name__}: {exc}'
+    
+    def latency(self, endpoint: str, seconds: float, ok: bool = True):
+        """记录一次 HTTP 请求的延迟"""
+        with self._lock:
+            samples = self.latencies.setdefault(endpoint, [])
+            if len(samples) < LATENCY_SAMPLES:
+                samples.append(seconds)
+            
+            counts = self.requests.setdefault(endpoint, {'requests': 0, 'errors': 0})
+            counts['requests'] += 1
+            if not ok:
+                counts['errors'] += 1
+    
+    def count(self, name: str, n: int = 1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+    
+    def merge(self, report: Dict[str, Any]):
+        """并入子进程的 report()（计时、异常、计数；延迟样本不跨进程合并）"""
+        for section in ('stage', 'strategy', 'db'):
+            for name, entry in report.get(section, {}).items():
+                self.add(section, name, entry['seconds'], entry['calls'])
+                
+                with self._lock:
+                    timer = self.timers[section][name]
+                    timer['max'] = max(timer['max'], entry['max'])
+                    
+                    if entry.get('errors'):
+                        target = self.errors.setdefault(section, {}).setdefault(name, {'count': 0, 'last': None})
+                        target['count'] += entry['errors']
+                        target['last'] = entry['last_error']
+        
+        for name, n in report.get('counters', {}).items():
+            self.count(name, n)
+    
+    def report(self) -> Dict[str, Any]:
+        """可 JSON 序列化的运行报告"""
+        with self._lock:
+            result = {
+                'started': self.started.isoformat(timespec='seconds'),
+                'elapsed': round(time.perf_counter() - self._started, 6),
+                'pid': os.getpid(),
+            }
+            
+            for section in ('stage', 'strategy', 'db'):
+                entries = {}
+                names = set(self.timers.get(section, {})) | set(self.errors.get(section, {}))
+                
+                for name in sorted(names):
+                    timer = self.timers.get(section, {}).get(name, {'calls': 0, 'seconds': 0.0, 'max': 0.0})
+                    entry = {
+                        'calls': timer['calls'],
+                        'seconds': round(timer['seconds'], 6),
+                        'max': round(timer['max'], 6),
+                    }
+                    
+                    error = self.errors.get(section, {}).get(name)
+                    if error:
+                        entry['errors'] = error['count']
+                        entry['last_error'] = error['last']
+                    
+                    entries[name] = entry
+                
+                result[section] = entries
+            
+            fetch = {}
+            for endpoint, counts in sorted(self.requests.items()):
+                samples = sorted(self.latencies.get(endpoint, []))
+                entry = dict(counts)
+                entry['mean'] = round(sum(samples) / len(samples), 6) if samples else 0.0
+                for p in PERCENTILES:
+                    entry[f'p{p}'] = round(percentile(samples, p), 6)
+                entry['max'] = round(samples[-1], 6) if samples else 0.0
+                fetch[endpoint] = entry
+            
+            result['fetch'] = fetch
+            result['counters'] = dict(sorted(self.counters.items()))
+        
+        return result
+    
+    def summary(self) -> str:
+        """顶层阶段耗时一行摘要"""
+        stages = self.timers.get('stage', {})
+        parts = [f'{name} {t["seconds"]:.2f}s' for name, t in stages.items() if '.' not in name]
+        return '阶段耗时：' + ('，'.join(parts) if parts else '无')
+    
+    def write(self, path: str) -> str:
+        """运行报告写入 JSON 文件，返回路径"""
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.report(), f, ensure_ascii=False, indent=2)
+        
+        return path
+
+# 进程内全局指标
+METRICS = RunMetrics()
+
+def timed(section: str, name: Optional[str] = None) -> Callable:
+    """函数计时装饰器：@timed('db') 按函数名累计到 METRICS"""
+    def decorate(func):
+        key = name or func.__name__
+        
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                METRICS.add(section, key, time.perf_counter() - started)
+        
+        return wrapper
+    
+    return decorate
+
+def run_path(template: Optional[str], now: Optional[datetime] = None) -> Optional[str]:
+    """报告 / 剖析文件路径，可含 strftime 占位符（如 logs/run-%Y%m%d-%H%M%S.json），每次运行一个文件"""
+    if not template:
+        return None
+    return (now or datetime.now()).strftime(template)
+
+@contextmanager
+def profile(path: Optional[str]):
+    """
+    path 不为空时用 cProfile 采集 with 块内主线程的执行，写入 path（pstats 格式，
+    python3 -m pstats path 查看）；下载线程池中的请求不在其中，见运行报告的 fetch 延迟
+    """
+    if not path:
+        yield None
+        return
+    
+    profiler = cProfile.Profile()
+    profiler.enable()
+    
+    try:
+        yield profiler
+    finally:
+        profiler.disable()
+        
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        
+        profiler.dump_stats(path)
+        print(f"🔬 性能剖析已写入：{path}")
+
+@contextmanager
+def instrumented_run(report: Optional[str] = None, profile_path: Optional[str] = None):
+    """
+    一次运行：清零 METRICS，可选 cProfile 采集，结束时（包括异常退出）写运行报告
+    
+    Args:
+        report: 运行报告 JSON 路径模板（见 run_path），None 不写
+        profile_path: cProfile 输出路径模板，None 不采集
+    """
+    now = datetime.now()
+    METRICS.reset()
+    
+    try:
+        with profile(run_path(profile_path, now)):
+            yield METRICS
+    finally:
+        path = run_path(report, now)
+        if path:
+            METRICS.write(path)
+            print(f"📋 运行报告已写入：{path}")
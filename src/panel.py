@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+行情面板 - 全市场历史行情的稠密数组表示
+"""
+
+from __future__ import annotations
+
+from typing import List, Dict, Optional
+
+from src.lazy import lazy_import
+
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+
+# 面板默认字段（与 stock_history 数值列一致）
+PANEL_FIELDS = ['open', 'close', 'high', 'low', 'volume', 'amount']
+
+class HistoryPanel:
+    """
+    codes × bars × fields 的稠密历史行情
+    
+    每只股票右对齐：最后一根 K 线在 [:, -1]，历史不足的左侧补 NaN / NaT
+    
+    Attributes:
+        codes: 股票代码列表
+        dates: datetime64[D] 数组 (n_codes, n_bars)
+        values: float64 数组 (n_codes, n_bars, n_fields)
+        fields: 字段名列表
+        lengths: 每只股票实际 K 线数
+    """
+    
+    def __init__(self, codes: List[str], dates: np.ndarray, values: np.ndarray,
+                 fields: List[str], lengths: np.ndarray):
+        self.codes = list(codes)
+        self.dates = dates
+        self.values = values
+        self.fields = list(fields)
+        self.lengths = lengths
+        self._index = {code: i for i, code in enumerate(self.codes)}
+        self._field_index = {name: i for i, name in enumerate(self.fields)}
+    
+    @classmethod
+    def from_frame(cls, frame: pd.DataFrame, days: Optional[int] = None,
+                   fields: Optional[List[str]] = None) -> 'HistoryPanel':
+        """
+        由 get_history_panel 返回的 (code, date) MultiIndex DataFrame 构建
+        
+        Args:
+            frame: 按 (code, date) 升序排列
+            days: 每只股票保留的 K 线数，默认取最长的一只
+            fields: 字段，默认 frame 中包含的 PANEL_FIELDS
+        """
+        if fields is None:
+            fields = [f for f in PANEL_FIELDS if frame is not None and f in frame.columns]
+        
+        if frame is None or frame.empty:
+            return cls([], np.empty((0, days or 0), dtype='datetime64[D]'),
+                       np.empty((0, days or 0, len(fields))), fields,
+                       np.zeros(0, dtype=np.int64))
+        
+        code_values = frame.index.get_level_values(0).to_numpy()
+        codes, starts, counts = np.unique(code_values, return_index=True, return_counts=True)
+        
+        # np.unique 按代码排序，与 frame 的 (code, date) 顺序一致
+        n_bars = int(days or counts.max())
+        lengths = np.minimum(counts, n_bars)
+        
+        # 每行在所属股票内的序号，右对齐到 n_bars 列
+        row_code = np.repeat(np.arange(len(codes)), counts)
+        position = np.arange(len(code_values)) - np.repeat(starts, counts)
+        column = position - np.repeat(counts, counts) + n_bars
+        keep = column >= 0
+        
+        values = np.full((len(codes), n_bars, len(fields)), np.nan)
+        values[row_code[keep], column[keep]] = frame[fields].to_numpy(dtype=float)[keep]
+        
+        dates = np.full((len(codes), n_bars), np.datetime64('NaT'), dtype='datetime64[D]')
+        date_values = pd.to_datetime(frame.index.get_level_values(1)).to_numpy().astype('datetime64[D]')
+        dates[row_code[keep], column[keep]] = date_values[keep]
+        
+        return cls(list(codes), dates, values, fields, lengths)
+    
+    def __len__(self) -> int:
+        return len(self.codes)
+    
+    def __contains__(self, code: str) -> bool:
+        return code in self._index
+    
+    @property
+    def n_bars(self) -> int:
+        return self.values.shape[1]
+    
+    @property
+    def nbytes(self) -> int:
+        return self.values.nbytes + self.dates.nbytes + self.lengths.nbytes
+    
+    def field(self, name: str) -> np.ndarray:
+        """单个字段的 (n_codes, n_bars) 视图"""
+        return self.values[:, :, self._field_index[name]]
+    
+    def history(self, code: str) -> Optional[pd.DataFrame]:
+        """单只股票的历史行情，格式与 database.get_history 一致"""
+        i = self._index.get(code)
+        
+        if i is None or self.lengths[i] == 0:
+            return None
+        
+        n = int(self.lengths[i])
+        df = pd.DataFrame(self.values[i, -n:], columns=self.fields)
+        df.insert(0, 'date', np.datetime_as_string(self.dates[i, -n:], unit='D'))
+        return df
+    
+    def select(self, codes: List[str]) -> 'HistoryPanel':
+        """按代码取子面板（不存在的代码忽略）"""
+        rows = [self._index[c] for c in codes if c in self._index]
+        return HistoryPanel([self.codes[i] for i in rows], self.dates[rows],
+                            self.values[rows], self.fields, self.lengths[rows])
+    
+    def update(self, other: 'HistoryPanel') -> 'HistoryPanel':
+        """
+        用 other 中的股票替换本面板的同名行、追加新股票（字段、K 线数须一致）
+        
+        只有已有股票时原地替换、不复制整个面板；有新股票时返回按代码排序的新面板
+        """
+        if other.fields != self.fields or other.n_bars != self.n_bars:
+            raise ValueError("面板字段或 K 线数不一致，无法合并")
+        
+        existing = [(self._index[c], i) for i, c in enumerate(other.codes) if c in self._index]
+        if existing:
+            rows, src = (list(x) for x in zip(*existing))
+            self.dates[rows] = other.dates[src]
+            self.values[rows] = other.values[src]
+            self.lengths[rows] = other.lengths[src]
+        
+        added = [i for i, c in enumerate(other.codes) if c not in self._index]
+        if not added:
+            return self
+        
+        codes = np.array(self.codes + [other.codes[i] for i in added], dtype=object)
+        order = np.argsort(codes, kind='stable')
+        return HistoryPanel(
+            list(codes[order]),
+            np.concatenate([self.dates, other.dates[added]])[order],
+            np.concatenate([self.values, other.values[added]])[order],
+            self.fields,
+            np.concatenate([self.lengths, other.lengths[added]])[order],
+        )
+    
+    def last_dates(self) -> np.ndarray:
+        """每只股票最后一根 K 线的日期 'YYYY-MM-DD'（没有 K 线为 ''）"""
+        if self.n_bars == 0:
+            return np.full(len(self), '', dtype=object)
+        
+        last = np.datetime_as_string(self.dates[:, -1], unit='D').astype(object)
+        last[self.lengths == 0] = ''
+        return last
+    
+    def histories(self) -> Dict[str, pd.DataFrame]:
+        """全部股票的 Dict[code -> DataFrame]"""
+        return {code: self.history(code) for code in self.codes if self.lengths[self._index[code]]}
@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+策略插件注册表 - 发现 strategies/ 下的策略模块，缓存策略元数据
+
+元数据（name / description / version / lookback / history_columns / quote_filter / stateful）
+按文件 mtime 和大小缓存在 data/plugins.json：列出策略、查看依赖的数据等不需要导入策略模块
+（及其依赖的 pandas / numpy），只有文件变化或真正扫描时才导入
+"""
+
+import importlib.util
+import json
+import os
+import sys
+import time
+from typing import Dict, List, Optional, Any, Iterable
+
+STRATEGIES_DIR = os.path.join(os.path.dirname(__file__), '..', 'strategies')
+PLUGIN_CACHE = os.path.join(os.path.dirname(__file__), '..', 'data', 'plugins.json')
+
+# 缓存格式版本，字段变化时递增使旧缓存失效
+CACHE_VERSION = 1
+
+# 缓存的策略属性（BaseStrategy 上的同名属性）
+METADATA_FIELDS = ['name', 'description', 'version', 'lookback', 'history_columns',
+                   'quote_filter', 'stateful']
+
+# 策略基类：默认属性值变化时所有策略的元数据都要重新读取
+BASE_MODULE = os.path.join(os.path.dirname(__file__), 'strategy_base.py')
+
+def _file_key(path: str) -> List[int]:
+    """文件的缓存键 [mtime_ns, size]"""
+    st = os.stat(path)
+    return [st.st_mtime_ns, st.st_size]
+
+def strategy_metadata(strategy) -> Dict[str, Any]:
+    """策略实例 -> 可 JSON 序列化的元数据 dict"""
+    meta = {field: getattr(strategy, field, None) for field in METADATA_FIELDS}
+    meta['lookback'] = int(meta['lookback']) if meta['lookback'] is not None else None
+    meta['history_columns'] = list(meta['history_columns']) if meta['history_columns'] is not None else None
+    meta['quote_filter'] = [list(f) for f in meta['quote_filter'] or []]
+    meta['stateful'] = bool(meta['stateful'])
+    return meta
+
+class PluginRegistry:
+    """
+    策略插件注册表
+    
+    一个策略文件对应一个模块，模块级变量 strategy 为策略实例；以 _ 开头的文件不是策略。
+    策略名为文件名（去掉 .py），与 CONFIG['enabled_strategies'] 中的名称一致
+    """
+    
+    def __init__(self, strategies_dir: str = STRATEGIES_DIR, cache_path: Optional[str] = PLUGIN_CACHE):
+        """
+        Args:
+            strategies_dir: 策略目录
+            cache_path: 元数据缓存文件，None 为不缓存
+        """
+        self.strategies_dir = strategies_dir
+        self.cache_path = cache_path
+        self._modules = {}
+        self._cache = None
+        self._dirty = False
+        self.timings = {}  # 策略名 -> 导入模块耗时（秒）
+    
+    def files(self) -> Dict[str, str]:
+        """策略名 -> 文件路径（按名称排序）"""
+        if not os.path.isdir(self.strategies_dir):
+            return {}
+        
+        return {
+            filename[:-3]: os.path.join(self.strategies_dir, filename)
+            for filename in sorted(os.listdir(self.strategies_dir))
+            if filename.endswith('.py') and not filename.startswith('_')
+        }
+    
+    def load(self, names: Optional[Iterable[str]] = None, verbose: bool = True) -> Dict[str, Any]:
+        """
+        导入策略模块，返回 {策略名: 策略实例}
+        
+        Args:
+            names: 只加载这些策略（如 CONFIG['enabled_strategies']），None 为全部
+            verbose: 打印加载成功的策略
+        """
+        strategies = {}
+        
+        if not os.path.isdir(self.strategies_dir):
+            print(f"❌ 策略目录不存在：{self.strategies_dir}")
+            return strategies
+        
+        wanted = set(names) if names is not None else None
+        
+        for name, path in self.files().items():
+            if wanted is not None and name not in wanted:
+                continue
+            
+            try:
+                module = self._import(name, path)
+            except Exception as e:
+                print(f"❌ 加载策略失败 {name}: {e}")
+                continue
+            
+            if hasattr(module, 'strategy'):
+                strategy = module.strategy
+                strategies[name] = strategy
+                self._remember(name, path, strategy)
+                if verbose:
+                    print(f"✅ 加载策略：{name} - {strategy.description}")
+        
+        self._save_cache()
+        return strategies
+    
+    def metadata(self, names: Optional[Iterable[str]] = None) -> Dict[str, Dict[str, Any]]:
+        """
+        策略元数据 {策略名: {name, description, version, lookback, ...}}
+        
+        文件和 strategy_base.py 都未变化时直接读缓存，否则导入策略模块并更新缓存；
+        导入失败的策略返回 {'error': 错误信息}（不缓存）
+        """
+        cache = self._load_cache()
+        wanted = set(names) if names is not None else None
+        result = {}
+        
+        for name, path in self.files().items():
+            if wanted is not None and name not in wanted:
+                continue
+            
+            entry = cache['plugins'].get(name)
+            
+            if entry is None or entry['key'] != _file_key(path):
+                try:
+                    module = self._import(name, path)
+                except Exception as e:
+                    result[name] = {'error': str(e)}
+                    continue
+                
+                if not hasattr(module, 'strategy'):
+                    continue
+                
+                entry = self._remember(name, path, module.strategy)
+            
+            meta = dict(entry['meta'])
+            meta['quote_filter'] = [tuple(f) for f in meta['quote_filter']]
+            result[name] = meta
+        
+        self._save_cache()
+        return result
+    
+    def _import(self, name: str, path: str):
+        """按文件路径导入策略模块（注册到 sys.modules，多进程扫描时子进程按名称找回）"""
+        if name in self._modules:
+            return self._modules[name]
+        
+        started = time.perf_counter()
+        spec = importlib.util.spec_from_file_location(name, path)
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[name] = module
+        spec.loader.exec_module(module)
+        
+        self.timings[name] = time.perf_counter() - started
+        self._modules[name] = module
+        return module
+    
+    def _remember(self, name: str, path: str, strategy) -> Dict[str, Any]:
+        """把策略元数据写入内存中的缓存，返回缓存条目"""
+        cache = self._load_cache()
+        entry = {'key': _file_key(path), 'meta': strategy_metadata(strategy)}
+        
+        if cache['plugins'].get(name) != entry:
+            cache['plugins'][name] = entry
+            self._dirty = True
+        
+        return entry
+    
+    def _load_cache(self) -> Dict[str, Any]:
+        """读取缓存文件；格式版本或 strategy_base.py 变化时丢弃全部条目"""
+        if self._cache is not None:
+            return self._cache
+        
+        base = _file_key(BASE_MODULE)
+        cache = None
+        
+        if self.cache_path and os.path.exists(self.cache_path):
+            try:
+                with open(self.cache_path, encoding='utf-8') as f:
+                    cache = json.load(f)
+            except (OSError, ValueError):
+                cache = None
+        
+        if not cache or cache.get('version') != CACHE_VERSION or cache.get('base') != base:
+            cache = {'version': CACHE_VERSION, 'base': base, 'plugins': {}}
+            self._dirty = True
+        
+        self._cache = cache
+        return cache
+    
+    def _save_cache(self):
+        """有变化时写回缓存（先写临时文件再替换，并发进程不会读到半个文件）"""
+        if not self._dirty or not self.cache_path:
+            return
+        
+        # 删掉已不存在的策略文件
+        files = self.files()
+        self._cache['plugins'] = {k: v for k, v in self._cache['plugins'].items() if k in files}
+        
+        tmp = f'{self.cache_path}.{os.getpid()}.tmp'
+        try:
+            os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump(self._cache, f, ensure_ascii=False, indent=1)
+            os.replace(tmp, self.cache_path)
+            self._dirty = False
+        except OSError as e:
+            # 缓存只是加速，写不了（只读目录等）不影响使用
+            print(f"⚠️  策略元数据缓存写入失败：{e}")
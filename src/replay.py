@@ -0,0 +1,467 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+离线回放模块 - 腾讯 / 新浪接口的本地替身
+
+- Recorder: 录制真实接口返回，按股票拆分保存为数据集
+- generate_dataset: 生成确定性的模拟数据集（无需联网）
+- ReplayServer: 本地 HTTP 服务，回放数据集，可注入延迟、错误和 Forbidden
+
+用法：
+    python3 src/replay.py generate --stocks 5000 --days 120 --out data/replay.json
+    python3 src/replay.py serve --data data/replay.json --port 8765 --latency 0.02
+    REPLAY_SERVER_URL=http://127.0.0.1:8765 python3 run.py
+    
+    python3 src/replay.py bench --stocks 2000   # 端到端压测 update_stock_data + run_scan
+"""
+
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Dict, List, Optional
+from urllib.parse import urlsplit, parse_qs, unquote
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from src import data_fetcher
+
+# 替身服务上的接口路径（与真实接口一致，一个服务同时扮演三个主机）
+QUOTE_PATH = urlsplit(data_fetcher.TENCENT_REALTIME_URL).path
+KLINE_PATH = urlsplit(data_fetcher.TENCENT_HISTORY_URL).path
+LIST_PATH = urlsplit(data_fetcher.SINA_LIST_URL).path
+
+_QUOTE_LINE_RE = re.compile(r'v_((?:sh|sz)\d+)="([^"]*)"')
+
+def empty_dataset() -> Dict:
+    """
+    数据集结构：
+        quotes: symbol -> 实时行情原始字段串（'~' 分隔）
+        klines: symbol -> [[date, open, close, high, low, volume], ...]（按日期升序）
+        lists:  node (sh_A / sz_A) -> [{'code', 'name', ...}, ...]
+    """
+    return {'quotes': {}, 'klines': {}, 'lists': {}}
+
+def load_dataset(path: str) -> Dict:
+    """读取数据集文件"""
+    with open(path, 'r', encoding='utf-8') as f:
+        dataset = json.load(f)
+    
+    for key, value in empty_dataset().items():
+        dataset.setdefault(key, value)
+    
+    return dataset
+
+def save_dataset(dataset: Dict, path: str):
+    """保存数据集文件"""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(dataset, f, ensure_ascii=False)
+
+class Recorder:
+    """
+    录制器：包装 data_fetcher 的共享会话，把真实接口返回按股票拆分记入数据集
+    
+    with Recorder() as rec:
+        get_batch_current_prices(codes)
+        get_stock_history('600000')
+    rec.save('data/replay.json')
+    """
+    
+    def __init__(self, dataset: Optional[Dict] = None):
+        self.dataset = dataset or empty_dataset()
+        self._session = None
+        self._lock = threading.Lock()
+    
+    def install(self):
+        self._session = data_fetcher.get_session()
+        data_fetcher.set_session(self)
+        return self
+    
+    def uninstall(self):
+        data_fetcher.set_session(self._session)
+    
+    def __enter__(self):
+        return self.install()
+    
+    def __exit__(self, *exc):
+        self.uninstall()
+    
+    def get(self, url: str, params: Optional[Dict] = None, timeout=None):
+        response = self._session.get(url, params=params, timeout=timeout)
+        
+        if response.status_code == 200:
+            try:
+                with self._lock:
+                    self._record(url, params or {}, response)
+            except ValueError:
+                pass
+        
+        return response
+    
+    def close(self):
+        pass
+    
+    def _record(self, url: str, params: Dict, response):
+        if url.startswith(data_fetcher.TENCENT_REALTIME_URL):
+            for symbol, data_str in _QUOTE_LINE_RE.findall(response.text):
+                self.dataset['quotes'][symbol] = data_str
+        
+        elif url.startswith(data_fetcher.TENCENT_HISTORY_URL):
+            for symbol, stock_data in (response.json().get('data') or {}).items():
+                bars = {b[0]: b[:6] for b in self.dataset['klines'].get(symbol, [])}
+                bars.update({b[0]: b[:6] for b in stock_data.get('qfqday', [])})
+                self.dataset['klines'][symbol] = [bars[d] for d in sorted(bars)]
+        
+        elif url.startswith(data_fetcher.SINA_LIST_URL):
+            node = params.get('node', '')
+            items = self.dataset['lists'].setdefault(node, [])
+            seen = {item.get('code') for item in items}
+            items.extend(item for item in response.json() or [] if item.get('code') not in seen)
+    
+    def save(self, path: str):
+        save_dataset(self.dataset, path)
+
+def _quote_fields(code: str, name: str, price: float, prev_close: float,
+                  open_price: float, high: float, low: float, volume: float) -> str:
+    """按 data_fetcher.QUOTE_FIELDS 的下标拼出实时行情字段串"""
+    fields = [''] * 50
+    fields[0] = '1'
+    fields[1] = name
+    fields[2] = code
+    fields[3] = f"{price:.2f}"
+    fields[4] = f"{prev_close:.2f}"
+    fields[5] = f"{open_price:.2f}"
+    fields[6] = f"{volume:.0f}"
+    fields[31] = f"{high:.2f}"
+    fields[32] = f"{low:.2f}"
+    fields[47] = f"{volume * price:.0f}"
+    fields[48] = '1.00'
+    fields[49] = '20.00'
+    return '~'.join(fields)
+
+def generate_dataset(n_stocks: int = 500, days: int = 120, seed: int = 42,
+                     end_date: Optional[str] = None) -> Dict:
+    """
+    生成确定性的模拟数据集（随机游走行情）
+    
+    Args:
+        n_stocks: 股票数量（沪深各半）
+        days: 每只股票的交易日数
+        seed: 随机种子，相同参数生成相同数据
+        end_date: 最后一根 K 线日期，默认最近一个交易日
+    """
+    rng = random.Random(seed)
+    end = datetime.strptime(end_date or data_fetcher.last_trading_day(), '%Y-%m-%d')
+    
+    dates = []
+    day = end
+    while len(dates) < days:
+        if day.weekday() < 5:
+            dates.append(day.strftime('%Y-%m-%d'))
+        day -= timedelta(days=1)
+    dates.reverse()
+    
+    dataset = empty_dataset()
+    
+    for i in range(n_stocks):
+        prefix, first = ('sh', 600000) if i % 2 == 0 else ('sz', 1)
+        code = f"{first + i // 2:06d}"
+        symbol = f"{prefix}{code}"
+        name = f"模拟{code}"
+        
+        price = rng.uniform(3, 80)
+        base_volume = rng.uniform(1e4, 1e6)
+        bars = []
+        
+        for date in dates:
+            open_price = price
+            close = max(0.5, price * (1 + rng.gauss(0, 0.025)))
+            high = max(open_price, close) * (1 + abs(rng.gauss(0, 0.008)))
+            low = min(open_price, close) * (1 - abs(rng.gauss(0, 0.008)))
+            volume = base_volume * rng.lognormvariate(0, 0.5)
+            bars.append([date, f"{open_price:.2f}", f"{close:.2f}", f"{high:.2f}",
+                         f"{low:.2f}", f"{volume:.0f}"])
+            price = close
+        
+        dataset['klines'][symbol] = bars
+        dataset['lists'].setdefault(f"{prefix}_A", []).append(
+            {'symbol': symbol, 'code': code, 'name': name}
+        )
+        
+        last = bars[-1]
+        prev_close = float(bars[-2][2]) if len(bars) > 1 else float(last[1])
+        dataset['quotes'][symbol] = _quote_fields(
+            code, name, float(last[2]), prev_close, float(last[1]),
+            float(last[3]), float(last[4]), float(last[5])
+        )
+    
+    return dataset
+
+class ReplayServer:
+    """
+    本地替身服务：回放数据集中的实时行情、K 线和股票列表
+    
+    Args:
+        dataset: 数据集（见 empty_dataset）
+        port: 监听端口，0 为随机端口
+        latency: 每个请求的固定延迟（秒）
+        jitter: 额外随机延迟上限（秒）
+        error_rate: 返回 503 的概率
+        forbidden_rate: 返回 Forbidden 的概率（模拟限流）
+        forbidden_status: Forbidden 响应的 HTTP 状态码
+        seed: 随机种子（延迟和错误注入可复现）
+    """
+    
+    def __init__(self, dataset: Dict, host: str = '127.0.0.1', port: int = 0,
+                 latency: float = 0.0, jitter: float = 0.0,
+                 error_rate: float = 0.0, forbidden_rate: float = 0.0,
+                 forbidden_status: int = 403, seed: int = 0):
+        self.dataset = dataset
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.forbidden_rate = forbidden_rate
+        self.forbidden_status = forbidden_status
+        self.stats = {'requests': 0, 'errors': 0, 'forbidden': 0}
+        
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._thread = None
+        self._saved_urls = None
+        
+        self.httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self.httpd.daemon_threads = True
+    
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+    
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+    
+    def stop(self):
+        self.uninstall()
+        self.httpd.shutdown()
+        self.httpd.server_close()
+    
+    def install(self):
+        """让 data_fetcher 的所有接口指向本服务"""
+        if self._saved_urls is None:
+            self._saved_urls = data_fetcher.set_endpoint_base(self.url)
+        return self
+    
+    def uninstall(self):
+        if self._saved_urls is not None:
+            data_fetcher.restore_endpoints(self._saved_urls)
+            self._saved_urls = None
+    
+    def __enter__(self):
+        return self.start().install()
+    
+    def __exit__(self, *exc):
+        self.stop()
+    
+    def _inject(self) -> Optional[str]:
+        """决定本次请求的延迟和故障，返回 'error' / 'forbidden' / None"""
+        with self._lock:
+            self.stats['requests'] += 1
+            delay = self.latency + (self._rng.uniform(0, self.jitter) if self.jitter else 0)
+            roll = self._rng.random()
+            
+            fault = None
+            if roll < self.forbidden_rate:
+                fault = 'forbidden'
+                self.stats['forbidden'] += 1
+            elif roll < self.forbidden_rate + self.error_rate:
+                fault = 'error'
+                self.stats['errors'] += 1
+        
+        if delay > 0:
+            time.sleep(delay)
+        
+        return fault
+    
+    def _make_handler(self):
+        server = self
+        
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            
+            def do_GET(self):
+                fault = server._inject()
+                
+                if fault == 'forbidden':
+                    return self._send(server.forbidden_status, 'Forbidden', 'text/plain')
+                if fault == 'error':
+                    return self._send(503, 'Service Unavailable', 'text/plain')
+                
+                parts = urlsplit(self.path)
+                query = parse_qs(parts.query)
+                
+                if parts.path.startswith(QUOTE_PATH):
+                    body = server.quote_body(unquote(parts.path[len(QUOTE_PATH):]))
+                    return self._send(200, body, 'text/plain; charset=GBK')
+                if parts.path == KLINE_PATH:
+                    body = server.kline_body(query.get('param', [''])[0])
+                    return self._send(200, body, 'application/json')
+                if parts.path == LIST_PATH:
+                    body = server.list_body(query)
+                    return self._send(200, body, 'application/json')
+                
+                self._send(404, 'Not Found', 'text/plain')
+            
+            def _send(self, status: int, body: str, content_type: str):
+                data = body.encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+            
+            def log_message(self, *args):
+                pass
+        
+        return Handler
+    
+    def quote_body(self, symbols: str) -> str:
+        quotes = self.dataset['quotes']
+        lines = []
+        
+        for symbol in symbols.split(','):
+            if symbol in quotes:
+                lines.append(f'v_{symbol}="{quotes[symbol]}";')
+            elif symbol:
+                lines.append('v_pv_none_match="1";')
+        
+        return '\n'.join(lines) + '\n'
+    
+    def kline_body(self, param: str) -> str:
+        # param: symbol,day,start,end,count,qfq
+        parts = param.split(',')
+        symbol = parts[0]
+        start = parts[2] if len(parts) > 2 and parts[2] else '0000-00-00'
+        end = parts[3] if len(parts) > 3 and parts[3] else '9999-99-99'
+        count = int(parts[4]) if len(parts) > 4 and parts[4].isdigit() else 320
+        
+        bars = [b for b in self.dataset['klines'].get(symbol, []) if start <= b[0] <= end]
+        stock_data = {'qfqday': bars[-count:]} if bars else {}
+        
+        return json.dumps({'code': 0, 'msg': '', 'data': {symbol: stock_data}})
+    
+    def list_body(self, query: Dict[str, List[str]]) -> str:
+        node = query.get('node', [''])[0]
+        page = int(query.get('page', ['1'])[0])
+        num = int(query.get('num', ['100'])[0])
+        
+        items = self.dataset['lists'].get(node, [])
+        return json.dumps(items[(page - 1) * num:page * num], ensure_ascii=False)
+
+def bench(n_stocks: int = 1000, days: int = 120, latency: float = 0.02,
+          error_rate: float = 0.0, forbidden_rate: float = 0.0,
+          fetch_rate: Optional[float] = None):
+    """端到端压测：临时数据库 + 替身服务，跑一遍 update_stock_data 和 run_scan"""
+    import tempfile
+    from src import database, scanner
+    
+    tmp_dir = tempfile.mkdtemp(prefix='replay_bench_')
+    database.DB_PATH = os.path.join(tmp_dir, 'stock.db')
+    if fetch_rate:
+        scanner.CONFIG['fetch_rate'] = fetch_rate
+    data_fetcher.STOCK_LIST_CACHE = os.path.join(tmp_dir, 'stock_list.json')
+    
+    print(f"🧪 生成模拟数据：{n_stocks} 只 × {days} 天")
+    dataset = generate_dataset(n_stocks, days)
+    
+    with ReplayServer(dataset, latency=latency, error_rate=error_rate,
+                      forbidden_rate=forbidden_rate) as server:
+        print(f"🧪 替身服务：{server.url}（延迟 {latency}s，错误率 {error_rate}，Forbidden {forbidden_rate}）")
+        database.init_db()
+        
+        start = time.monotonic()
+        scanner.update_stock_data()
+        update_time = time.monotonic() - start
+        
+        start = time.monotonic()
+        results = scanner.run_scan()
+        scan_time = time.monotonic() - start
+        
+        print(f"\n🧪 update_stock_data：{update_time:.2f}s")
+        print(f"🧪 run_scan：{scan_time:.2f}s，信号 {sum(len(v) for v in results.values())} 个")
+        print(f"🧪 请求统计：{server.stats}")
+        print(f"🧪 临时目录：{tmp_dir}")
+
+def main(argv: Optional[List[str]] = None):
+    import argparse
+    
+    parser = argparse.ArgumentParser(description='腾讯 / 新浪接口离线回放')
+    sub = parser.add_subparsers(dest='command', required=True)
+    
+    p = sub.add_parser('generate', help='生成模拟数据集')
+    p.add_argument('--stocks', type=int, default=500)
+    p.add_argument('--days', type=int, default=120)
+    p.add_argument('--seed', type=int, default=42)
+    p.add_argument('--out', default=os.path.join('data', 'replay.json'))
+    
+    p = sub.add_parser('record', help='录制真实接口数据')
+    p.add_argument('--days', type=int, default=120)
+    p.add_argument('--limit', type=int, default=0, help='只录制前 N 只股票的 K 线（0 为全部）')
+    p.add_argument('--out', default=os.path.join('data', 'replay.json'))
+    
+    p = sub.add_parser('serve', help='启动替身服务')
+    p.add_argument('--data', default=os.path.join('data', 'replay.json'))
+    p.add_argument('--host', default='127.0.0.1')
+    p.add_argument('--port', type=int, default=8765)
+    
+    p = sub.add_parser('bench', help='端到端压测')
+    p.add_argument('--stocks', type=int, default=1000)
+    p.add_argument('--days', type=int, default=120)
+    p.add_argument('--rate', type=float, default=None, help='覆盖 fetch_rate（次/秒）')
+    
+    for p in (sub.choices['serve'], sub.choices['bench']):
+        p.add_argument('--latency', type=float, default=0.02)
+        p.add_argument('--error-rate', type=float, default=0.0)
+        p.add_argument('--forbidden-rate', type=float, default=0.0)
+    sub.choices['serve'].add_argument('--jitter', type=float, default=0.0)
+    
+    args = parser.parse_args(argv)
+    
+    if args.command == 'generate':
+        save_dataset(generate_dataset(args.stocks, args.days, args.seed), args.out)
+        print(f"✅ 已生成 {args.stocks} 只股票的模拟数据：{args.out}")
+    
+    elif args.command == 'record':
+        with Recorder() as rec:
+            stocks = data_fetcher.get_all_a_stocks(use_cache=False)
+            codes = [s['code'] for s in stocks]
+            data_fetcher.get_batch_current_prices(codes)
+            data_fetcher.fetch_histories(codes[:args.limit] if args.limit else codes, days=args.days)
+        rec.save(args.out)
+        print(f"✅ 已录制 {len(rec.dataset['klines'])} 只股票的 K 线：{args.out}")
+    
+    elif args.command == 'serve':
+        server = ReplayServer(load_dataset(args.data), args.host, args.port,
+                              latency=args.latency, jitter=args.jitter,
+                              error_rate=args.error_rate,
+                              forbidden_rate=args.forbidden_rate)
+        print(f"🧪 替身服务已启动：{server.url}")
+        print(f"   REPLAY_SERVER_URL={server.url} python3 run.py")
+        try:
+            server.httpd.serve_forever()
+        except KeyboardInterrupt:
+            server.httpd.server_close()
+    
+    elif args.command == 'bench':
+        bench(args.stocks, args.days, args.latency, args.error_rate, args.forbidden_rate, args.rate)
+
+if __name__ == '__main__':
+    main()
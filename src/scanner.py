@@ -6,122 +6,206 @@
 
 import sys
 import os
-import importlib
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
 from datetime import datetime, timedelta
-from typing import List, Dict
+from typing import List, Dict, Tuple, Optional
 
 # 添加项目路径
 sys.path.insert(0, os.path.dirname(__file__))
 
 from src.database import (
-    init_db, get_stock_list, save_stocks, save_history, 
-    get_history, save_scan_result, get_scan_results
+    init_db, get_stock_list, sync_stocks, save_history_frame,
+    get_history_panel, save_scan_results, get_scan_results, get_last_dates, get_last_closes,
+    update_indicators, load_indicator_state, HISTORY_VALUE_COLUMNS
 )
-from src.data_fetcher import get_all_a_stocks, get_batch_current_prices
-from src.strategy_base import BaseStrategy
+from src.data_fetcher import (
+    get_all_a_stocks, get_batch_current_prices, fetch_histories, last_trading_day
+)
+from src.strategy_base import BaseStrategy, accepts_indicators, history_requirements, check_history
+from src.panel import HistoryPanel
+from src.indicators import INDICATOR_COLUMNS, IndicatorCache, IndicatorState, live_row
+from src import columnar_store
+from src.plugins import PluginRegistry
+from src.metrics import METRICS, timed, instrumented_run
 
 # 配置（60 天回测验证的有效策略）
 CONFIG = {
     'strategies_dir': os.path.join(os.path.dirname(__file__), '..', 'strategies'),
     'enabled_strategies': ['bollinger_rebound', 'rsi_oversold', 'macd_cross'],
-    'history_days': 60,  # 获取历史天数
+    'history_days': 60,  # 获取历史天数（也是未声明 lookback 的策略扫描时读取的 K 线数）
     'batch_size': 100,   # 批量处理大小
+    'fetch_workers': 8,  # 历史行情并发下载线程数
+    'fetch_rate': 10.0,  # 历史行情请求速率上限（次/秒）
+    'write_batch': 500,  # 历史行情每攒多少只股票写一次库
+    'columnar_store': False,  # 同步并优先从列式存储（data/columnar）读取历史行情
+    'indicators': True,  # 扫描时随行情读取 stock_indicators 中的预计算指标
+    'panel_scan': True,  # 向量化面板扫描（BaseStrategy.scan_panel），False 为逐股调用 scan
+    'scan_workers': 1,   # 扫描进程数，>1 时按股票分片多进程扫描
+    'prefilter': True,   # 先按策略的 quote_filter 筛实时行情，只为可能产生信号的股票加载历史行情
+    'run_report': None,  # 运行报告 JSON 路径（可含 strftime 占位符，如 logs/run-%Y%m%d-%H%M%S.json），None 不写
+    'profile': None,     # cProfile 输出路径（同上），None 不采集
 }
 
-def load_strategies() -> Dict[str, BaseStrategy]:
-    """加载所有策略"""
-    strategies = {}
-    
-    if not os.path.exists(CONFIG['strategies_dir']):
-        print(f"❌ 策略目录不存在：{CONFIG['strategies_dir']}")
-        return strategies
-    
-    # 扫描策略文件
-    for filename in os.listdir(CONFIG['strategies_dir']):
-        if filename.endswith('.py') and not filename.startswith('_'):
-            strategy_name = filename[:-3]  # 去掉 .py
-            
-            if strategy_name not in CONFIG['enabled_strategies']:
-                continue
-            
-            try:
-                # 动态导入策略
-                spec = importlib.util.spec_from_file_location(
-                    strategy_name,
-                    os.path.join(CONFIG['strategies_dir'], filename)
-                )
-                module = importlib.util.module_from_spec(spec)
-                sys.modules[strategy_name] = module
-                spec.loader.exec_module(module)
-                
-                # 获取策略实例
-                if hasattr(module, 'strategy'):
-                    strategy = module.strategy
-                    strategies[strategy_name] = strategy
-                    print(f"✅ 加载策略：{strategy_name} - {strategy.description}")
-            
-            except Exception as e:
-                print(f"❌ 加载策略失败 {strategy_name}: {e}")
-    
-    return strategies
+def load_strategies(verbose: bool = True) -> Dict[str, BaseStrategy]:
+    """加载启用的策略（见 src/plugins.py）"""
+    registry = PluginRegistry(CONFIG['strategies_dir'])
+    return registry.load(CONFIG['enabled_strategies'], verbose)
 
-def update_stock_data():
-    """更新股票数据"""
+@timed('stage', 'update')
+def update_stock_data(incremental: bool = True):
+    """
+    更新股票数据
+    
+    Args:
+        incremental: 增量模式，只下载每只股票最后一根 K 线之后缺失的数据，
+                     已是最新的股票直接跳过；多下载的最后一根已存 K 线收盘价对不上时
+                     （除权后前复权价格整体变化）该股票全量重新下载并替换旧历史。
+                     False 时全量重新下载 history_days 天
+    """
     print("\n" + "="*60)
     print("📥 更新股票数据")
     print("="*60 + "\n")
     
     # 获取股票列表
-    stocks = get_all_a_stocks()
+    with METRICS.stage('update.stock_list'):
+        stocks = get_all_a_stocks()
+    
     if not stocks:
         print("❌ 获取股票列表失败")
         return False
     
-    # 保存股票列表
-    save_stocks(stocks)
+    # 保存股票列表（只写入新上市 / 改名 / 退市的变化）
+    diff = sync_stocks(stocks)
+    print(f"📋 股票列表变化：新增 {diff['added']}，更名 {diff['changed']}，退市 {diff['removed']}")
     
     # 批量获取历史行情
     codes = [s['code'] for s in stocks]
-    total = len(codes)
-    
-    print(f"\n📈 获取历史行情（{total} 只股票）...")
-    print("⏳ 这可能需要 10-30 分钟，请耐心等待...\n")
-    
-    success_count = 0
+    since = {}
+    closes = {}
     
-    for i, code in enumerate(codes):
-        if (i + 1) % 50 == 0:
-            print(f"  进度：{i+1}/{total} ({(i+1)/total*100:.1f}%) - 成功：{success_count}")
+    if incremental:
+        last_dates = get_last_dates()
+        latest = last_trading_day()
         
-        try:
-            from src.data_fetcher import get_stock_history
-            
-            df = get_stock_history(code)
-            
-            if df is not None and not df.empty:
-                history_records = df.to_dict('records')
-                save_history(code, history_records)
-                success_count += 1
-            
-        except Exception as e:
-            pass
+        before = len(codes)
+        codes = [c for c in codes if last_dates.get(c, '') < latest]
+        since = {c: last_dates[c] for c in codes if c in last_dates}
+        closes = get_last_closes()
         
-        # 避免请求过快
-        if (i + 1) % 5 == 0:
-            import time
-            time.sleep(0.5)
+        print(f"\n🔄 增量模式：{before - len(codes)} 只已是最新（{latest}），跳过")
+    
+    total = len(codes)
+    
+    if total == 0:
+        print("✅ 所有股票数据已是最新")
+        refresh_indicators()
+        return True
+    
+    print(f"\n📈 获取历史行情（{total} 只股票）...")
+    print(f"⏳ 并发数：{CONFIG['fetch_workers']}，限速：{CONFIG['fetch_rate']:.0f} 次/秒\n")
+    
+    # 下载结果先攒批，跨股票单事务批量写入；除权后全量重新下载的股票整体替换旧历史
+    pending = []
+    replace = []
+    
+    def flush():
+        if pending:
+            save_history_frame(pd.concat(pending, ignore_index=True), replace=replace)
+            pending.clear()
+            replace.clear()
+    
+    def on_result(code, df):
+        pending.append(df.assign(code=code))
+        if len(pending) >= CONFIG['write_batch']:
+            flush()
+    
+    with METRICS.stage('update.fetch'):
+        stats = fetch_histories(
+            codes,
+            days=CONFIG['history_days'],
+            since=since,
+            workers=CONFIG['fetch_workers'],
+            rate=CONFIG['fetch_rate'],
+            on_result=on_result,
+            closes=closes,
+            on_adjusted=replace.append
+        )
+        flush()
+    
+    METRICS.count('update.fetched', stats.success)
+    METRICS.count('update.failed', stats.failed)
+    METRICS.count('update.adjusted', len(stats.adjusted))
+    refresh_indicators()
+    
+    if CONFIG['columnar_store']:
+        with METRICS.stage('update.columnar'):
+            # 除权改写了旧 K 线，增量同步只重写最近几天，需要重建
+            result = columnar_store.sync_columnar_store(rebuild=bool(stats.adjusted))
+        print(f"🗂️  列式存储已同步：{result['codes']} 只 × {result['dates']} 天（新增 {result['appended']} 天）")
+    
+    print(f"\n✅ 数据更新完成！{stats.summary()}")
+    
+    if stats.errors:
+        print(f"⚠️  失败 {len(stats.errors)} 只，示例：")
+        for code, err in list(stats.errors.items())[:5]:
+            print(f"    {code}: {err}")
     
-    print(f"\n✅ 数据更新完成！成功：{success_count}/{total}")
     return True
 
-def run_scan() -> Dict[str, List[Dict]]:
-    """执行策略扫描"""
+@timed('stage', 'update.indicators')
+def refresh_indicators():
+    """补算指标落后于行情的股票（新入库的行情在 save_history_frame 中已随写入更新）"""
+    written = update_indicators()
+    if written:
+        print(f"📐 指标已更新：{written} 行")
+
+def load_history_panel(codes: List[str], days: int,
+                       columns: Optional[List[str]] = None) -> HistoryPanel:
+    """
+    加载历史行情面板：启用列式存储时零拷贝读取，否则一次 SQL 查询
+    
+    SQLite 读取时带上预计算指标列，策略通过 indicators（src/indicators.py）直接取用
+    
+    Args:
+        codes: 股票代码
+        days: 每只股票 K 线数
+        columns: 行情列及指标列（见 history_requirements），默认全部
+    """
+    if columns is None:
+        columns = HISTORY_VALUE_COLUMNS + (INDICATOR_COLUMNS if CONFIG['indicators'] else [])
+    
+    if CONFIG['columnar_store']:
+        fields = [c for c in columns if c in HISTORY_VALUE_COLUMNS]
+        panel = columnar_store.load_panel(codes, days, fields=fields)
+        if panel is not None:
+            return panel
+    
+    frame = get_history_panel(codes, days, columns)
+    return HistoryPanel.from_frame(frame, days, columns)
+
+@timed('stage', 'scan')
+def run_scan(strategies: Optional[Dict[str, BaseStrategy]] = None,
+             panel: Optional[HistoryPanel] = None) -> Dict[str, List[Dict]]:
+    """
+    执行策略扫描
+    
+    Args:
+        strategies: 已加载的策略，None 时按 CONFIG 加载
+        panel: 已加载的历史行情面板（常驻进程，见 src/daemon.py），须满足 strategies 的
+               history_requirements；None 时从数据库加载。多进程扫描时不使用
+    """
     print("\n" + "="*60)
     print("🔍 执行策略扫描")
     print("="*60 + "\n")
     
     # 加载策略
-    strategies = load_strategies()
+    if strategies is None:
+        with METRICS.stage('scan.load_strategies'):
+            strategies = load_strategies()
     
     if not strategies:
         print("❌ 没有可用的策略")
@@ -137,21 +221,129 @@ def run_scan() -> Dict[str, List[Dict]]:
     # 获取当前股价
     print("📈 获取实时股价...")
     codes = [s['code'] for s in stocks]
-    prices = get_batch_current_prices(codes)
+    with METRICS.stage('scan.quotes'):
+        prices = get_batch_current_prices(codes)
     print(f"✅ 获取到 {len(prices)} 只股票的实时价格\n")
     
+    METRICS.count('stocks.total', total)
+    
+    if CONFIG['prefilter']:
+        with METRICS.stage('scan.prefilter'):
+            stocks = prefilter_stocks(strategies, stocks, prices)
+        codes = [s['code'] for s in stocks]
+        print(f"🔎 行情预筛：{len(stocks)}/{total} 只股票满足启用策略的行情条件\n")
+        
+        if not stocks:
+            return {name: [] for name in strategies}
+    
+    METRICS.count('stocks.scanned', len(stocks))
+    
+    if CONFIG['scan_workers'] > 1:
+        return scan_parallel(strategies, stocks, prices, CONFIG['scan_workers'])
+    
+    if panel is not None:
+        print(f"📈 使用常驻历史行情（{len(panel)} 只股票，{panel.n_bars} 根 K 线）\n")
+        panel = panel.select(codes)
+    else:
+        # 一次加载全部待扫描股票的历史行情（只取启用策略需要的 K 线数和列）
+        print("📈 加载历史行情...")
+        days, columns = history_requirements(strategies.values(), CONFIG['history_days'], CONFIG['indicators'])
+        with METRICS.stage('scan.load_history'):
+            panel = load_history_panel(codes, days, columns)
+        print(f"✅ 加载 {len(panel)} 只股票的历史行情（{days} 根 K 线，{len(columns)} 列）\n")
+    
+    started = time.perf_counter()
+    cache = IndicatorCache()
+    
+    with METRICS.stage('scan.strategies'):
+        if CONFIG['panel_scan']:
+            all_results = scan_panel(strategies, panel, stocks, prices, cache)
+        else:
+            all_results = scan_stocks(strategies, panel, stocks, prices, cache=cache)
+    
+    print(f"✅ 扫描完成，用时 {time.perf_counter() - started:.2f}s")
+    print(f"📐 {cache.summary()}\n")
+    
+    return all_results
+
+def prefilter_stocks(strategies: Dict[str, BaseStrategy], stocks: List[Dict],
+                     prices: Dict[str, Dict]) -> List[Dict]:
+    """
+    行情预筛：保留满足至少一个启用策略 quote_filter 的股票（保持原顺序）
+    
+    quote_filter 都是策略出信号的必要条件，筛掉的股票不会产生信号，扫描结果不变；
+    有策略未声明条件时不筛
+    """
+    current = current_frame([s['code'] for s in stocks], stocks, prices)
+    keep = np.zeros(len(stocks), dtype=bool)
+    
+    for strategy in strategies.values():
+        keep |= strategy.quote_mask(current)
+    
+    return [s for s, ok in zip(stocks, keep) if ok]
+
+def live_indicators(strategies: Dict[str, BaseStrategy], panel: HistoryPanel, current: pd.DataFrame,
+                    cache: Optional[IndicatorCache] = None) -> Optional[List[Dict[str, np.ndarray]]]:
+    """
+    声明 stateful 的策略所用的递推状态指标（按 panel.codes 排列），没有这类策略时返回 None、不读取状态
+    
+    实时行情对每只股票按同一规则并入（见 IndicatorState.with_quote）：状态与面板最后一根 K 线
+    不同步或没有状态的股票，先由面板已加载的 K 线建立状态，不退回未并入行情的面板值
+    """
+    if not any(s.stateful for s in strategies.values()):
+        return None
+    
+    state = load_indicator_state(panel.codes)
+    
+    last = pd.to_numeric(pd.DatetimeIndex(panel.dates[:, -1]).strftime('%Y%m%d'), errors='coerce')
+    stale = state.dates != np.asarray(last)
+    
+    if stale.any():
+        indicators = cache.for_panel(panel) if cache is not None else None
+        state.assign(IndicatorState.from_panel(panel, indicators), stale)
+    
+    state = state.with_quote(
+        BaseStrategy.panel_quote(current, 'price'),
+        BaseStrategy.panel_quote(current, 'yesterday_close', np.nan),
+        BaseStrategy.panel_quote(current, 'volume', np.nan),
+    )
+    return state.latest()
+
+def scan_stocks(strategies: Dict[str, BaseStrategy], panel: HistoryPanel,
+                stocks: List[Dict], prices: Dict[str, Dict],
+                progress: bool = True, cache: Optional[IndicatorCache] = None) -> Dict[str, List[Dict]]:
+    """
+    逐股扫描：每只股票构造 DataFrame 调用 strategy.scan
+    
+    同一只股票的指标由 cache 在各策略间共享，扫完一只即释放；
+    不满足某策略 quote_filter 的股票跳过该策略
+    """
+    check_history(strategies, panel)
+    
+    total = len(stocks)
+    cache = cache if cache is not None else IndicatorCache()
+    shared = {name: accepts_indicators(s.scan) for name, s in strategies.items()}
+    current = current_frame(panel.codes, stocks, prices)
+    passes = {name: s.quote_mask(current) for name, s in strategies.items()}
+    live = live_indicators(strategies, panel, current, cache)
+    rows = {code: i for i, code in enumerate(panel.codes)}
+    
     # 扫描结果
     all_results = {name: [] for name in strategies.keys()}
     
+    # 各策略累计耗时 / 调用次数，扫完一次写入 METRICS（避免每次调用加锁）
+    spent = {name: 0.0 for name in strategies}
+    calls = {name: 0 for name in strategies}
+    
     # 逐股扫描
     for i, stock in enumerate(stocks):
         code = stock['code']
         
-        if (i + 1) % 200 == 0:
+        if progress and (i + 1) % 200 == 0:
             print(f"📈 进度：{i+1}/{total} ({(i+1)/total*100:.1f}%)")
         
         # 获取历史数据
-        history = get_history(code, CONFIG['history_days'])
+        history = panel.history(code)
         
         if history is None or history.empty:
             continue
@@ -164,10 +356,21 @@ def run_scan() -> Dict[str, List[Dict]]:
             'change_percent': 0
         })
         
+        indicators = cache.for_history(code, history, live_row(live, rows[code]))
+        
         # 运行所有策略
         for strategy_name, strategy in strategies.items():
+            if not passes[strategy_name][rows[code]]:
+                continue
+            
+            started = time.perf_counter()
+            calls[strategy_name] += 1
+            
             try:
-                signal = strategy.scan(history, current)
+                if shared[strategy_name]:
+                    signal = strategy.scan(history, current, indicators=indicators)
+                else:
+                    signal = strategy.scan(history, current)
                 
                 if signal:
                     result = {
@@ -180,8 +383,160 @@ def run_scan() -> Dict[str, List[Dict]]:
                     all_results[strategy_name].append(result)
             
             except Exception as e:
-                # 策略执行失败，继续
-                pass
+                # 策略执行失败，记录后继续
+                METRICS.error('strategy', strategy_name, e)
+            
+            spent[strategy_name] += time.perf_counter() - started
+        
+        cache.release(code)
+    
+    for name in strategies:
+        if calls[name]:
+            METRICS.add('strategy', name, spent[name], calls[name])
+    
+    return all_results
+
+def current_frame(codes: List[str], stocks: List[Dict], prices: Dict[str, Dict]) -> pd.DataFrame:
+    """按 codes 排列的实时行情表，缺失行情的股票价格、涨幅按 0 处理（同逐股扫描）"""
+    names = {s['code']: s['name'] for s in stocks}
+    rows = [
+        prices.get(code, {'code': code, 'name': names.get(code, ''), 'price': 0, 'change_percent': 0})
+        for code in codes
+    ]
+    return pd.DataFrame(rows, index=pd.Index(codes, name='code'))
+
+def scan_panel(strategies: Dict[str, BaseStrategy], panel: HistoryPanel,
+               stocks: List[Dict], prices: Dict[str, Dict],
+               cache: Optional[IndicatorCache] = None) -> Dict[str, List[Dict]]:
+    """
+    面板扫描：每个策略对全市场调用一次 scan_panel，只为命中的股票构造信号
+    
+    各策略共享同一份 PanelIndicators，同一指标全市场只算一次；
+    结果格式、顺序（股票列表顺序）与 scan_stocks 一致
+    """
+    check_history(strategies, panel)
+    
+    panel = panel.select([s['code'] for s in stocks])
+    current = current_frame(panel.codes, stocks, prices)
+    names = {s['code']: s['name'] for s in stocks}
+    
+    cache = cache if cache is not None else IndicatorCache()
+    indicators = cache.for_panel(panel, live_indicators(strategies, panel, current, cache))
+    
+    all_results = {}
+    
+    for strategy_name, strategy in strategies.items():
+        results = []
+        started = time.perf_counter()
+        
+        try:
+            if accepts_indicators(strategy.scan_panel):
+                mask, fields = strategy.scan_panel(panel, current, indicators=indicators)
+            else:
+                mask, fields = strategy.scan_panel(panel, current)
+        except Exception as e:
+            print(f"⚠️  策略 {strategy_name} 扫描失败：{e}")
+            METRICS.error('strategy', strategy_name, e)
+            mask, fields = np.zeros(len(panel), dtype=bool), {}
+        
+        for i in np.flatnonzero(mask):
+            code = panel.codes[i]
+            
+            try:
+                signal = strategy.panel_signal({k: v[i] for k, v in fields.items()})
+            except Exception as e:
+                METRICS.error('strategy', strategy_name, e)
+                continue
+            
+            if signal:
+                quote = prices.get(code, {})
+                results.append({
+                    'code': code,
+                    'name': names[code],
+                    'price': quote.get('price', 0),
+                    'change_percent': quote.get('change_percent', 0),
+                    'signal': signal
+                })
+        
+        all_results[strategy_name] = results
+        METRICS.add('strategy', strategy_name, time.perf_counter() - started)
+    
+    return all_results
+
+def _scan_shard(shard: int, stocks: List[Dict], prices: Dict[str, Dict],
+                config: Dict) -> Tuple[Dict[str, List[Dict]], Dict]:
+    """子进程：加载本分片股票的历史行情并运行全部策略，返回 (结果, 耗时)"""
+    CONFIG.update(config)
+    METRICS.reset()
+    started = time.perf_counter()
+    
+    strategies = load_strategies(verbose=False)
+    days, columns = history_requirements(strategies.values(), CONFIG['history_days'], CONFIG['indicators'])
+    panel = load_history_panel([s['code'] for s in stocks], days, columns)
+    loaded = time.perf_counter()
+    cache = IndicatorCache()
+    
+    if CONFIG['panel_scan']:
+        results = scan_panel(strategies, panel, stocks, prices, cache)
+    else:
+        results = scan_stocks(strategies, panel, stocks, prices, progress=False, cache=cache)
+    
+    timing = {
+        'shard': shard,
+        'pid': os.getpid(),
+        'stocks': len(stocks),
+        'load': loaded - started,
+        'scan': time.perf_counter() - loaded,
+        'cache': cache.stats(),
+        'metrics': METRICS.report(),
+    }
+    return results, timing
+
+def scan_parallel(strategies: Dict[str, BaseStrategy], stocks: List[Dict],
+                  prices: Dict[str, Dict], workers: int) -> Dict[str, List[Dict]]:
+    """
+    多进程扫描
+    
+    股票列表按顺序切成 workers 段，每个子进程自己从数据库加载本段历史行情、重新加载策略后扫描；
+    结果按分片顺序拼接，格式、顺序与单进程扫描一致
+    """
+    size = max(1, -(-len(stocks) // workers))
+    shards = [stocks[i:i + size] for i in range(0, len(stocks), size)]
+    
+    # 子进程按当前配置运行，只加载本次启用的策略
+    config = dict(CONFIG, enabled_strategies=list(strategies), scan_workers=1)
+    
+    # fork 启动快且继承已导入的模块；不支持 fork 的平台回退到默认方式
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context('fork' if 'fork' in methods else None)
+    
+    print(f"📈 多进程扫描：{len(shards)} 个进程，每个约 {size} 只股票")
+    started = time.perf_counter()
+    
+    with ProcessPoolExecutor(max_workers=len(shards), mp_context=context) as pool:
+        futures = [
+            pool.submit(
+                _scan_shard, i, shard,
+                {s['code']: prices[s['code']] for s in shard if s['code'] in prices},
+                config
+            )
+            for i, shard in enumerate(shards)
+        ]
+        outputs = [f.result() for f in futures]
+    
+    all_results = {name: [] for name in strategies}
+    
+    for results, timing in outputs:
+        for name in all_results:
+            all_results[name].extend(results.get(name, []))
+        
+        METRICS.merge(timing['metrics'])
+        
+        print(f"  ⚙️  分片 {timing['shard']}（pid {timing['pid']}）：{timing['stocks']} 只，"
+              f"加载 {timing['load']:.2f}s，扫描 {timing['scan']:.2f}s，"
+              f"指标缓存命中 {timing['cache']['hits']} / 计算 {timing['cache']['misses']}")
+    
+    print(f"✅ 扫描完成，用时 {time.perf_counter() - started:.2f}s\n")
     
     return all_results
 
@@ -268,55 +623,62 @@ def save_results(results: Dict[str, List[Dict]]):
     # 先排序（按涨幅降序）
     results = sort_results(results)
     
-    # 保存全部结果到数据库
-    for strategy_name, stocks in results.items():
-        if stocks:
-            save_scan_result(scan_date, strategy_name, stocks)
+    # 保存全部结果到数据库（单事务，重跑覆盖同日结果）
+    with METRICS.stage('save'):
+        save_scan_results(scan_date, results)
     
     print(f"✅ 结果已保存到数据库")
     
+    for name, stocks in results.items():
+        METRICS.count(f'signals.{name}', len(stocks))
+    
     # 推送精简版（只推强势股）
-    try:
-        from src.push import send_to_dingtalk
-        print("📤 正在推送结果...")
-        send_to_dingtalk(results, scan_date)
-    except Exception as e:
-        print(f"⚠️  推送失败：{e}")
+    with METRICS.stage('push'):
+        try:
+            from src.push import send_to_dingtalk
+            print("📤 正在推送结果...")
+            send_to_dingtalk(results, scan_date)
+        except Exception as e:
+            print(f"⚠️  推送失败：{e}")
+            METRICS.error('stage', 'push', e)
 
 def main():
-    """主函数"""
+    """主函数（各阶段耗时见 src/metrics.py，CONFIG['run_report'] / CONFIG['profile'] 开启报告和剖析）"""
     print("\n" + "="*60)
     print(f"🚀 A 股策略扫描系统")
     print(f"开始时间：{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
     print("="*60)
     
-    # 初始化数据库
-    init_db()
-    
-    # 检查是否有股票数据
-    from src.database import get_stock_list
-    stocks = get_stock_list()
-    
-    if not stocks:
-        print("\n⚠️  未检测到股票数据，首次运行需要更新数据...")
-        update_stock_data()
-    
-    # 执行扫描
-    results = run_scan()
-    
-    # 打印结果
-    print_results(results)
-    
-    # 保存结果
-    save_results(results)
-    
-    print("\n" + "="*60)
-    print(f"✅ 扫描完成：{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-    print("="*60 + "\n")
-    
-    # 返回结果统计
-    total_signals = sum(len(v) for v in results.values())
-    print(f"📊 总计信号：{total_signals} 只")
+    with instrumented_run(CONFIG['run_report'], CONFIG['profile']):
+        # 初始化数据库
+        with METRICS.stage('init_db'):
+            init_db()
+        
+        # 检查是否有股票数据
+        from src.database import get_stock_list
+        stocks = get_stock_list()
+        
+        if not stocks:
+            print("\n⚠️  未检测到股票数据，首次运行需要更新数据...")
+            update_stock_data()
+        
+        # 执行扫描
+        results = run_scan()
+        
+        # 打印结果
+        print_results(results)
+        
+        # 保存结果
+        save_results(results)
+        
+        print("\n" + "="*60)
+        print(f"✅ 扫描完成：{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+        print("="*60 + "\n")
+        
+        # 返回结果统计
+        total_signals = sum(len(v) for v in results.values())
+        print(f"📊 总计信号：{total_signals} 只")
+        print(f"⏱️  {METRICS.summary()}")
     
     return results
 
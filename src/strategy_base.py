@@ -5,9 +5,33 @@
 """
 
 from abc import ABC, abstractmethod
-from typing import Dict, Optional, Any
+from typing import Dict, List, Optional, Any, Callable, Tuple, Iterable
+import inspect
+import operator
+import numpy as np
 import pandas as pd
 
+from src.panel import HistoryPanel, PANEL_FIELDS
+from src.indicators import INDICATOR_COLUMNS, HistoryIndicators, PanelIndicators, live_row
+from src.metrics import METRICS
+
+# quote_filter 支持的比较运算
+QUOTE_OPS = {
+    '=': operator.eq,
+    '!=': operator.ne,
+    '<': operator.lt,
+    '<=': operator.le,
+    '>': operator.gt,
+    '>=': operator.ge,
+}
+
+def accepts_indicators(method: Callable) -> bool:
+    """scan / scan_panel 是否接受 indicators 参数（老策略不接受，调用时不传）"""
+    try:
+        return 'indicators' in inspect.signature(method).parameters
+    except (TypeError, ValueError):
+        return False
+
 class BaseStrategy(ABC):
     """策略基类"""
     
@@ -28,22 +52,180 @@ class BaseStrategy(ABC):
         """策略版本"""
         return "1.0.0"
     
+    @property
+    def lookback(self) -> Optional[int]:
+        """scan 需要的最近 K 线数（含指标预热）；None 为扫描器默认的 history_days"""
+        return None
+    
+    @property
+    def history_columns(self) -> Optional[List[str]]:
+        """
+        scan 读取的 history 列：行情列（PANEL_FIELDS）及可选的预计算指标列（INDICATOR_COLUMNS）
+        
+        扫描器和回测只加载所有启用策略所需列的并集；None 为全部行情列和指标列
+        """
+        return None
+    
+    @property
+    def quote_filter(self) -> List[Tuple[str, str, float]]:
+        """
+        实时行情上的必要条件 [(字段, 运算, 值), ...]，全部满足的股票才可能产生信号
+        
+        扫描前对全市场行情向量化求值，不满足任何启用策略条件的股票不加载历史行情；
+        缺失字段按 0 处理（同 scan() 中的 current.get(name, 0)）。默认空列表：不预筛
+        """
+        return []
+    
+    def quote_mask(self, current: pd.DataFrame) -> np.ndarray:
+        """quote_filter 在实时行情表（每行一只股票）上的布尔掩码"""
+        mask = np.ones(len(current), dtype=bool)
+        
+        for name, op, value in self.quote_filter:
+            if op not in QUOTE_OPS:
+                raise ValueError(f"策略 {self.name} 的行情条件运算不支持: {op}")
+            mask &= QUOTE_OPS[op](self.panel_quote(current, name), value)
+        
+        return mask
+    
+    @property
+    def stateful(self) -> bool:
+        """
+        是否使用持久化的指标递推状态（IndicatorState）
+        
+        为 True 时扫描器读取 indicator_state 并把实时行情并入最新一根 K 线，
+        indicators.last(name) 取到与全历史计算一致、含盘中价格的指标值
+        """
+        return False
+    
     @abstractmethod
-    def scan(self, history: pd.DataFrame, current: Dict) -> Optional[Dict[str, Any]]:
+    def scan(self, history: pd.DataFrame, current: Dict,
+             indicators: Optional[HistoryIndicators] = None) -> Optional[Dict[str, Any]]:
         """
         扫描函数
         
         Args:
             history: 历史行情 DataFrame
             current: 当前股价信息 Dict
+            indicators: 本次扫描共享的该股指标（可选参数，扫描器检测到才传入；
+                        同一指标在多个策略间只计算一次）
         
         Returns:
             信号信息 Dict 或 None
         """
         pass
     
+    def scan_panel(self, panel: HistoryPanel, current: pd.DataFrame,
+                   indicators: Optional[PanelIndicators] = None) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+        """
+        全市场一次扫描
+        
+        默认实现是逐股调用 scan() 的适配器；策略可覆盖为基于面板数组的向量化实现，
+        同时覆盖 panel_signal() 把命中股票的字段组装成与 scan() 相同格式的信号
+        
+        Args:
+            panel: 历史行情面板（codes × bars）
+            current: 按 panel.codes 排列、以代码为索引的实时行情（price / change_percent ...）
+            indicators: 本次扫描共享的面板指标（见 src/indicators.py），None 时自行计算
+        
+        Returns:
+            (mask, fields)：mask 为 (n_codes,) 布尔数组；fields 为 {字段名: (n_codes,) 数组}，
+            默认实现只有一个 'signal' 字段，存放 scan() 返回的 dict
+        """
+        quotes = current.to_dict('index')
+        signals = np.empty(len(panel), dtype=object)
+        cache = indicators.cache if indicators is not None else None
+        pass_indicators = cache is not None and accepts_indicators(self.scan)
+        
+        for i, code in enumerate(panel.codes):
+            history = panel.history(code)
+            
+            if history is None or history.empty:
+                continue
+            
+            quote = {k: v for k, v in quotes.get(code, {}).items() if not pd.isna(v)}
+            
+            try:
+                if pass_indicators:
+                    ind = cache.for_history(code, history, live_row(indicators.live, i))
+                    signals[i] = self.scan(history, quote, indicators=ind)
+                else:
+                    signals[i] = self.scan(history, quote)
+            except Exception as e:
+                # 单只股票失败不影响其他股票，计入运行报告的策略异常数
+                METRICS.error('strategy', self.name, e)
+                signals[i] = None
+            
+            if pass_indicators:
+                cache.release(code)
+        
+        mask = np.array([bool(s) for s in signals], dtype=bool)
+        return mask, {'signal': signals}
+    
+    def panel_signal(self, fields: Dict[str, Any]) -> Dict[str, Any]:
+        """由 scan_panel 输出中单只股票的字段构造信号 dict"""
+        return fields['signal']
+    
+    @staticmethod
+    def panel_quote(current: pd.DataFrame, name: str, default: float = 0.0) -> np.ndarray:
+        """实时行情某一列的数组，缺失按 default（与 scan() 中 current.get(name, default) 一致）"""
+        if name not in current.columns:
+            return np.full(len(current), default)
+        return pd.to_numeric(current[name], errors='coerce').fillna(default).to_numpy(dtype=float)
+    
+    def indicators_for(self, history: pd.DataFrame) -> HistoryIndicators:
+        """不经缓存的单股指标（scan() 没有收到 indicators 时使用，如回测）"""
+        return HistoryIndicators(history)
+    
     def validate(self, history: pd.DataFrame, min_days: int = 30) -> bool:
         """验证数据是否足够"""
         if history is None or history.empty:
             return False
         return len(history) >= min_days
+
+def history_requirements(strategies: Iterable[BaseStrategy], default_days: int,
+                         indicators: bool = True) -> Tuple[int, List[str]]:
+    """
+    一组策略合起来需要的 (K 线数, history 列)：K 线数取最大值，列取并集（总是包含 close）
+    
+    Args:
+        strategies: 策略实例
+        default_days: 未声明 lookback 的策略使用的 K 线数
+        indicators: 是否加载预计算指标列（False 时策略按需现算）
+    """
+    days = 0
+    wanted = {'close'}
+    
+    for strategy in strategies:
+        days = max(days, strategy.lookback or default_days)
+        
+        columns = strategy.history_columns
+        if columns is None:
+            columns = PANEL_FIELDS + INDICATOR_COLUMNS
+        
+        unknown = [c for c in columns if c not in PANEL_FIELDS and c not in INDICATOR_COLUMNS]
+        if unknown:
+            raise ValueError(f"策略 {strategy.name} 声明了未知的 history 列：{', '.join(unknown)}")
+        
+        wanted.update(columns)
+    
+    columns = [c for c in PANEL_FIELDS if c in wanted]
+    if indicators:
+        columns += [c for c in INDICATOR_COLUMNS if c in wanted]
+    
+    return days or default_days, columns
+
+def check_history(strategies: Dict[str, BaseStrategy], panel: HistoryPanel):
+    """
+    面板的 K 线数或行情列少于策略声明时报错，而不是让策略取不到数据、静默地不出信号
+    
+    指标列缺失不算错误（策略通过 indicators 现算）
+    """
+    for name, strategy in strategies.items():
+        missing = [c for c in (strategy.history_columns or PANEL_FIELDS)
+                   if c in PANEL_FIELDS and c not in panel.fields]
+        
+        if missing:
+            raise ValueError(f"策略 {name} 需要的行情列未加载：{', '.join(missing)}")
+        
+        if strategy.lookback and panel.n_bars < strategy.lookback:
+            raise ValueError(f"策略 {name} 需要 {strategy.lookback} 根 K 线，只加载了 {panel.n_bars} 根")
@@ -6,8 +6,11 @@
 """
 
 from src.strategy_base import BaseStrategy
+from src.panel import HistoryPanel
+from src.indicators import HistoryIndicators, PanelIndicators
+import numpy as np
 import pandas as pd
-from typing import Dict, Optional, Any
+from typing import Dict, List, Optional, Any, Tuple
 
 class BollingerReboundStrategy(BaseStrategy):
     """布林带下轨反弹策略"""
@@ -24,48 +27,82 @@ class BollingerReboundStrategy(BaseStrategy):
     def version(self) -> str:
         return "1.0.0"
     
-    def scan(self, history: pd.DataFrame, current: Dict) -> Optional[Dict[str, Any]]:
+    @property
+    def lookback(self) -> int:
+        return 25
+    
+    @property
+    def history_columns(self) -> List[str]:
+        return ['close', 'boll_lower']
+    
+    @property
+    def quote_filter(self) -> List[Tuple[str, str, float]]:
+        return [('change_percent', '>', 0)]
+    
+    def scan(self, history: pd.DataFrame, current: Dict,
+             indicators: Optional[HistoryIndicators] = None) -> Optional[Dict[str, Any]]:
         """
         扫描布林带下轨反弹信号
         """
         if not self.validate(history, min_days=25):
             return None
         
-        try:
-            # 计算布林带（20 日，2 倍标准差）
-            ma20 = history['close'].rolling(20).mean()
-            std20 = history['close'].rolling(20).std()
-            upper = ma20 + 2 * std20
-            lower = ma20 - 2 * std20
-            
-            close = history['close']
-            
-            # 今天和昨天的数据
-            close_today = close.iloc[-1]
-            close_yesterday = close.iloc[-2]
-            lower_today = lower.iloc[-1]
-            lower_yesterday = lower.iloc[-2]
-            
-            # 下轨反弹：昨天触及或跌破下轨，今天回升且上涨
-            is_rebound = (
-                close_yesterday <= lower_yesterday * 1.02 and  # 昨天接近或跌破下轨
-                close_today > lower_today and                   # 今天回升到下轨上方
-                current.get('change_percent', 0) > 0            # 今天上涨
-            )
-            
-            if is_rebound:
-                distance = (close_today - lower_today) / lower_today * 100
-                return {
-                    'type': '布林带下轨反弹',
-                    'lower': round(lower_today, 2),
-                    'distance': round(distance, 2),
-                    'description': f'距下轨{distance:.2f}%，超跌反弹'
-                }
-            
-            return None
+        ind = indicators or self.indicators_for(history)
+        close = history['close']
         
-        except Exception as e:
-            return None
+        # 计算布林带下轨（20 日，2 倍标准差）
+        lower = ind.boll_lower(20, 2)
+        
+        # 今天和昨天的数据
+        close_today = close.iloc[-1]
+        close_yesterday = close.iloc[-2]
+        lower_today = lower.iloc[-1]
+        lower_yesterday = lower.iloc[-2]
+        
+        # 下轨反弹：昨天触及或跌破下轨，今天回升且上涨
+        is_rebound = (
+            close_yesterday <= lower_yesterday * 1.02 and  # 昨天接近或跌破下轨
+            close_today > lower_today and                   # 今天回升到下轨上方
+            current.get('change_percent', 0) > 0            # 今天上涨
+        )
+        
+        if is_rebound:
+            distance = (close_today - lower_today) / lower_today * 100
+            return {
+                'type': '布林带下轨反弹',
+                'lower': round(lower_today, 2),
+                'distance': round(distance, 2),
+                'description': f'距下轨{distance:.2f}%，超跌反弹'
+            }
+        
+        return None
+    
+    def scan_panel(self, panel: HistoryPanel, current: pd.DataFrame,
+                   indicators: Optional[PanelIndicators] = None) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+        """向量化版 scan"""
+        ind = indicators or PanelIndicators(panel)
+        close = panel.field('close')
+        lower = ind.boll_lower(20, 2)
+        
+        mask = (
+            (panel.lengths >= 25) &
+            (close[:, -2] <= lower[:, -2] * 1.02) &
+            (close[:, -1] > lower[:, -1]) &
+            (self.panel_quote(current, 'change_percent') > 0)
+        )
+        
+        return mask, {'close': close[:, -1], 'lower': lower[:, -1]}
+    
+    def panel_signal(self, fields: Dict[str, Any]) -> Dict[str, Any]:
+        close_today, lower_today = fields['close'], fields['lower']
+        distance = (close_today - lower_today) / lower_today * 100
+        
+        return {
+            'type': '布林带下轨反弹',
+            'lower': round(lower_today, 2),
+            'distance': round(distance, 2),
+            'description': f'距下轨{distance:.2f}%，超跌反弹'
+        }
 
 # 导出策略实例
 strategy = BollingerReboundStrategy()
@@ -6,8 +6,11 @@
 """
 
 from src.strategy_base import BaseStrategy
+from src.panel import HistoryPanel
+from src.indicators import HistoryIndicators, PanelIndicators
+import numpy as np
 import pandas as pd
-from typing import Dict, Optional, Any
+from typing import Dict, List, Optional, Any, Tuple
 
 class GoldenCrossStrategy(BaseStrategy):
     """均线金叉策略"""
@@ -24,55 +27,97 @@ class GoldenCrossStrategy(BaseStrategy):
     def version(self) -> str:
         return "1.0.0"
     
-    def scan(self, history: pd.DataFrame, current: Dict) -> Optional[Dict[str, Any]]:
+    @property
+    def lookback(self) -> int:
+        return 60
+    
+    @property
+    def history_columns(self) -> List[str]:
+        return ['close', 'ma5', 'ma20', 'ma60']
+    
+    @property
+    def quote_filter(self) -> List[Tuple[str, str, float]]:
+        return [('change_percent', '>', 0)]
+    
+    def scan(self, history: pd.DataFrame, current: Dict,
+             indicators: Optional[HistoryIndicators] = None) -> Optional[Dict[str, Any]]:
         """
         扫描金叉信号（优化版：加趋势和成交量过滤）
         """
         if not self.validate(history, min_days=30):
             return None
         
-        try:
-            close = history['close']
-            volume = history.get('volume', pd.Series([0]*len(close)))
-            
-            # 计算均线
-            ma5 = close.rolling(5).mean()
-            ma20 = close.rolling(20).mean()
-            ma60 = close.rolling(60).mean()
-            
-            # 今天和昨天的均线值
-            ma5_today = ma5.iloc[-1]
-            ma20_today = ma20.iloc[-1]
-            ma5_yesterday = ma5.iloc[-2]
-            ma20_yesterday = ma20.iloc[-2]
-            
-            # 判断金叉
-            is_golden_cross = (
-                ma5_today > ma20_today and 
-                ma5_yesterday <= ma20_yesterday
-            )
-            
-            if not is_golden_cross:
-                return None
-            
-            # 过滤 1: 长期趋势向上（价格在 60 日线上）
-            if close.iloc[-1] < ma60.iloc[-1]:
-                return None
-            
-            # 过滤 2: 涨幅>0（强势）
-            if current.get('change_percent', 0) <= 0:
-                return None
-            
-            return {
-                'type': '均线金叉',
-                'ma5': round(ma5_today, 2),
-                'ma20': round(ma20_today, 2),
-                'price': current.get('price', 0),
-                'description': f'5 日均线 ({ma5_today:.2f}) 上穿 20 日均线 ({ma20_today:.2f})'
-            }
+        ind = indicators or self.indicators_for(history)
+        close = history['close']
+        volume = history.get('volume', pd.Series([0]*len(close)))
+        
+        # 计算均线
+        ma5 = ind.ma(5)
+        ma20 = ind.ma(20)
+        ma60 = ind.ma(60)
+        
+        # 今天和昨天的均线值
+        ma5_today = ma5.iloc[-1]
+        ma20_today = ma20.iloc[-1]
+        ma5_yesterday = ma5.iloc[-2]
+        ma20_yesterday = ma20.iloc[-2]
+        
+        # 判断金叉
+        is_golden_cross = (
+            ma5_today > ma20_today and 
+            ma5_yesterday <= ma20_yesterday
+        )
+        
+        if not is_golden_cross:
+            return None
+        
+        # 过滤 1: 长期趋势向上（价格在 60 日线上）
+        if close.iloc[-1] < ma60.iloc[-1]:
+            return None
         
-        except Exception as e:
+        # 过滤 2: 涨幅>0（强势）
+        if current.get('change_percent', 0) <= 0:
             return None
+        
+        return {
+            'type': '均线金叉',
+            'ma5': round(ma5_today, 2),
+            'ma20': round(ma20_today, 2),
+            'price': current.get('price', 0),
+            'description': f'5 日均线 ({ma5_today:.2f}) 上穿 20 日均线 ({ma20_today:.2f})'
+        }
+    
+    def scan_panel(self, panel: HistoryPanel, current: pd.DataFrame,
+                   indicators: Optional[PanelIndicators] = None) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+        """向量化版 scan"""
+        ind = indicators or PanelIndicators(panel)
+        close = panel.field('close')
+        ma5 = ind.ma(5)
+        ma20 = ind.ma(20)
+        ma60 = ind.ma(60)
+        
+        mask = (
+            (panel.lengths >= 30) &
+            (ma5[:, -1] > ma20[:, -1]) & (ma5[:, -2] <= ma20[:, -2]) &
+            ~(close[:, -1] < ma60[:, -1]) &
+            (self.panel_quote(current, 'change_percent') > 0)
+        )
+        
+        return mask, {
+            'ma5': ma5[:, -1],
+            'ma20': ma20[:, -1],
+            'price': self.panel_quote(current, 'price'),
+        }
+    
+    def panel_signal(self, fields: Dict[str, Any]) -> Dict[str, Any]:
+        ma5_today, ma20_today = fields['ma5'], fields['ma20']
+        return {
+            'type': '均线金叉',
+            'ma5': round(ma5_today, 2),
+            'ma20': round(ma20_today, 2),
+            'price': fields['price'],
+            'description': f'5 日均线 ({ma5_today:.2f}) 上穿 20 日均线 ({ma20_today:.2f})'
+        }
 
 # 导出策略实例
 strategy = GoldenCrossStrategy()
@@ -6,8 +6,11 @@ DIF 上穿 DEA
 """
 
 from src.strategy_base import BaseStrategy
+from src.panel import HistoryPanel
+from src.indicators import HistoryIndicators, PanelIndicators
+import numpy as np
 import pandas as pd
-from typing import Dict, Optional, Any
+from typing import Dict, List, Optional, Any, Tuple
 
 class MACDCrossStrategy(BaseStrategy):
     """MACD 金叉策略"""
@@ -24,62 +27,98 @@ class MACDCrossStrategy(BaseStrategy):
     def version(self) -> str:
         return "1.0.0"
     
-    def scan(self, history: pd.DataFrame, current: Dict) -> Optional[Dict[str, Any]]:
+    @property
+    def lookback(self) -> int:
+        return 30
+    
+    @property
+    def history_columns(self) -> List[str]:
+        return ['close', 'dif', 'dea']
+    
+    @property
+    def quote_filter(self) -> List[Tuple[str, str, float]]:
+        return [('change_percent', '>', 0)]
+    
+    def scan(self, history: pd.DataFrame, current: Dict,
+             indicators: Optional[HistoryIndicators] = None) -> Optional[Dict[str, Any]]:
         """
         扫描 MACD 金叉信号（优化版：只推零轴上方 + 放量）
         """
         if not self.validate(history, min_days=30):
             return None
         
-        try:
-            close = history['close']
-            volume = history.get('volume', pd.Series([0]*len(close)))
-            
-            # 计算 EMA
-            ema12 = close.ewm(span=12, adjust=False).mean()
-            ema26 = close.ewm(span=26, adjust=False).mean()
-            
-            # 计算 DIF 和 DEA
-            dif = ema12 - ema26
-            dea = dif.ewm(span=9, adjust=False).mean()
-            
-            # 今天和昨天的值
-            dif_today = dif.iloc[-1]
-            dea_today = dea.iloc[-1]
-            dif_yesterday = dif.iloc[-2]
-            dea_yesterday = dea.iloc[-2]
-            
-            # 判断金叉
-            is_golden_cross = (
-                dif_today > dea_today and 
-                dif_yesterday <= dea_yesterday
-            )
-            
-            if not is_golden_cross:
-                return None
-            
-            # 过滤 1: 只做强势（零轴上方金叉）
-            if dif_today <= 0:
-                return None
-            
-            # 过滤 2: 涨幅>0（强势）
-            if current.get('change_percent', 0) <= 0:
-                return None
-            
-            position = "零轴上方"
-            
-            return {
-                'type': 'MACD 金叉',
-                'dif': round(dif_today, 4),
-                'dea': round(dea_today, 4),
-                'macd': round((dif_today - dea_today) * 2, 4),
-                'position': position,
-                'price': current.get('price', 0),
-                'description': f'MACD 金叉 ({position}, DIF={dif_today:.4f})'
-            }
+        ind = indicators or self.indicators_for(history)
+        close = history['close']
+        volume = history.get('volume', pd.Series([0]*len(close)))
+        
+        # 今天和昨天的 DIF、DEA（EMA12 - EMA26，DIF 的 9 日 EMA）
+        dif_today = ind.last('dif')
+        dea_today = ind.last('dea')
+        dif_yesterday = ind.last('dif', 1)
+        dea_yesterday = ind.last('dea', 1)
+        
+        # 判断金叉
+        is_golden_cross = (
+            dif_today > dea_today and 
+            dif_yesterday <= dea_yesterday
+        )
+        
+        if not is_golden_cross:
+            return None
         
-        except Exception as e:
+        # 过滤 1: 只做强势（零轴上方金叉）
+        if dif_today <= 0:
             return None
+        
+        # 过滤 2: 涨幅>0（强势）
+        if current.get('change_percent', 0) <= 0:
+            return None
+        
+        position = "零轴上方"
+        
+        return {
+            'type': 'MACD 金叉',
+            'dif': round(dif_today, 4),
+            'dea': round(dea_today, 4),
+            'macd': round((dif_today - dea_today) * 2, 4),
+            'position': position,
+            'price': current.get('price', 0),
+            'description': f'MACD 金叉 ({position}, DIF={dif_today:.4f})'
+        }
+    
+    def scan_panel(self, panel: HistoryPanel, current: pd.DataFrame,
+                   indicators: Optional[PanelIndicators] = None) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+        """向量化版 scan"""
+        ind = indicators or PanelIndicators(panel)
+        dif_today, dea_today = ind.last('dif'), ind.last('dea')
+        dif_yesterday, dea_yesterday = ind.last('dif', 1), ind.last('dea', 1)
+        
+        mask = (
+            (panel.lengths >= 30) &
+            (dif_today > dea_today) & (dif_yesterday <= dea_yesterday) &
+            ~(dif_today <= 0) &
+            ~(self.panel_quote(current, 'change_percent') <= 0)
+        )
+        
+        return mask, {
+            'dif': dif_today,
+            'dea': dea_today,
+            'price': self.panel_quote(current, 'price'),
+        }
+    
+    def panel_signal(self, fields: Dict[str, Any]) -> Dict[str, Any]:
+        dif_today, dea_today = fields['dif'], fields['dea']
+        position = "零轴上方"
+        
+        return {
+            'type': 'MACD 金叉',
+            'dif': round(dif_today, 4),
+            'dea': round(dea_today, 4),
+            'macd': round((dif_today - dea_today) * 2, 4),
+            'position': position,
+            'price': fields['price'],
+            'description': f'MACD 金叉 ({position}, DIF={dif_today:.4f})'
+        }
 
 # 导出策略实例
 strategy = MACDCrossStrategy()
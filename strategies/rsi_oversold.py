@@ -6,8 +6,11 @@ RSI<30 后回升至 30 以上
 """
 
 from src.strategy_base import BaseStrategy
+from src.panel import HistoryPanel
+from src.indicators import HistoryIndicators, PanelIndicators
+import numpy as np
 import pandas as pd
-from typing import Dict, Optional, Any
+from typing import Dict, List, Optional, Any, Tuple
 
 class RSIOversoldStrategy(BaseStrategy):
     """RSI 超卖反弹策略"""
@@ -24,43 +27,74 @@ class RSIOversoldStrategy(BaseStrategy):
     def version(self) -> str:
         return "1.0.0"
     
-    def scan(self, history: pd.DataFrame, current: Dict) -> Optional[Dict[str, Any]]:
+    @property
+    def lookback(self) -> int:
+        return 20
+    
+    @property
+    def history_columns(self) -> List[str]:
+        return ['close', 'rsi14']
+    
+    @property
+    def quote_filter(self) -> List[Tuple[str, str, float]]:
+        return [('change_percent', '>', 0)]
+    
+    def scan(self, history: pd.DataFrame, current: Dict,
+             indicators: Optional[HistoryIndicators] = None) -> Optional[Dict[str, Any]]:
         """
         扫描 RSI 超卖反弹信号
         """
         if not self.validate(history, min_days=20):
             return None
         
-        try:
-            # 计算 RSI(14)
-            delta = history['close'].diff()
-            gain = delta.where(delta > 0, 0).rolling(14).mean()
-            loss = -delta.where(delta < 0, 0).rolling(14).mean()
-            rs = gain / loss
-            rsi = 100 - (100 / (1 + rs))
-            
-            rsi_today = rsi.iloc[-1]
-            rsi_yesterday = rsi.iloc[-2]
-            
-            # 超卖反弹：昨天 RSI<30，今天 RSI>30 且股价上涨
-            is_rebound = (
-                rsi_yesterday < 30 and
-                rsi_today > 30 and
-                current.get('change_percent', 0) > 0
-            )
-            
-            if is_rebound:
-                return {
-                    'type': 'RSI 超卖反弹',
-                    'rsi': round(rsi_today, 2),
-                    'rsi_prev': round(rsi_yesterday, 2),
-                    'description': f'RSI 从{rsi_yesterday:.1f}回升至{rsi_today:.1f}'
-                }
-            
-            return None
+        ind = indicators or self.indicators_for(history)
         
-        except Exception as e:
-            return None
+        # 计算 RSI(14)
+        rsi = ind.rsi(14)
+        
+        rsi_today = rsi.iloc[-1]
+        rsi_yesterday = rsi.iloc[-2]
+        
+        # 超卖反弹：昨天 RSI<30，今天 RSI>30 且股价上涨
+        is_rebound = (
+            rsi_yesterday < 30 and
+            rsi_today > 30 and
+            current.get('change_percent', 0) > 0
+        )
+        
+        if is_rebound:
+            return {
+                'type': 'RSI 超卖反弹',
+                'rsi': round(rsi_today, 2),
+                'rsi_prev': round(rsi_yesterday, 2),
+                'description': f'RSI 从{rsi_yesterday:.1f}回升至{rsi_today:.1f}'
+            }
+        
+        return None
+    
+    def scan_panel(self, panel: HistoryPanel, current: pd.DataFrame,
+                   indicators: Optional[PanelIndicators] = None) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+        """向量化版 scan"""
+        ind = indicators or PanelIndicators(panel)
+        values = ind.rsi(14)
+        
+        mask = (
+            (panel.lengths >= 20) &
+            (values[:, -2] < 30) &
+            (values[:, -1] > 30) &
+            (self.panel_quote(current, 'change_percent') > 0)
+        )
+        
+        return mask, {'rsi': values[:, -1], 'rsi_prev': values[:, -2]}
+    
+    def panel_signal(self, fields: Dict[str, Any]) -> Dict[str, Any]:
+        rsi_today, rsi_yesterday = fields['rsi'], fields['rsi_prev']
+        return {
+            'type': 'RSI 超卖反弹',
+            'rsi': round(rsi_today, 2),
+            'rsi_prev': round(rsi_yesterday, 2),
+            'description': f'RSI 从{rsi_yesterday:.1f}回升至{rsi_today:.1f}'
+        }
 
 # 导出策略实例
 strategy = RSIOversoldStrategy()
@@ -6,8 +6,11 @@
 """
 
 from src.strategy_base import BaseStrategy
+from src.panel import HistoryPanel
+from src.indicators import HistoryIndicators, PanelIndicators
+import numpy as np
 import pandas as pd
-from typing import Dict, Optional, Any
+from typing import Dict, List, Optional, Any, Tuple
 
 class VolumeBreakStrategy(BaseStrategy):
     """放量突破策略"""
@@ -24,39 +27,78 @@ class VolumeBreakStrategy(BaseStrategy):
     def version(self) -> str:
         return "1.0.0"
     
-    def scan(self, history: pd.DataFrame, current: Dict) -> Optional[Dict[str, Any]]:
+    @property
+    def lookback(self) -> int:
+        return 10
+    
+    @property
+    def history_columns(self) -> List[str]:
+        return ['volume', 'vol_ma5']
+    
+    @property
+    def quote_filter(self) -> List[Tuple[str, str, float]]:
+        return [('change_percent', '>', 3.0)]
+    
+    def scan(self, history: pd.DataFrame, current: Dict,
+             indicators: Optional[HistoryIndicators] = None) -> Optional[Dict[str, Any]]:
         """
         扫描放量突破信号
         """
         if not self.validate(history, min_days=10):
             return None
         
-        try:
-            # 获取成交量数据
-            volume = history['volume'].iloc[-1]
-            vol_ma5 = history['volume'].rolling(5).mean().iloc[-1]
-            
-            # 获取涨跌幅
-            change_percent = current.get('change_percent', 0)
-            
-            # 量比 = 今日成交量 / 5 日均量
-            volume_ratio = volume / vol_ma5 if vol_ma5 > 0 else 0
-            
-            # 放量突破：量比>2 且 涨幅>3%
-            is_break = volume_ratio > 2.0 and change_percent > 3.0
-            
-            if is_break:
-                return {
-                    'type': '放量突破',
-                    'volume_ratio': round(volume_ratio, 2),
-                    'change_percent': change_percent,
-                    'description': f'量比{volume_ratio:.2f}x，涨幅{change_percent:.2f}%'
-                }
-            
-            return None
+        ind = indicators or self.indicators_for(history)
         
-        except Exception as e:
-            return None
+        # 获取成交量数据
+        volume = history['volume'].iloc[-1]
+        vol_ma5 = ind.ma(5, 'volume').iloc[-1]
+        
+        # 获取涨跌幅
+        change_percent = current.get('change_percent', 0)
+        
+        # 量比 = 今日成交量 / 5 日均量
+        volume_ratio = volume / vol_ma5 if vol_ma5 > 0 else 0
+        
+        # 放量突破：量比>2 且 涨幅>3%
+        is_break = volume_ratio > 2.0 and change_percent > 3.0
+        
+        if is_break:
+            return {
+                'type': '放量突破',
+                'volume_ratio': round(volume_ratio, 2),
+                'change_percent': change_percent,
+                'description': f'量比{volume_ratio:.2f}x，涨幅{change_percent:.2f}%'
+            }
+        
+        return None
+    
+    def scan_panel(self, panel: HistoryPanel, current: pd.DataFrame,
+                   indicators: Optional[PanelIndicators] = None) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+        """向量化版 scan"""
+        ind = indicators or PanelIndicators(panel)
+        volume = panel.field('volume')
+        vol_ma5 = ind.ma(5, 'volume')[:, -1]
+        change_percent = self.panel_quote(current, 'change_percent')
+        
+        with np.errstate(divide='ignore', invalid='ignore'):
+            volume_ratio = np.where(vol_ma5 > 0, volume[:, -1] / vol_ma5, 0.0)
+        
+        mask = (
+            (panel.lengths >= 10) &
+            (volume_ratio > 2.0) &
+            (change_percent > 3.0)
+        )
+        
+        return mask, {'volume_ratio': volume_ratio, 'change_percent': change_percent}
+    
+    def panel_signal(self, fields: Dict[str, Any]) -> Dict[str, Any]:
+        volume_ratio, change_percent = fields['volume_ratio'], fields['change_percent']
+        return {
+            'type': '放量突破',
+            'volume_ratio': round(volume_ratio, 2),
+            'change_percent': change_percent,
+            'description': f'量比{volume_ratio:.2f}x，涨幅{change_percent:.2f}%'
+        }
 
 # 导出策略实例
 strategy = VolumeBreakStrategy()
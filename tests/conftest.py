@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+"""测试公共配置：项目根目录加入 sys.path（与 run.py 相同），临时数据库"""
+
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from src import database
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """指向临时文件的空数据库（已建表）"""
+    monkeypatch.setattr(database, 'DB_PATH', str(tmp_path / 'stock.db'))
+    database.init_db()
+    yield database
+    database.close_connection()
+
+def make_history(codes, days: int = 80, start: str = '2026-01-05', seed: int = 0) -> pd.DataFrame:
+    """随机游走的日 K 线（code, date, open, close, high, low, volume, amount）"""
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range(start, periods=days).strftime('%Y-%m-%d')
+    frames = []
+    
+    for code in codes:
+        close = np.round(10 * np.cumprod(1 + rng.normal(0, 0.02, days)), 2)
+        frames.append(pd.DataFrame({
+            'code': code, 'date': dates, 'open': close, 'close': close, 'high': close, 'low': close,
+            'volume': rng.uniform(1e5, 1e6, days).round(), 'amount': 0.0,
+        }))
+    
+    return pd.concat(frames, ignore_index=True)
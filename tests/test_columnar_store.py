@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+"""列式存储测试"""
+
+import numpy as np
+import pandas as pd
+
+from src import columnar_store
+from src.panel import HistoryPanel
+from conftest import make_history
+
+def assert_same_panel(store_path, db, codes, days):
+    """列式存储读取的面板与 SQLite 读取的一致"""
+    panel = columnar_store.load_panel(codes, days, path=store_path)
+    expected = HistoryPanel.from_frame(db.get_history_panel(codes, days), days)
+    
+    assert panel.codes == expected.codes
+    assert panel.fields == expected.fields
+    np.testing.assert_array_equal(panel.lengths, expected.lengths)
+    np.testing.assert_array_equal(panel.dates, expected.dates)
+    np.testing.assert_array_equal(panel.values, expected.values)
+
+def test_columnar_store_matches_sqlite_through_sync(db, tmp_path):
+    """停牌、新上市的股票，增量同步（改写重叠日、追加新交易日）和新增股票后全量重建"""
+    path = str(tmp_path / 'columnar')
+    codes = ['600000', '600001', '600002']
+    db.save_stocks([{'code': c, 'name': c} for c in codes])
+    
+    history = make_history(codes, days=82)
+    dates = sorted(history['date'].unique())
+    old, new = dates[:80], dates[80:]
+    suspended = (history['code'] == '600001') & history['date'].isin(dates[30:45] + dates[75:78])
+    listed = (history['code'] != '600002') | history['date'].isin(dates[-15:])
+    history = history[~suspended & listed]
+    
+    db.save_history_frame(history[history['date'].isin(old)], indicators=False)
+    assert columnar_store.sync_columnar_store(path) == {'codes': 3, 'dates': 80, 'appended': 80}
+    
+    for days in (20, 60, 100):
+        assert_same_panel(path, db, codes, days)
+    
+    # 重叠日内的改写和新交易日都同步到存储
+    update = history[history['date'].isin(new)].copy()
+    rewrite = history[history['date'] == old[-1]].copy()
+    rewrite['close'] += 1
+    db.save_history_frame(pd.concat([rewrite, update]), indicators=False)
+    
+    assert columnar_store.sync_columnar_store(path) == {'codes': 3, 'dates': 82, 'appended': 2}
+    assert_same_panel(path, db, codes, 60)
+    assert_same_panel(path, db, ['600000', '600002'], 10)
+    
+    # 新股票改变列，全量重建
+    db.save_stocks([{'code': '600003', 'name': '600003'}])
+    db.save_history_frame(make_history(['600003'], days=5, start=new[0]), indicators=False)
+    assert columnar_store.sync_columnar_store(path)['codes'] == 4
+    assert_same_panel(path, db, codes + ['600003'], 60)
+
+def test_load_panel_without_store(tmp_path):
+    assert columnar_store.load_panel(['600000'], 60, path=str(tmp_path / 'missing')) is None
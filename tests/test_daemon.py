@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""常驻进程测试"""
+
+import socket
+import threading
+from datetime import date, datetime
+
+import pytest
+
+from src import data_fetcher, scanner
+from src.daemon import CronSchedule, ScanDaemon, send_command, socket_address
+from src.replay import ReplayServer, generate_dataset
+
+@pytest.mark.parametrize('expr, now, expected', [
+    # 交易日收盘后：周五当时之后是下周一
+    ('30 15 * * 1-5', datetime(2026, 10, 16, 15, 30), datetime(2026, 10, 19, 15, 30)),
+    ('30 15 * * 1-5', datetime(2026, 10, 16, 15, 29, 59), datetime(2026, 10, 16, 15, 30)),
+    # 步长、列表、跨小时
+    ('*/20 9-10 * * *', datetime(2026, 10, 16, 10, 41), datetime(2026, 10, 17, 9, 0)),
+    ('0,45 * * * *', datetime(2026, 10, 16, 23, 50), datetime(2026, 10, 17, 0, 0)),
+    ('5-30/10 * * * *', datetime(2026, 10, 16, 8, 26), datetime(2026, 10, 16, 9, 5)),
+    # 日和星期都指定时满足其一；星期 7 即周日
+    ('0 8 1 * 0', datetime(2026, 10, 16, 12, 0), datetime(2026, 10, 18, 8, 0)),
+    ('0 8 17 * 7', datetime(2026, 10, 16, 12, 0), datetime(2026, 10, 17, 8, 0)),
+    # 只有闰年才有的日期、跨年
+    ('0 0 29 2 *', datetime(2026, 3, 1), datetime(2028, 2, 29)),
+    ('59 23 31 12 *', datetime(2026, 12, 31, 23, 59), datetime(2027, 12, 31, 23, 59)),
+])
+def test_cron_next_after(expr, now, expected):
+    schedule = CronSchedule(expr)
+    assert schedule.next_after(now) == expected
+    assert schedule.matches(expected)
+
+@pytest.mark.parametrize('expr', [
+    '* * * *', '60 * * * *', '* 24 * * *', '* * 0 * *', '* * * 13 *', '* * * * 8',
+    '5-1 * * * *', '*/0 * * * *', 'a * * * *', '1,,2 * * * *',
+])
+def test_cron_rejects_invalid_expressions(expr):
+    with pytest.raises(ValueError):
+        CronSchedule(expr)
+
+def test_cron_without_any_run_time():
+    with pytest.raises(ValueError):
+        CronSchedule('0 0 31 2 *').next_after(datetime(2026, 1, 1))
+
+def test_socket_address_accepts_loopback_only():
+    assert socket_address('127.0.0.1:7788') == (socket.AF_INET, ('127.0.0.1', 7788))
+    assert socket_address('localhost:7788') == (socket.AF_INET, ('127.0.0.1', 7788))
+    assert socket_address(':7788') == (socket.AF_INET, ('127.0.0.1', 7788))
+    assert socket_address('./data/daemon.sock')[0] == socket.AF_UNIX
+    
+    for text in ('0.0.0.0:7788', '192.168.1.10:7788', 'example.com:7788'):
+        with pytest.raises(ValueError):
+            socket_address(text)
+
+def test_control_socket_commands(db, tmp_path, monkeypatch):
+    """命令经 socket 执行：状态、扫描（结果与直接扫描一致）、未知命令报错、停止"""
+    monkeypatch.setattr(data_fetcher, 'STOCK_LIST_CACHE', str(tmp_path / 'stock_list.json'))
+    monkeypatch.setitem(scanner.CONFIG, 'fetch_rate', 1000.0)
+    monkeypatch.setitem(scanner.CONFIG, 'columnar_store', False)
+    address = str(tmp_path / 'daemon.sock')
+    
+    with ReplayServer(generate_dataset(60, 80)):
+        assert scanner.update_stock_data(incremental=False)
+        
+        daemon = ScanDaemon({'scan_schedule': '', 'update_schedule': '', 'socket': address, 'max_memory_mb': 0})
+        daemon.day = date.today()
+        daemon.reload()
+        
+        sock = daemon._listen()
+        server = threading.Thread(target=daemon._serve, args=(sock,))
+        server.start()
+        
+        try:
+            status = send_command('status', address=address)
+            scanned = send_command('scan', address=address, save=False)
+            unknown = send_command('nope', address=address)
+            assert send_command('stop', address=address) == {'ok': True}
+        finally:
+            daemon._stop = True
+            server.join(timeout=10)
+            sock.close()
+        
+        expected = scanner.run_scan(daemon.strategies)
+    
+    assert status['ok'] and status['panel']['codes'] == 60 and status['resident']
+    assert scanned['ok'] and scanned['signals'] == {name: len(r) for name, r in expected.items()}
+    assert not scanned['saved'] and db.query_scan_results().empty
+    assert unknown == {'ok': False, 'error': '未知命令: nope'}
+    
+    with pytest.raises(ConnectionError):
+        send_command('status', address=str(tmp_path / 'missing.sock'))
@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+"""数据获取模块测试（使用 src/replay.py 的本地替身服务）"""
+
+import time
+
+import pytest
+
+from src import data_fetcher
+from src.replay import ReplayServer, empty_dataset, generate_dataset
+
+def test_single_503_reaches_adaptive_limiter():
+    """一次 503 不被连接池重试吞掉，直接让 AdaptiveLimiter 降速"""
+    limiter = data_fetcher.AdaptiveLimiter(rate=100, concurrency=4)
+    
+    with ReplayServer(empty_dataset(), error_rate=1.0) as server:
+        try:
+            with limiter.slot():
+                response = data_fetcher.http_get(data_fetcher.TENCENT_HISTORY_URL, params={'param': 'sh600000'})
+                data_fetcher._check_throttled(response)
+        except data_fetcher.ThrottledError:
+            pass
+        else:
+            raise AssertionError('503 应视为限流')
+        
+        assert server.stats['requests'] == 1
+    
+    assert limiter.throttled == 1
+    assert limiter.rate < 100
+    assert limiter.concurrency < 4
+
+def test_stock_list_refresh_survives_throttling(tmp_path, monkeypatch):
+    """新浪列表分页遇到 503 / Forbidden 时经 AdaptiveLimiter 重试，不放弃整次刷新"""
+    monkeypatch.setattr(data_fetcher, 'STOCK_LIST_CACHE', str(tmp_path / 'stock_list.json'))
+    monkeypatch.setitem(data_fetcher.LIST_CONFIG, 'rate', 1000.0)
+    monkeypatch.setitem(data_fetcher.LIST_CONFIG, 'page_size', 10)
+    monkeypatch.setitem(data_fetcher.ADAPTIVE_CONFIG, 'cooldown', 0.0)
+    
+    with ReplayServer(generate_dataset(60, 5), error_rate=0.15, forbidden_rate=0.15, seed=1) as server:
+        stocks = data_fetcher.get_all_a_stocks(use_cache=False)
+        assert server.stats['errors'] + server.stats['forbidden'] > 0
+    
+    assert len(stocks) == 60
+
+def test_single_quote_retries_throttling(monkeypatch):
+    """单只实时行情请求被限流时退避重试，Forbidden 同样视为限流"""
+    monkeypatch.setitem(data_fetcher.HTTP_CONFIG, 'backoff_factor', 0.0)
+    
+    with ReplayServer(generate_dataset(2, 5), forbidden_rate=0.15, error_rate=0.15, seed=3) as server:
+        quotes = [data_fetcher.get_stock_current_info(code) for code in ('600000', '000001') * 5]
+        assert server.stats['errors'] + server.stats['forbidden'] > 0
+    
+    assert all(q is not None and q['price'] > 0 for q in quotes)
+
+def test_token_bucket_burst_scales_with_rate():
+    """burst 个令牌可立即取得；降速时桶容量同比例缩小"""
+    bucket = data_fetcher.TokenBucket(rate=1.0, capacity=50)
+    start = time.monotonic()
+    for _ in range(50):
+        bucket.acquire()
+    assert time.monotonic() - start < 0.5
+    
+    bucket.set_rate(0.5)
+    assert bucket.capacity == 25
+    bucket.set_rate(0.01)
+    assert bucket.capacity == 1
+
+def test_full_market_quotes_within_burst():
+    """默认 QUOTE_CONFIG 下一轮全市场行情不受持续速率限制"""
+    dataset = generate_dataset(5000, 2)
+    codes = [stock['code'] for stocks in dataset['lists'].values() for stock in stocks]
+    
+    with ReplayServer(dataset, latency=0.02):
+        start = time.monotonic()
+        frame, stats = data_fetcher.fetch_quote_frame(codes)
+        elapsed = time.monotonic() - start
+    
+    assert len(frame) == 5000 and stats.failed == 0
+    # 约 84 批；令牌桶容量等于 rate 时至少需要 (84 - 30) / 30 ≈ 1.8 秒
+    assert elapsed < 1.5
+
+def test_stale_since_replaces_stored_history():
+    """缺口不小于 days 时下载全量窗口，并按除权同样通知调用方整体替换"""
+    dataset = generate_dataset(2, 40)
+    first = dataset['klines']['sh600000'][0][0]
+    results, replaced = {}, []
+    
+    with ReplayServer(dataset):
+        stats = data_fetcher.fetch_histories(
+            ['600000'], days=10, since={'600000': first}, rate=1000.0,
+            on_result=results.__setitem__, on_adjusted=replaced.append,
+        )
+    
+    assert replaced == ['600000'] and stats.adjusted == ['600000']
+    assert len(results['600000']) == 10
+
+def test_fetch_histories_concurrent_then_incremental():
+    """并发全量下载每只股票各一次请求；增量只返回 since 之后的 K 线"""
+    dataset = generate_dataset(40, 30)
+    codes = [stock['code'] for stocks in dataset['lists'].values() for stock in stocks]
+    bars = {symbol[2:]: rows for symbol, rows in dataset['klines'].items()}
+    
+    with ReplayServer(dataset) as server:
+        full = {}
+        stats = data_fetcher.fetch_histories(codes + ['600999'], days=30, workers=8, rate=1000.0,
+                                             on_result=full.__setitem__)
+        
+        assert (stats.success, stats.empty, stats.failed) == (40, 1, 0)
+        assert server.stats['requests'] == 41
+        for code in codes:
+            assert full[code]['date'].tolist() == [bar[0] for bar in bars[code]]
+            assert full[code]['close'].tolist() == [float(bar[2]) for bar in bars[code]]
+        
+        since = {code: bars[code][-4][0] for code in codes}
+        closes = {code: float(bars[code][-4][2]) for code in codes}
+        delta = {}
+        stats = data_fetcher.fetch_histories(codes, days=30, since=since, closes=closes, rate=1000.0,
+                                             on_result=delta.__setitem__)
+        
+        assert stats.success == 40 and stats.adjusted == []
+        assert server.stats['requests'] == 81
+    
+    for code in codes:
+        assert delta[code]['date'].tolist() == [bar[0] for bar in bars[code][-3:]]
+
+def test_quote_frame_matches_single_quote_parser():
+    """列式批量解析与逐股解析结果一致（字段不全、停牌、昨收为 0、未知代码）"""
+    dataset = generate_dataset(6, 3)
+    quotes = dataset['quotes']
+    quotes['sh600000'] = '~'.join(quotes['sh600000'].split('~')[:35])  # 只有 35 个字段
+    quotes['sz000001'] = '~'.join(quotes['sz000001'].split('~')[:20])  # 字段不足，丢弃
+    fields = quotes['sh600001'].split('~')
+    fields[3], fields[4] = '', '0.00'  # 停牌无价格、昨收为 0
+    quotes['sh600001'] = '~'.join(fields)
+    codes = [stock['code'] for stocks in dataset['lists'].values() for stock in stocks]
+    
+    with ReplayServer(dataset):
+        frame, stats = data_fetcher.fetch_quote_frame(codes + ['600999'])
+        singles = {code: data_fetcher.get_stock_current_info(code) for code in codes}
+    
+    batch = data_fetcher.quote_frame_to_dict(frame)
+    assert stats.failed == 0
+    assert sorted(batch) == sorted(code for code, quote in singles.items() if quote)
+    assert '000001' not in batch and '600999' not in batch
+    
+    for code, quote in batch.items():
+        assert quote['name'] == singles[code]['name']
+        for key in data_fetcher.QUOTE_DICT_COLUMNS:
+            if key not in ('code', 'name'):
+                assert quote[key] == pytest.approx(singles[code][key]), (code, key)
+    
+    assert batch['600001']['price'] == 0 and batch['600001']['change_percent'] == 0
@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*-
+"""数据库模块测试"""
+
+import sqlite3
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src import database
+from conftest import make_history
+
+# 未记录结构版本的初始库（首个版本 init_db 建的表）
+BASELINE_SCHEMA = '''
+    CREATE TABLE stocks (
+        code TEXT PRIMARY KEY,
+        name TEXT NOT NULL,
+        market TEXT,
+        sector TEXT,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE TABLE stock_history (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        code TEXT NOT NULL,
+        date TEXT NOT NULL,
+        open REAL,
+        close REAL,
+        high REAL,
+        low REAL,
+        volume REAL,
+        amount REAL,
+        UNIQUE(code, date)
+    );
+    CREATE TABLE scan_results (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        scan_date TEXT NOT NULL,
+        strategy_name TEXT NOT NULL,
+        stock_code TEXT NOT NULL,
+        stock_name TEXT NOT NULL,
+        price REAL,
+        change_percent REAL,
+        signal_info TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE TABLE push_records (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        scan_date TEXT NOT NULL,
+        platform TEXT NOT NULL,
+        status TEXT,
+        message TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE INDEX idx_history_code_date ON stock_history(code, date);
+    CREATE INDEX idx_results_date ON scan_results(scan_date);
+    CREATE INDEX idx_results_strategy ON scan_results(strategy_name);
+'''
+
+def result(code: str, signal, price: float = 10.0) -> dict:
+    return {'code': code, 'name': '测试', 'price': price, 'change_percent': 1.0, 'signal': signal}
+
+def test_migrations_upgrade_baseline_database(tmp_path, monkeypatch):
+    """未记录版本的初始库依次升级到最新版本，已有行情和扫描结果保留并转换"""
+    path = tmp_path / 'stock.db'
+    conn = sqlite3.connect(path)
+    conn.executescript(BASELINE_SCHEMA)
+    conn.execute("INSERT INTO stocks (code, name) VALUES ('600000', '浦发银行')")
+    conn.executemany(
+        'INSERT INTO stock_history (code, date, open, close, high, low, volume, amount) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+        [('600000', '2026-02-27', 10.5, 10.8, 11.0, 10.2, 1e6, 1e7),
+         ('600000', '2026-02-26', 10.0, 10.5, 11.0, 9.8, 1e6, 1e7)]
+    )
+    conn.executemany(
+        '''INSERT INTO scan_results (scan_date, strategy_name, stock_code, stock_name, price, change_percent, signal_info)
+           VALUES ('2026-02-27', ?, '600000', '浦发银行', 10.8, 2.9, ?)''',
+        [('rsi_oversold', "{'type': 'RSI 超卖', 'rsi': 26.5}"),
+         ('rsi_oversold', "{'type': 'RSI 超卖', 'rsi': 24.1}"),  # 旧版本重复保存
+         ('macd_cross', 'MACD 金叉')]
+    )
+    conn.commit()
+    conn.close()
+    
+    monkeypatch.setattr(database, 'DB_PATH', str(path))
+    try:
+        database.init_db()
+        conn = database.get_connection()
+        
+        assert database.get_schema_version() == database.MIGRATIONS[-1][0]
+        sql = conn.execute("SELECT sql FROM sqlite_master WHERE name = 'stock_history'").fetchone()[0]
+        assert 'WITHOUT ROWID' in sql
+        assert conn.execute('SELECT date FROM stock_history').fetchall() == [(20260226,), (20260227,)]
+        assert database.get_history('600000')['close'].tolist() == [10.5, 10.8]
+        
+        results = database.query_scan_results('2026-02-27', order_by=['strategy_name'])
+        assert results['strategy_name'].tolist() == ['macd_cross', 'rsi_oversold']
+        assert results['rsi'].tolist()[1] == 24.1 and results['signal_type'].tolist()[1] == 'RSI 超卖'
+        assert database.parse_signal(results['signal_info'][0]) == {'description': 'MACD 金叉'}
+        
+        indexes = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+        assert {'idx_results_unique', 'idx_results_strategy', 'idx_results_date_strategy_id'} <= indexes
+        assert not {'idx_history_code_date', 'idx_results_date'} & indexes
+        
+        # 升级后的库正常写入行情、维护指标；再次初始化不重复迁移
+        database.save_history_frame(make_history(['600000'], days=30, start='2026-03-02'))
+        assert len(database.load_indicator_state(['600000'])) == 1
+        database.init_db()
+        assert conn.execute('SELECT COUNT(*) FROM schema_version').fetchone()[0] == len(database.MIGRATIONS)
+    finally:
+        database.close_connection()
+
+def test_bulk_writes_upsert_and_replace(db):
+    """股票列表按差异同步；行情重复写入覆盖，replace 整体替换一只股票的历史"""
+    stocks = [{'code': f'{600000 + i}', 'name': f'股票{i}'} for i in range(40)]
+    assert db.sync_stocks(stocks) == {'added': 40, 'changed': 0, 'removed': 0}
+    
+    stocks[0] = {'code': '600000', 'name': 'ST股票0'}
+    assert db.sync_stocks(stocks[:-1]) == {'added': 0, 'changed': 1, 'removed': 1}
+    assert db.sync_stocks(stocks[:20]) == {'added': 0, 'changed': 0, 'removed': 0}  # 退市过多，视为列表不完整
+    assert len(db.get_stock_list()) == 39
+    
+    history = make_history(['600000', '600001'], days=30)
+    assert db.save_history_frame(history) == 60
+    assert db.save_history_frame(history[history['date'] >= '2026-02-09']) == 10
+    assert db.get_connection().execute('SELECT COUNT(*) FROM stock_history').fetchone()[0] == 60
+    
+    rebased = make_history(['600000'], days=10, start='2026-02-02', seed=1)
+    db.save_history_frame(rebased, replace=['600000'])
+    assert db.get_history('600000', days=100)['close'].tolist() == rebased['close'].tolist()
+    assert len(db.get_history('600001', days=100)) == 30
+
+def test_history_panel_matches_per_stock_reads(db):
+    """一次查询加载的面板与逐股读取一致（K 线不足、没有数据、代码数超过 SQL 参数上限）"""
+    history = make_history(['600000', '600001', '600002'], days=50)
+    history = history[(history['code'] != '600002') | (history['date'] >= '2026-02-23')]
+    db.save_history_frame(history)
+    codes = ['600000', '600001', '600002'] + [f'{300000 + i}' for i in range(1200)]
+    
+    panel = db.get_history_panel(codes, 40)
+    assert sorted(panel.index.unique('code')) == ['600000', '600001', '600002']
+    
+    for code in ['600000', '600001', '600002']:
+        expected = db.get_history(code, 40)
+        frame = panel.loc[code].reset_index()
+        pd.testing.assert_frame_equal(frame[expected.columns], expected)
+    
+    full = db.get_history_panel(None, None, ['close', 'rsi14'])
+    assert len(full) == len(history)
+    assert full['rsi14'].notna().any()
+    
+    with pytest.raises(ValueError):
+        db.get_history('600000', columns=['close', 'unknown'])
+
+def test_scan_results_store_json_and_query_in_sql(db):
+    """信号以 JSON 保存（含 numpy 标量），类型化列和任意信号键都可在 SQL 中过滤排序"""
+    db.save_scan_results('2026-02-27', {
+        'rsi_oversold': [
+            result('600000', {'type': 'RSI 超卖', 'rsi': np.float64(22.5), 'tags': ['放量']}),
+            result('600001', {'type': 'RSI 超卖', 'rsi': 28.0, 'level': 2}),
+            result('600002', {'type': 'RSI 超卖', 'rsi': 'n/a'}),
+        ],
+        'macd_cross': [result('600000', 'MACD 金叉')],
+    })
+    # 重复保存同一 (日期, 策略, 代码) 时覆盖
+    db.save_scan_results('2026-02-27', {'rsi_oversold': [result('600001', {'type': 'RSI 超卖', 'rsi': 26.0, 'level': 3}, 11.0)]})
+    
+    rows = db.query_scan_results('2026-02-27', 'rsi_oversold', order_by=['rsi'])
+    assert rows['stock_code'].tolist() == ['600002', '600000', '600001']
+    assert rows['rsi'].isna().tolist() == [True, False, False]
+    assert db.parse_signal(rows['signal_info'][1]) == {'type': 'RSI 超卖', 'rsi': 22.5, 'tags': ['放量']}
+    assert rows['price'].tolist()[2] == 11.0
+    
+    low = db.query_scan_results(filters=[('rsi', '<', 25)], columns=['stock_code', 'rsi'])
+    assert low.to_dict('records') == [{'stock_code': '600000', 'rsi': 22.5}]
+    
+    by_key = db.fetch_scan_results(filters=[('signal.level', '>=', 3)], columns=['stock_code', 'level'])
+    assert by_key == [{'stock_code': '600001', 'level': 3}]
+    
+    assert len(db.query_scan_results(codes=['600000'])) == 2
+    assert len(db.query_scan_results(codes=[])) == 0
+    assert db.query_scan_results(filters=[('description', 'like', 'MACD%')])['strategy_name'].tolist() == ['macd_cross']
+    assert db.query_scan_results(order_by=['-rsi'], limit=1)['stock_code'].tolist() == ['600001']
+    
+    with pytest.raises(ValueError):
+        db.query_scan_results(filters=[("rsi') OR 1=1 --", '<', 25)])
+    with pytest.raises(ValueError):
+        db.query_scan_results(filters=[('rsi', 'glob', '*')])
+
+def test_iter_scan_results_pages_along_index(db):
+    """按日期 + 策略分页读取扫描结果时沿 (scan_date, strategy_name, id) 索引，不排序"""
+    db.save_scan_results('2026-02-27', {
+        'rsi_oversold': [
+            {'code': f'{600000 + i}', 'name': '测试', 'price': 10.0, 'change_percent': 1.0,
+             'signal': {'type': 'RSI 超卖', 'rsi': 25.0}}
+            for i in range(5)
+        ],
+        'macd_cross': [{'code': '600000', 'name': '测试', 'signal': {'type': 'MACD 金叉'}}],
+    })
+    
+    pages = list(db.iter_scan_results('2026-02-27', 'rsi_oversold', chunk_size=2))
+    assert [len(p) for p in pages] == [2, 2, 1]
+    assert list(pages[0]['id']) == sorted(pages[0]['id'], reverse=True)
+    
+    plan = db.get_connection().execute('''
+        EXPLAIN QUERY PLAN
+        SELECT * FROM scan_results
+        WHERE scan_date = ? AND strategy_name = ? AND id < ?
+        ORDER BY id DESC LIMIT ?
+    ''', ('2026-02-27', 'rsi_oversold', 1 << 62, 2)).fetchall()
+    detail = ' '.join(row[-1] for row in plan)
+    
+    assert 'idx_results_date_strategy_id' in detail
+    assert 'TEMP B-TREE' not in detail
+
+def test_code_list_reads_leave_caller_transaction_open(db):
+    """按代码列表读取（面板、指标状态）不提交调用方未完成的事务"""
+    db.save_history_frame(make_history(['600000', '600001'], days=30))
+    conn = db.get_connection()
+    
+    conn.execute("INSERT INTO stocks (code, name) VALUES ('600000', '未提交')")
+    assert len(db.get_history_panel(['600000', '600001'], 10)) == 20
+    assert len(db.load_indicator_state(['600001'])) == 1
+    assert conn.in_transaction
+    
+    conn.rollback()
+    assert db.get_stock_list() == []
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+"""递推状态指标测试"""
+
+import numpy as np
+import pandas as pd
+
+from src import scanner
+from src.indicators import INDICATOR_COLUMNS, compute_indicators
+from src.panel import HistoryPanel
+from src.strategy_base import BaseStrategy
+from conftest import make_history
+
+class StatefulStrategy(BaseStrategy):
+    name = 'stateful'
+    description = '测试用'
+    stateful = True
+    
+    def scan(self, history, current):
+        return None
+
+def test_live_indicators_merge_quote_for_codes_with_and_without_state(db):
+    """有持久化状态和没有状态的股票都把实时行情当作新 K 线并入，结果与全历史计算一致"""
+    codes = ['600000', '600001', '600002', '600003']
+    db.save_history_frame(make_history(codes))
+    
+    conn = db.get_connection()
+    conn.execute("DELETE FROM indicator_state WHERE code IN ('600001', '600003')")
+    conn.commit()
+    assert len(db.load_indicator_state()) == 2
+    
+    panel = HistoryPanel.from_frame(db.get_history_panel(codes, None, ['close', 'volume']), None,
+                                    ['close', 'volume'])
+    close, volume = panel.field('close'), panel.field('volume')
+    price = np.round(close[:, -1] * 1.03, 2)
+    current = pd.DataFrame({'price': price, 'yesterday_close': close[:, -1], 'volume': 5e5},
+                           index=pd.Index(panel.codes, name='code'))
+    
+    live = scanner.live_indicators({'stateful': StatefulStrategy()}, panel, current)
+    expected = compute_indicators(np.column_stack([close, price]), np.column_stack([volume, np.full(len(codes), 5e5)]))
+    
+    for back in (0, 1):
+        for name in INDICATOR_COLUMNS:
+            np.testing.assert_allclose(live[back][name], expected[name][:, -1 - back], rtol=1e-9, err_msg=name)
+
+def test_indicator_state_steps_only_flushed_codes(db):
+    """按批写入新 K 线时只推进该批股票的状态，结果与全历史计算一致"""
+    codes = ['600000', '600001', '600002']
+    history = make_history(codes, days=81)
+    last_date = history['date'].max()
+    
+    db.save_history_frame(history[history['date'] < last_date])
+    before = db.load_indicator_state(codes)
+    
+    db.save_history_frame(history[(history['date'] == last_date) & (history['code'] == '600001')])
+    after = db.load_indicator_state(codes)
+    
+    assert list(after.dates != before.dates) == [False, True, False]
+    
+    panel = HistoryPanel.from_frame(db.get_history_panel(['600001'], None, ['close', 'volume']), None,
+                                    ['close', 'volume'])
+    expected = compute_indicators(panel.field('close'), panel.field('volume'))
+    values = after.select(['600001']).values()
+    
+    for name in INDICATOR_COLUMNS:
+        np.testing.assert_allclose(values[name], expected[name][:, -1], rtol=1e-9, err_msg=name)
+
+def test_persisted_indicators_match_full_history(db):
+    """分批写入行情后增量维护的指标表与全历史计算一致；缺失的指标由 update_indicators 补算"""
+    codes = ['600000', '600001']
+    history = make_history(codes, days=140)
+    dates = sorted(history['date'].unique())
+    
+    for batch in (dates[:100], dates[100:135], dates[135:]):
+        db.save_history_frame(history[history['date'].isin(batch)])
+    
+    conn = db.get_connection()
+    conn.execute("DELETE FROM stock_indicators WHERE code = '600001' AND date >= 20260601")
+    conn.commit()
+    assert db.update_indicators() > 0
+    
+    frame = db.get_history_panel(codes, None, ['close', 'volume'] + INDICATOR_COLUMNS)
+    
+    for code in codes:
+        rows = frame.loc[code]
+        expected = compute_indicators(rows['close'].to_numpy()[None, :], rows['volume'].to_numpy()[None, :])
+        
+        for name in INDICATOR_COLUMNS:
+            np.testing.assert_allclose(rows[name].to_numpy(), expected[name][0], rtol=1e-9, err_msg=name)
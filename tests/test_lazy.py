@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+"""延迟导入测试"""
+
+import sys
+
+from src.lazy import is_loaded, lazy_import
+
+def test_lazy_module_loads_on_first_attribute(monkeypatch):
+    monkeypatch.delitem(sys.modules, 'colorsys', raising=False)
+    
+    colorsys = lazy_import('colorsys')
+    assert sys.modules['colorsys'] is colorsys
+    assert not is_loaded('colorsys')
+    
+    assert colorsys.rgb_to_hsv(1.0, 0.0, 0.0) == (0.0, 1.0, 1.0)
+    assert is_loaded('colorsys')
+    assert lazy_import('colorsys') is colorsys
+    
+    assert is_loaded('os')
+    assert not is_loaded('no_such_module')
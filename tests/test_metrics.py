@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""运行指标测试"""
+
+import json
+
+import pytest
+
+from src import data_fetcher, metrics
+from src.metrics import METRICS, RunMetrics, instrumented_run, percentile, timed
+from src.replay import ReplayServer, empty_dataset
+
+def test_percentile_interpolates():
+    assert percentile([], 50) == 0.0
+    assert percentile([1.0], 99) == 1.0
+    assert percentile([1.0, 2.0, 3.0, 4.0], 50) == 2.5
+    assert percentile([0.0, 10.0], 90) == 9.0
+
+def test_report_timers_errors_and_merge():
+    """计时按分组累计，异常计数并入对应条目，子进程报告合并后次数、最长一次、异常都保留"""
+    run = RunMetrics()
+    run.add('strategy', 'rsi_oversold', 0.3)
+    run.add('strategy', 'rsi_oversold', 1.0, calls=4)
+    run.error('strategy', 'macd_cross', KeyError('dif'))
+    run.count('stocks.total', 10)
+    
+    child = RunMetrics()
+    child.add('strategy', 'rsi_oversold', 0.9)
+    child.error('strategy', 'rsi_oversold', ValueError('boom'))
+    child.count('stocks.total', 5)
+    run.merge(child.report())
+    
+    report = json.loads(json.dumps(run.report()))
+    assert report['strategy']['rsi_oversold'] == {
+        'calls': 6, 'seconds': 2.2, 'max': 0.9, 'errors': 1, 'last_error': 'ValueError: boom',
+    }
+    assert report['strategy']['macd_cross'] == {
+        'calls': 0, 'seconds': 0.0, 'max': 0.0, 'errors': 1, 'last_error': "KeyError: 'dif'",
+    }
+    assert report['counters'] == {'stocks.total': 15}
+
+def test_http_latency_recorded_per_endpoint():
+    """每次 HTTP 请求按接口记录延迟和错误数"""
+    METRICS.reset()
+    
+    with ReplayServer(empty_dataset(), error_rate=1.0):
+        response = data_fetcher.http_get(data_fetcher.TENCENT_HISTORY_URL, params={'param': 'sh600000'})
+        assert response.status_code == 503
+    
+    with ReplayServer(empty_dataset()):
+        for _ in range(3):
+            data_fetcher.http_get(data_fetcher.TENCENT_HISTORY_URL, params={'param': 'sh600000'})
+    
+    (entry,) = METRICS.report()['fetch'].values()
+    assert (entry['requests'], entry['errors']) == (4, 1)
+    assert 0 < entry['p50'] <= entry['p99'] <= entry['max']
+
+def test_instrumented_run_writes_report_on_error(tmp_path):
+    """运行异常退出时仍写出报告和剖析文件；timed 装饰的函数计入报告"""
+    @timed('db', 'load')
+    def load():
+        raise RuntimeError('disk')
+    
+    template = str(tmp_path / 'run-%Y%m%d.json')
+    profile = str(tmp_path / 'scan.prof')
+    
+    with pytest.raises(RuntimeError):
+        with instrumented_run(template, profile):
+            with METRICS.stage('scan'):
+                load()
+    
+    (path,) = tmp_path.glob('run-*.json')
+    report = json.loads(path.read_text(encoding='utf-8'))
+    assert report['stage']['scan']['calls'] == 1
+    assert report['db']['load']['calls'] == 1
+    assert (tmp_path / 'scan.prof').exists()
+    assert metrics.run_path(None) is None
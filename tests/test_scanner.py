@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+"""扫描器数据更新测试（使用 src/replay.py 的本地替身服务）"""
+
+import copy
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src import data_fetcher, scanner
+from src.plugins import PluginRegistry
+from src.replay import ReplayServer, generate_dataset
+from src.strategy_base import BaseStrategy, history_requirements
+from strategies.macd_cross import MACDCrossStrategy
+
+@pytest.fixture
+def replay(db, tmp_path, monkeypatch):
+    """4 只股票 40 个交易日的替身服务，股票列表缓存写到临时目录"""
+    monkeypatch.setattr(data_fetcher, 'STOCK_LIST_CACHE', str(tmp_path / 'stock_list.json'))
+    monkeypatch.setitem(scanner.CONFIG, 'fetch_rate', 1000.0)
+    monkeypatch.setitem(scanner.CONFIG, 'columnar_store', False)
+    
+    with ReplayServer(generate_dataset(4, 40)) as server:
+        yield server
+
+@pytest.fixture
+def replay_market(db, tmp_path, monkeypatch):
+    """200 只股票 120 个交易日的替身服务，行情已全量入库"""
+    monkeypatch.setattr(data_fetcher, 'STOCK_LIST_CACHE', str(tmp_path / 'stock_list.json'))
+    monkeypatch.setitem(scanner.CONFIG, 'fetch_rate', 1000.0)
+    monkeypatch.setitem(scanner.CONFIG, 'columnar_store', False)
+    
+    with ReplayServer(generate_dataset(200, 120)) as server:
+        assert scanner.update_stock_data(incremental=False)
+        yield server
+
+def stored_closes(db, code):
+    rows = db.get_connection().execute(
+        'SELECT date, close FROM stock_history WHERE code = ? ORDER BY date', (code,)
+    ).fetchall()
+    return [(db.int_to_date(d), c) for d, c in rows]
+
+def test_incremental_update_refetches_after_adjustment(db, replay):
+    """增量更新时重叠 K 线收盘价变化（除权）的股票全量重新下载，旧历史整体替换"""
+    full = copy.deepcopy(replay.dataset['klines'])
+    replay.dataset['klines'] = {symbol: bars[:-1] for symbol, bars in full.items()}
+    assert scanner.update_stock_data(incremental=True)
+    
+    # 除权：最后一根之前的前复权价格整体下调 10%
+    adjusted = copy.deepcopy(full)
+    for bar in adjusted['sh600000'][:-1]:
+        bar[1:5] = [f'{float(v) * 0.9:.2f}' for v in bar[1:5]]
+    replay.dataset['klines'] = adjusted
+    
+    requests = replay.stats['requests']
+    assert scanner.update_stock_data(incremental=True)
+    
+    assert stored_closes(db, '600000') == [(bar[0], float(bar[2])) for bar in adjusted['sh600000']]
+    assert stored_closes(db, '000001') == [(bar[0], float(bar[2])) for bar in full['sz000001']]
+    
+    # 股票列表走缓存；未除权的 3 只各一次增量请求，除权的 1 只增量 + 全量
+    assert replay.stats['requests'] - requests == 5
+    
+    state = db.load_indicator_state(['600000'])
+    assert state.closes[0, -1] == float(adjusted['sh600000'][-1][2])
+    assert state.closes[0, -2] == float(adjusted['sh600000'][-2][2])
+
+class LegacyStrategy(BaseStrategy):
+    """只实现两参数 scan 的旧式策略（面板扫描时逐股适配）"""
+    name = 'legacy'
+    description = '测试用'
+    lookback = 30
+    history_columns = ['close']
+    
+    def scan(self, history, current):
+        if current.get('change_percent', 0) > 1 and history['close'].iloc[-1] > history['close'].iloc[0]:
+            return {'type': '上涨', 'close': float(history['close'].iloc[-1])}
+        return None
+
+class StatefulMACD(MACDCrossStrategy):
+    """macd_cross 改用递推状态指标"""
+    stateful = True
+
+@pytest.fixture
+def market(db):
+    """300 只股票 120 个交易日的行情入库，实时行情在最后一根 K 线之后随机涨跌"""
+    dataset = generate_dataset(300, 120)
+    rng = np.random.default_rng(7)
+    stocks, frames, prices = [], [], {}
+    
+    for symbol, bars in dataset['klines'].items():
+        code = symbol[2:]
+        frame = pd.DataFrame(bars, columns=['date', 'open', 'close', 'high', 'low', 'volume'])
+        frame['code'] = code
+        frames.append(frame)
+        stocks.append({'code': code, 'name': f'模拟{code}'})
+        
+        close = float(bars[-1][2])
+        change = float(rng.normal(1, 3))
+        prices[code] = {'code': code, 'name': f'模拟{code}', 'price': round(close * (1 + change / 100), 2),
+                        'change_percent': change, 'yesterday_close': close, 'volume': float(bars[-1][5])}
+    
+    db.save_stocks(stocks)
+    db.save_history_frame(pd.concat(frames, ignore_index=True))
+    del prices[stocks[-1]['code']]  # 缺少实时行情的股票按价格 0 处理
+    
+    return stocks, prices
+
+@pytest.mark.parametrize('indicators', [True, False])
+def test_panel_scan_matches_per_stock_scan(market, monkeypatch, indicators):
+    """面板扫描（按策略需求加载的窄面板）与逐股扫描（全部列）的信号、顺序一致"""
+    stocks, prices = market
+    monkeypatch.setitem(scanner.CONFIG, 'indicators', indicators)
+    strategies = dict(PluginRegistry(cache_path=None).load(verbose=False),
+                      legacy=LegacyStrategy(), stateful_macd=StatefulMACD())
+    codes = [s['code'] for s in stocks]
+    
+    days, columns = history_requirements(strategies.values(), scanner.CONFIG['history_days'], indicators)
+    narrow = scanner.load_history_panel(codes, days, columns)
+    wide = scanner.load_history_panel(codes, days)
+    assert set(columns) < set(wide.fields)
+    
+    panel_results = scanner.scan_panel(strategies, narrow, stocks, prices)
+    stock_results = scanner.scan_stocks(strategies, wide, stocks, prices, progress=False)
+    
+    assert panel_results == stock_results
+    assert sum(len(r) > 0 for r in panel_results.values()) >= 4
+
+def test_run_scan_modes_agree(replay_market, monkeypatch):
+    """预筛、面板扫描、多进程扫描只改变执行方式，不改变扫描结果"""
+    monkeypatch.setitem(scanner.CONFIG, 'enabled_strategies', sorted(PluginRegistry(cache_path=None).load(verbose=False)))
+    modes = [
+        dict(prefilter=False, panel_scan=False, scan_workers=1),
+        dict(prefilter=True, panel_scan=False, scan_workers=1),
+        dict(prefilter=True, panel_scan=True, scan_workers=1),
+        dict(prefilter=True, panel_scan=True, scan_workers=2),
+    ]
+    results = []
+    
+    for mode in modes:
+        for key, value in mode.items():
+            monkeypatch.setitem(scanner.CONFIG, key, value)
+        results.append(scanner.run_scan())
+    
+    assert all(r == results[0] for r in results[1:])
+    assert sum(len(r) for r in results[0].values()) > 0
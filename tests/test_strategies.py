@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+"""内置策略测试"""
+
+import pandas as pd
+import pytest
+
+from src.metrics import METRICS
+from src.panel import HistoryPanel
+from src.plugins import PluginRegistry
+from src.strategy_base import BaseStrategy
+from conftest import make_history
+
+STRATEGIES = PluginRegistry(cache_path=None).load(verbose=False)
+
+def quote_frame(codes, change_percent: float = 1.0) -> pd.DataFrame:
+    return pd.DataFrame({'price': 10.0, 'change_percent': change_percent, 'volume': 1e6},
+                        index=pd.Index(codes, name='code'))
+
+@pytest.mark.parametrize('name', sorted(STRATEGIES))
+def test_scan_errors_reach_metrics(name):
+    """scan() 内部异常不被策略吞掉，由扫描器记入运行报告的策略异常数"""
+    codes = ['600000', '600001']
+    frame = make_history(codes, days=70).set_index(['code', 'date'])
+    panel = HistoryPanel.from_frame(frame, None, ['open'])  # 缺少 close 列
+    
+    METRICS.reset()
+    mask, _ = BaseStrategy.scan_panel(STRATEGIES[name], panel, quote_frame(codes))
+    
+    assert not mask.any()
+    assert METRICS.errors['strategy'][name]['count'] == len(codes)